@@ -1,4 +1,20 @@
 from .model_manager import ModelManager
 from .ai_models import get_model_class
+from .messages import ChatMessage, Conversation, build_conversation
+from .response_cache import ResponseCache, get_response_cache, configure_response_cache
+from .single_flight import SingleFlight, get_single_flight
+from .config_registry import ConfigRegistry, ConfigSnapshot, get_config_registry
+from .model_index import ModelIndex, ModelRecord
+from .provider_limiter import ProviderLimiter, get_provider_limiter
+from .batch import BatchRequest, BatchResult, BatchRunner, LocalBatchBackend
+from .metrics import MetricsRegistry, get_metrics, configure_metrics
+from .tokens import TokenEstimator, get_token_estimator, get_token_estimator_stats
 
-__all__ = ['ModelManager', 'get_model_class']
\ No newline at end of file
+__all__ = ['ModelManager', 'get_model_class', 'ChatMessage', 'Conversation', 'build_conversation',
+           'ResponseCache', 'get_response_cache', 'configure_response_cache',
+           'SingleFlight', 'get_single_flight',
+           'ConfigRegistry', 'ConfigSnapshot', 'get_config_registry', 'ModelIndex', 'ModelRecord',
+           'ProviderLimiter', 'get_provider_limiter',
+           'BatchRequest', 'BatchResult', 'BatchRunner', 'LocalBatchBackend',
+           'MetricsRegistry', 'get_metrics', 'configure_metrics',
+           'TokenEstimator', 'get_token_estimator', 'get_token_estimator_stats']
@@ -1,9 +1,17 @@
 # ai_toolkit/ai_models.py
 import os
+import time
 import logging
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Union, List, Optional, Callable, Type
+from typing import Dict, Any, Union, List, Optional, Callable, Type, Iterator
+from .messages import (
+    ChatMessage, Conversation, build_conversation, message_text,
+    to_openai_messages, to_anthropic_messages, to_gemini_contents
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -12,6 +20,10 @@ logger = logging.getLogger(__name__)
 class AIModel(ABC):
     """Base abstract class for all AI models"""
     
+    # Provider batch API that accepts this model's build_request bodies ('openai',
+    # 'anthropic'), or None when batches must run through the local backend
+    batch_api = None
+    
     def __init__(self, model_config: Dict[str, Any]):
         """
         Initialize the AI model with configuration.
@@ -21,13 +33,27 @@ class AIModel(ABC):
         """
         self.model_config = model_config
         
+        # Token usage reported by the provider for the most recent request, kept per
+        # thread because one instance may serve concurrent requests
+        self._usage_local = threading.local()
+        self.last_usage = None
+    
+    @property
+    def last_usage(self) -> Optional[Dict[str, Any]]:
+        """Usage of the most recent request made by the calling thread"""
+        return getattr(self._usage_local, 'usage', None)
+    
+    @last_usage.setter
+    def last_usage(self, usage: Optional[Dict[str, Any]]):
+        self._usage_local.usage = usage
+        
     @abstractmethod
-    def generate_content(self, prompt: Union[str, Dict, List]) -> str:
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
         """
         Generate content using the model.
         
         Args:
-            prompt (Union[str, Dict, List]): Prompt for content generation
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
             
         Returns:
             str: Generated content
@@ -55,6 +81,30 @@ class AIModel(ABC):
         
         return updated
     
+    def _openai_usage(self, response, latency_ms: float) -> Dict[str, Any]:
+        """
+        Convert the usage of an OpenAI-compatible chat completion.
+        
+        Args:
+            response: Chat completion response
+            latency_ms (float): Request duration in milliseconds
+            
+        Returns:
+            Dict[str, Any]: Token usage in the shape used by every model
+        """
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', 0) or 0
+        completion_details = getattr(usage, 'completion_tokens_details', None)
+        return {
+            'input_tokens': (getattr(usage, 'prompt_tokens', 0) or 0) - cached,
+            'output_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': cached,
+            'reasoning_tokens': getattr(completion_details, 'reasoning_tokens', 0) or 0,
+            'latency_ms': latency_ms
+        }
+    
     def _get_env_var(self, var_name: str) -> str:
         """
         Get environment variable with validation.
@@ -108,6 +158,8 @@ class AIModel(ABC):
 class GPTModel(AIModel):
     """OpenAI GPT model implementation"""
     
+    batch_api = 'openai'
+    
     def __init__(self, model_config: Dict[str, Any]):
         """
         Initialize the GPT model.
@@ -128,74 +180,27 @@ class GPTModel(AIModel):
         
         logger.info(f"Initialized GPT model: {model_config.get('model', 'unknown')}")
 
-    def generate_content(self, prompt: Union[str, Dict]) -> str:
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
         """
         Generate content using the GPT model.
         
         Args:
-            prompt (Union[str, Dict]): Prompt for content generation
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
             
         Returns:
             str: Generated content
         """
         try:
-            # Handle JSON template if provided
-            json_template = None
-            if isinstance(prompt, dict) and 'json_template' in prompt:
-                json_template = prompt.pop('json_template', None)
-            
-            # Format messages for OpenAI API
-            if isinstance(prompt, list):
-                # If prompt is a list of messages, ensure proper formatting
-                messages = self._format_messages_for_openai(prompt)
-                
-                response = self.client.chat.completions.create(
-                    model=self.model_config['model'],
-                    messages=messages,
-                    max_tokens=self.model_config['max_tokens'],
-                    temperature=self.model_config['temperature']
-                )
-                
-            # Handle different prompt formats
-            elif isinstance(prompt, dict) and "messages" in prompt:
-                # Use provided messages structure
-                messages = self._format_messages_for_openai(prompt["messages"])
-                
-                params = {
-                    "model": prompt.get("model", self.model_config['model']),
-                    "messages": messages,
-                    "max_tokens": self.model_config['max_tokens'],
-                    "temperature": self.model_config['temperature']
-                }
-                
-                # Add response format if specified
-                if "response_format" in prompt:
-                    params["response_format"] = prompt["response_format"]
-                
-                response = self.client.chat.completions.create(**params)
-            else:
-                # Create messages from string prompt
-                system_message = self.model_config.get('system_message', '')
-                messages = []
-                
-                if system_message:
-                    messages.append({"role": "system", "content": system_message})
-                
-                messages.append({
-                    "role": "user", 
-                    "content": [{"type": "text", "text": prompt}]
-                })
-                
-                response = self.client.chat.completions.create(
-                    model=self.model_config['model'],
-                    messages=messages,
-                    max_tokens=self.model_config['max_tokens'],
-                    temperature=self.model_config['temperature']
-                )
+            conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+            params = self.build_request(conversation)
             
+            started = time.perf_counter()
+            response = self.client.chat.completions.create(**params)
+            self.last_usage = self._openai_usage(response, (time.perf_counter() - started) * 1000)
             content = response.choices[0].message.content
             
             # Apply JSON template if provided
+            json_template = conversation.options.get('json_template')
             if json_template:
                 return self._format_json_response(content, json_template)
                 
@@ -205,22 +210,28 @@ class GPTModel(AIModel):
             logger.error(f"GPT model error: {str(e)}")
             raise
 
-    def _format_messages_for_openai(self, messages: List[Dict]) -> List[Dict]:
-        """Format messages for OpenAI API compliance"""
-        formatted_messages = []
-        
-        for msg in messages:
-            if msg["role"] == "user" and isinstance(msg["content"], str):
-                # Format user messages to have array content with type
-                formatted_messages.append({
-                    "role": msg["role"],
-                    "content": [{"type": "text", "text": msg["content"]}]
-                })
-            else:
-                # Leave other messages as they are
-                formatted_messages.append(msg)
+    def build_request(self, conversation: Conversation) -> Dict[str, Any]:
+        """
+        Build the Chat Completions request body for a conversation.
         
-        return formatted_messages
+        Args:
+            conversation (Conversation): Canonical conversation
+            
+        Returns:
+            Dict[str, Any]: Parameters for chat.completions.create
+        """
+        params = {
+            "model": conversation.options.get("model", self.model_config['model']),
+            "messages": to_openai_messages(conversation),
+            "max_tokens": self.model_config['max_tokens'],
+            "temperature": self.model_config['temperature']
+        }
+        
+        # Add response format if specified
+        if "response_format" in conversation.options:
+            params["response_format"] = conversation.options["response_format"]
+        
+        return params
 
 
 class XAIModel(AIModel):
@@ -249,74 +260,27 @@ class XAIModel(AIModel):
         
         logger.info(f"Initialized XAI model: {model_config.get('model', 'unknown')}")
 
-    def generate_content(self, prompt: Union[str, Dict, List]) -> str:
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
         """
         Generate content using the XAI model.
         
         Args:
-            prompt (Union[str, Dict, List]): Prompt for content generation
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
             
         Returns:
             str: Generated content
         """
         try:
-            # Handle JSON template if provided
-            json_template = None
-            if isinstance(prompt, dict) and 'json_template' in prompt:
-                json_template = prompt.pop('json_template', None)
-            
-            # Format messages for OpenAI API
-            if isinstance(prompt, list):
-                # If prompt is a list of messages, ensure proper formatting
-                messages = self._format_messages_for_openai(prompt)
-                
-                response = self.client.chat.completions.create(
-                    model=self.model_config['model'],
-                    messages=messages,
-                    max_tokens=self.model_config['max_tokens'],
-                    temperature=self.model_config['temperature']
-                )
-                
-            # Handle different prompt formats
-            elif isinstance(prompt, dict) and "messages" in prompt:
-                # Use provided messages structure
-                messages = self._format_messages_for_openai(prompt["messages"])
-                
-                params = {
-                    "model": prompt.get("model", self.model_config['model']),
-                    "messages": messages,
-                    "max_tokens": self.model_config['max_tokens'],
-                    "temperature": self.model_config['temperature']
-                }
-                
-                # Add response format if specified
-                if "response_format" in prompt:
-                    params["response_format"] = prompt["response_format"]
-                
-                response = self.client.chat.completions.create(**params)
-            else:
-                # Create messages from string prompt
-                system_message = self.model_config.get('system_message', '')
-                messages = []
-                
-                if system_message:
-                    messages.append({"role": "system", "content": system_message})
-                
-                messages.append({
-                    "role": "user", 
-                    "content": [{"type": "text", "text": prompt}]
-                })
-                
-                response = self.client.chat.completions.create(
-                    model=self.model_config['model'],
-                    messages=messages,
-                    max_tokens=self.model_config['max_tokens'],
-                    temperature=self.model_config['temperature']
-                )
+            conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+            params = self.build_request(conversation)
             
+            started = time.perf_counter()
+            response = self.client.chat.completions.create(**params)
+            self.last_usage = self._openai_usage(response, (time.perf_counter() - started) * 1000)
             content = response.choices[0].message.content
             
             # Apply JSON template if provided
+            json_template = conversation.options.get('json_template')
             if json_template:
                 return self._format_json_response(content, json_template)
                 
@@ -326,27 +290,35 @@ class XAIModel(AIModel):
             logger.error(f"XAI model error: {str(e)}")
             raise
 
-    def _format_messages_for_openai(self, messages: List[Dict]) -> List[Dict]:
-        """Format messages for OpenAI API compliance"""
-        formatted_messages = []
-        
-        for msg in messages:
-            if msg["role"] == "user" and isinstance(msg["content"], str):
-                # Format user messages to have array content with type
-                formatted_messages.append({
-                    "role": msg["role"],
-                    "content": [{"type": "text", "text": msg["content"]}]
-                })
-            else:
-                # Leave other messages as they are
-                formatted_messages.append(msg)
+    def build_request(self, conversation: Conversation) -> Dict[str, Any]:
+        """
+        Build the Chat Completions request body for a conversation.
         
-        return formatted_messages
+        Args:
+            conversation (Conversation): Canonical conversation
+            
+        Returns:
+            Dict[str, Any]: Parameters for chat.completions.create
+        """
+        params = {
+            "model": conversation.options.get("model", self.model_config['model']),
+            "messages": to_openai_messages(conversation),
+            "max_tokens": self.model_config['max_tokens'],
+            "temperature": self.model_config['temperature']
+        }
+        
+        # Add response format if specified
+        if "response_format" in conversation.options:
+            params["response_format"] = conversation.options["response_format"]
+        
+        return params
 
 
 class O3MiniModel(AIModel):
     """OpenAI O3Mini model implementation"""
     
+    batch_api = 'openai'
+    
     def __init__(self, model_config: Dict[str, Any]):
         """
         Initialize the O3Mini model.
@@ -367,85 +339,23 @@ class O3MiniModel(AIModel):
         
         logger.info(f"Initialized O3Mini model: {model_config.get('model', 'unknown')}")
 
-    def generate_content(self, prompt: Union[str, Dict]) -> str:
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
         """
         Generate content using the O3Mini model.
         
         Args:
-            prompt (Union[str, Dict]): Prompt for content generation
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
             
         Returns:
             str: Generated content
         """
         try:
-            # Handle JSON template if provided
-            json_template = None
-            if isinstance(prompt, dict) and 'json_template' in prompt:
-                json_template = prompt.pop('json_template', None)
-                
-            # Get system message from config
-            system_message = self.model_config.get('system_message', '')
+            conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+            params = self.build_request(conversation)
             
-            # Format messages for OpenAI API
-            if isinstance(prompt, list):
-                # If prompt is a list of messages, ensure proper formatting
-                messages = self._format_messages_for_openai(prompt)
-                
-                params = {
-                    "model": self.model_config['model'],
-                    "messages": messages,
-                    "max_completion_tokens": self.model_config.get('max_tokens', 4000)  # Use correct parameter
-                }
-                
-                # Add reasoning effort if specified in config
-                if "reasoning_effort" in self.model_config:
-                    params["reasoning_effort"] = self.model_config["reasoning_effort"]
-                    
-                response = self.client.chat.completions.create(**params)
-                
-            # Handle different prompt formats
-            elif isinstance(prompt, dict) and "messages" in prompt:
-                # Use the provided messages and any response_format
-                messages = self._format_messages_for_openai(prompt["messages"])
-                
-                params = {
-                    "model": self.model_config['model'],
-                    "messages": messages,
-                    "max_completion_tokens": self.model_config.get('max_tokens', 4000)  # Use correct parameter
-                }
-                
-                # Add response format if specified
-                if "response_format" in prompt:
-                    params["response_format"] = prompt["response_format"]
-                    
-                # Add reasoning effort if specified in config
-                if "reasoning_effort" in self.model_config:
-                    params["reasoning_effort"] = self.model_config["reasoning_effort"]
-                    
-                response = self.client.chat.completions.create(**params)
-            else:
-                # Wrap the prompt in a messages list
-                messages = []
-                
-                if system_message:
-                    messages.append({"role": "system", "content": system_message})
-                
-                messages.append({
-                    "role": "user", 
-                    "content": [{"type": "text", "text": prompt if isinstance(prompt, str) else prompt.get("text", "")}]
-                })
-                
-                params = {
-                    "model": self.model_config['model'],
-                    "messages": messages,
-                    "max_completion_tokens": self.model_config.get('max_tokens', 4000)  # Use correct parameter
-                }
-                
-                # Add reasoning effort if specified in config
-                if "reasoning_effort" in self.model_config:
-                    params["reasoning_effort"] = self.model_config["reasoning_effort"]
-                    
-                response = self.client.chat.completions.create(**params)
+            started = time.perf_counter()
+            response = self.client.chat.completions.create(**params)
+            self.last_usage = self._openai_usage(response, (time.perf_counter() - started) * 1000)
             
             # Extract content from response
             content = response.choices[0].message.content
@@ -455,6 +365,7 @@ class O3MiniModel(AIModel):
                 raise ValueError("Empty response from O3Mini model.")
                 
             # Apply JSON template if provided
+            json_template = conversation.options.get('json_template')
             if json_template:
                 return self._format_json_response(content, json_template)
                 
@@ -464,27 +375,38 @@ class O3MiniModel(AIModel):
             logger.error(f"O3Mini model error: {str(e)}")
             raise
 
-    def _format_messages_for_openai(self, messages: List[Dict]) -> List[Dict]:
-        """Format messages for OpenAI API compliance"""
-        formatted_messages = []
-        
-        for msg in messages:
-            if msg["role"] == "user" and isinstance(msg["content"], str):
-                # Format user messages to have array content with type
-                formatted_messages.append({
-                    "role": msg["role"],
-                    "content": [{"type": "text", "text": msg["content"]}]
-                })
-            else:
-                # Leave other messages as they are
-                formatted_messages.append(msg)
+    def build_request(self, conversation: Conversation) -> Dict[str, Any]:
+        """
+        Build the Chat Completions request body for a conversation.
         
-        return formatted_messages
+        Args:
+            conversation (Conversation): Canonical conversation
+            
+        Returns:
+            Dict[str, Any]: Parameters for chat.completions.create
+        """
+        params = {
+            "model": self.model_config['model'],
+            "messages": to_openai_messages(conversation),
+            "max_completion_tokens": self.model_config.get('max_tokens', 4000)  # Use correct parameter
+        }
+        
+        # Add response format if specified
+        if "response_format" in conversation.options:
+            params["response_format"] = conversation.options["response_format"]
+            
+        # Add reasoning effort if specified in config
+        if "reasoning_effort" in self.model_config:
+            params["reasoning_effort"] = self.model_config["reasoning_effort"]
+        
+        return params
 
 
 class ClaudeModel(AIModel):
     """Anthropic Claude model implementation"""
     
+    batch_api = 'anthropic'
+    
     def __init__(self, model_config: Dict[str, Any]):
         """
         Initialize the Claude model.
@@ -505,121 +427,22 @@ class ClaudeModel(AIModel):
         
         logger.info(f"Initialized Claude model: {model_config.get('model', 'unknown')}")
 
-    def generate_content(self, prompt: Union[str, Dict]) -> str:
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
         """
         Generate content using the Claude model.
         
         Args:
-            prompt (Union[str, Dict]): Prompt for content generation
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
             
         Returns:
             str: Generated content
         """
         try:
-            # Handle JSON template if provided
-            json_template = None
-            if isinstance(prompt, dict) and 'json_template' in prompt:
-                json_template = prompt.pop('json_template', None)
-            
-            # Modified to handle the message format properly for Claude
-            if isinstance(prompt, dict) and "messages" in prompt:
-                # Claude API doesn't accept content as an array with type
-                # Make sure content is a string for all messages
-                cleaned_messages = []
-                for msg in prompt["messages"]:
-                    if isinstance(msg["content"], list) and len(msg["content"]) > 0 and "text" in msg["content"][0]:
-                        # Convert OpenAI format to Claude format
-                        cleaned_messages.append({
-                            "role": msg["role"],
-                            "content": msg["content"][0]["text"]
-                        })
-                    else:
-                        cleaned_messages.append(msg)
-                
-                # Handle system message differently in Claude
-                system_message = None
-                filtered_messages = []
-                
-                for msg in cleaned_messages:
-                    if msg["role"] == "system":
-                        system_message = msg["content"]
-                    else:
-                        filtered_messages.append(msg)
-                
-                # Create parameters for Claude API
-                params = {
-                    "model": prompt.get("model", self.model_config['model']),
-                    "max_tokens": self.model_config['max_tokens'],
-                    "temperature": self.model_config['temperature'],
-                    "messages": filtered_messages
-                }
-                
-                # Add system message if available
-                if system_message:
-                    params["system"] = system_message
-                    
-                response = self.client.messages.create(**params)
-                content = response.content[0].text
-            
-            elif isinstance(prompt, list):
-                # Handle list of messages
-                system_message = None
-                filtered_messages = []
-                
-                for msg in prompt:
-                    if isinstance(msg["content"], list) and len(msg["content"]) > 0 and "text" in msg["content"][0]:
-                        # Convert content array to string
-                        if msg["role"] == "system":
-                            system_message = msg["content"][0]["text"]
-                        else:
-                            filtered_messages.append({
-                                "role": msg["role"],
-                                "content": msg["content"][0]["text"]
-                            })
-                    else:
-                        if msg["role"] == "system":
-                            system_message = msg["content"]
-                        else:
-                            filtered_messages.append(msg)
-                
-                params = {
-                    "model": self.model_config['model'],
-                    "max_tokens": self.model_config['max_tokens'],
-                    "temperature": self.model_config['temperature'],
-                    "messages": filtered_messages
-                }
-                
-                if system_message:
-                    params["system"] = system_message
-                    
-                response = self.client.messages.create(**params)
-                content = response.content[0].text
-            
-            else:
-                # Handle string prompt
-                system_message = self.model_config.get('system_message', '')
-                
-                # Create message with or without system message
-                if system_message:
-                    response = self.client.messages.create(
-                        model=self.model_config['model'],
-                        max_tokens=self.model_config['max_tokens'],
-                        temperature=self.model_config['temperature'],
-                        system=system_message,
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                else:
-                    # No system message
-                    response = self.client.messages.create(
-                        model=self.model_config['model'],
-                        max_tokens=self.model_config['max_tokens'],
-                        temperature=self.model_config['temperature'],
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                
-                content = response.content[0].text
+            conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+            content = self._create_message(self.build_request(conversation))
             
             # Apply JSON template if provided
+            json_template = conversation.options.get('json_template')
             if json_template:
                 return self._format_json_response(content, json_template)
                 
@@ -629,10 +452,117 @@ class ClaudeModel(AIModel):
             logger.error(f"Claude model error: {str(e)}")
             raise
 
+    def build_request(self, conversation: Conversation) -> Dict[str, Any]:
+        """
+        Build the Messages API request body for a conversation.
+        
+        Args:
+            conversation (Conversation): Canonical conversation
+            
+        Returns:
+            Dict[str, Any]: Parameters for messages.create, without cache breakpoints
+        """
+        system_message, messages = to_anthropic_messages(conversation)
+        
+        # Create parameters for Claude API
+        params = {
+            "model": conversation.options.get("model", self.model_config['model']),
+            "max_tokens": self.model_config['max_tokens'],
+            "temperature": self.model_config['temperature'],
+            "messages": messages
+        }
+        
+        # Claude takes the system message as a separate parameter
+        if system_message:
+            params["system"] = system_message
+        
+        return params
+
+    def _create_message(self, params: Dict[str, Any]) -> str:
+        """
+        Send a Messages API request with prompt-cache breakpoints and record usage.
+        
+        Args:
+            params (Dict[str, Any]): Parameters for messages.create
+            
+        Returns:
+            str: Generated content
+        """
+        if self.model_config.get('prompt_caching', True):
+            params = self._apply_cache_breakpoints(params)
+        
+        started = time.perf_counter()
+        response = self.client.messages.create(**params)
+        latency_ms = (time.perf_counter() - started) * 1000
+        
+        usage = getattr(response, 'usage', None)
+        self.last_usage = {
+            'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+            'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+            'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+            'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+            'reasoning_tokens': 0,
+            'latency_ms': latency_ms
+        }
+        
+        return response.content[0].text
+
+    def _apply_cache_breakpoints(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Mark the system prompt and the stable conversation prefix as cacheable.
+        
+        Breakpoints go on the system prompt, on the message before the newest turn
+        (the prefix every later request repeats) and on the newest message, so the
+        next request can read what this one writes. Prefixes below the provider's
+        minimum cacheable length are simply not cached by the API.
+        
+        Args:
+            params (Dict[str, Any]): Parameters for messages.create
+            
+        Returns:
+            Dict[str, Any]: New parameters; the caller's messages are not modified
+        """
+        cache_control = {"type": "ephemeral"}
+        params = dict(params)
+        
+        system = params.get("system")
+        if isinstance(system, str) and system:
+            params["system"] = [{"type": "text", "text": system, "cache_control": cache_control}]
+        
+        messages = list(params.get("messages", []))
+        for index in (len(messages) - 2, len(messages) - 1):
+            if index < 0:
+                continue
+            message = messages[index]
+            content = message.get("content")
+            if isinstance(content, str):
+                if not content:
+                    continue
+                blocks = [{"type": "text", "text": content, "cache_control": cache_control}]
+            elif isinstance(content, list) and content and isinstance(content[-1], dict):
+                blocks = list(content)
+                blocks[-1] = dict(blocks[-1], cache_control=cache_control)
+            else:
+                continue
+            messages[index] = dict(message, content=blocks)
+        params["messages"] = messages
+        
+        return params
+
 
 class GeminiModel(AIModel):
     """Google Gemini model implementation"""
     
+    # google.generativeai keeps its client configuration in process-global state,
+    # so configuration and the objects built on it are shared by all instances
+    _lock = threading.Lock()
+    _configured_api_key = None
+    # (model, system instruction) -> GenerativeModel, least recently used first
+    _models = OrderedDict()
+    _max_models = 32
+    # (model, system instruction) -> list of cached prefix entries
+    _context_caches = {}
+    
     def __init__(self, model_config: Dict[str, Any]):
         """
         Initialize the Gemini model.
@@ -642,142 +572,91 @@ class GeminiModel(AIModel):
         """
         super().__init__(model_config)
         
-        # Import Google GenerativeAI library
-        import google.generativeai as genai
-        
         # Get API key from environment
-        api_key = self._get_env_var('GENAI_API_KEY')
+        self._configure(self._get_env_var('GENAI_API_KEY'))
         
-        # Configure Google GenerativeAI
-        genai.configure(api_key=api_key)
+        logger.info(f"Initialized Gemini model: {model_config.get('model', 'unknown')}")
+
+    @classmethod
+    def _configure(cls, api_key: str):
+        """
+        Configure Google GenerativeAI once per API key.
         
-        # Initialize Gemini model
-        self.model = genai.GenerativeModel(model_config['model'])
+        Args:
+            api_key (str): Google API key
+        """
+        import google.generativeai as genai
         
-        logger.info(f"Initialized Gemini model: {model_config.get('model', 'unknown')}")
+        with cls._lock:
+            if cls._configured_api_key == api_key:
+                return
+            genai.configure(api_key=api_key)
+            cls._configured_api_key = api_key
+            # Models and caches built with the previous client are no longer usable
+            cls._models.clear()
+            cls._context_caches.clear()
+
+    @classmethod
+    def _get_model(cls, model_name: str, system: str):
+        """
+        Get a shared GenerativeModel for a model and system instruction.
+        
+        Args:
+            model_name (str): Gemini model name
+            system (str): System instruction, or '' for none
+            
+        Returns:
+            GenerativeModel: Cached model object
+        """
+        import google.generativeai as genai
+        
+        key = (model_name, system)
+        with cls._lock:
+            model = cls._models.get(key)
+            if model is not None:
+                cls._models.move_to_end(key)
+                return model
+            model = genai.GenerativeModel(model_name, system_instruction=system or None)
+            cls._models[key] = model
+            while len(cls._models) > cls._max_models:
+                cls._models.popitem(last=False)
+            return model
 
-    def generate_content(self, prompt: Union[str, List]) -> str:
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
         """
         Generate content using the Gemini model.
         
         Args:
-            prompt (Union[str, List]): Prompt for content generation
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
             
         Returns:
             str: Generated content
         """
         try:
-            # Handle JSON template if provided
-            json_template = None
-            if isinstance(prompt, dict) and 'json_template' in prompt:
-                json_template = prompt.pop('json_template', None)
-            
-            # Get system message from config
-            system_message = self.model_config.get('system_message', '')
-            
-            # Gemini doesn't support message roles like OpenAI and Claude
-            # We need to convert to a format Gemini understands
-            if isinstance(prompt, list) or (isinstance(prompt, dict) and "messages" in prompt):
-                messages = prompt if isinstance(prompt, list) else prompt.get("messages", [])
-                
-                # Convert message array to a single string for Gemini
-                formatted_prompt = ""
-                
-                # Find system message from messages or use from config
-                found_system_message = None
-                for msg in messages:
-                    if msg.get("role") == "system":
-                        content = msg.get("content", "")
-                        # Handle OpenAI format
-                        if isinstance(content, list) and len(content) > 0 and "text" in content[0]:
-                            content = content[0]["text"]
-                        found_system_message = content
-                        break
-                
-                # Use found system message or fallback to config
-                active_system_message = found_system_message or system_message
-                
-                # 시스템 메시지를 더 효과적으로 전달하기 위한 방식 변경
-                if active_system_message:
-                    # 시스템 메시지를 더 명확하게 맨 앞에 배치
-                    formatted_prompt += f"System Instructions: {active_system_message}\n\n"
-                    # 그리고 사용자에게도 지시
-                    formatted_prompt += f"You MUST follow the above system instructions in all your responses.\n\n"
-                
-                # Process each message
-                for msg in messages:
-                    role = msg.get("role", "")
-                    # 시스템 메시지는 이미 처리했으므로 건너뛰기
-                    if role == "system":
-                        continue
-                        
-                    content = msg.get("content", "")
-                    
-                    # If content is an array (OpenAI format), extract text
-                    if isinstance(content, list) and len(content) > 0:
-                        if "text" in content[0]:
-                            content = content[0]["text"]
-                    
-                    # Skip empty messages
-                    if not content:
-                        continue
-                        
-                    # Add role prefix
-                    if role == "user":
-                        formatted_prompt += f"User: {content}\n\n"
-                    elif role == "assistant":
-                        formatted_prompt += f"Assistant: {content}\n\n"
-                    else:
-                        formatted_prompt += f"{role.capitalize()}: {content}\n\n"
-                
-                # Add a final assistant prompt
-                formatted_prompt += "Assistant: "
-                
-                # Prepare generation config
-                generation_config = {
-                    "temperature": self.model_config['temperature'],
-                    "top_p": self.model_config.get('top_p', 1),
-                    "top_k": self.model_config.get('top_k', 1),
-                    "max_output_tokens": self.model_config['max_tokens'],
-                }
-                
-                # Generate content
-                response = self.model.generate_content(formatted_prompt, generation_config=generation_config)
-                
-            elif isinstance(prompt, str):
-                # Add system message if available for string prompts
-                full_prompt = ""
-                if system_message:
-                    full_prompt += f"System Instructions: {system_message}\n\n"
-                    full_prompt += f"You MUST follow the above system instructions in all your responses.\n\n"
-                
-                full_prompt += f"User: {prompt}\n\nAssistant: "
-                
-                # Prepare generation config
-                generation_config = {
-                    "temperature": self.model_config['temperature'],
-                    "top_p": self.model_config.get('top_p', 1),
-                    "top_k": self.model_config.get('top_k', 1),
-                    "max_output_tokens": self.model_config['max_tokens'],
-                }
-                
-                # Generate content
-                response = self.model.generate_content(full_prompt, generation_config=generation_config)
-            else:
-                # Direct use of provided content (e.g., multimodal)
-                generation_config = {
-                    "temperature": self.model_config['temperature'],
-                    "top_p": self.model_config.get('top_p', 1),
-                    "top_k": self.model_config.get('top_k', 1),
-                    "max_output_tokens": self.model_config['max_tokens'],
-                }
-                
-                response = self.model.generate_content(prompt, generation_config=generation_config)
-            
-            # Extract text from response
-            content = response.text
+            model_name = self.model_config['model']
+            generation_config = {
+                "temperature": self.model_config['temperature'],
+                "top_p": self.model_config.get('top_p', 1),
+                "top_k": self.model_config.get('top_k', 1),
+                "max_output_tokens": self.model_config['max_tokens'],
+            }
+            
+            # Direct use of provided content parts (e.g., multimodal)
+            if isinstance(prompt, list) and not all(isinstance(p, (dict, ChatMessage)) for p in prompt):
+                model = self._get_model(model_name, self.model_config.get('system_message', ''))
+                return self._send(model, prompt, generation_config)
+            
+            conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+            system, contents = to_gemini_contents(conversation)
+            
+            content = None
+            if self.model_config.get('context_cache', False):
+                content = self._generate_with_context_cache(model_name, system, contents, generation_config)
+            if content is None:
+                content = self._send(self._get_model(model_name, system), contents, generation_config)
             
             # Apply JSON template if provided
+            json_template = conversation.options.get('json_template')
             if json_template:
                 return self._format_json_response(content, json_template)
                 
@@ -787,8 +666,212 @@ class GeminiModel(AIModel):
             logger.error(f"Gemini model error: {str(e)}")
             raise
 
+    def _send(self, model, contents: Any, generation_config: Dict[str, Any]) -> str:
+        """
+        Call generate_content and record usage.
+        
+        Args:
+            model (GenerativeModel): Model to call
+            contents (Any): Structured contents or raw content parts
+            generation_config (Dict[str, Any]): Sampling parameters
+            
+        Returns:
+            str: Generated content
+        """
+        started = time.perf_counter()
+        response = model.generate_content(
+            contents,
+            generation_config=generation_config,
+            safety_settings=self.model_config.get('safety_settings')
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+        
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+        self.last_usage = {
+            'input_tokens': prompt_tokens - cached_tokens,
+            'output_tokens': getattr(usage, 'candidates_token_count', 0) or 0,
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': cached_tokens,
+            'reasoning_tokens': getattr(usage, 'thoughts_token_count', 0) or 0,
+            'latency_ms': latency_ms
+        }
+        
+        return response.text
+
+    def _generate_with_context_cache(self, model_name: str, system: str, contents: List[Dict[str, Any]],
+                                     generation_config: Dict[str, Any]) -> Optional[str]:
+        """
+        Generate with the stable conversation prefix served from a Gemini context cache.
+        
+        Everything before the newest turn is the prefix later requests repeat. The
+        longest live cache matching the start of the conversation is reused; a new
+        one is created once the uncached part reaches context_cache_min_chars, so a
+        growing chat refreshes its cache occasionally rather than on every turn.
+        
+        Args:
+            model_name (str): Gemini model name
+            system (str): System instruction
+            contents (List[Dict[str, Any]]): Structured contents
+            generation_config (Dict[str, Any]): Sampling parameters
+            
+        Returns:
+            Optional[str]: Generated content, or None if no context cache applies
+        """
+        import google.generativeai as genai
+        from google.generativeai import caching
+        
+        min_chars = self.model_config.get('context_cache_min_chars', 131072)
+        ttl = self.model_config.get('context_cache_ttl', 600)
+        prefix_len = len(contents) - 1
+        if prefix_len < 1:
+            return None
+        
+        key = (model_name, system)
+        digests = _prefix_digests(system, contents[:prefix_len])
+        now = time.time()
+        
+        with self._lock:
+            entries = [e for e in self._context_caches.get(key, []) if e['expires_at'] > now]
+            self._context_caches[key] = entries
+            entry = max(
+                (e for e in entries if e['length'] <= prefix_len and digests[e['length'] - 1] == e['digest']),
+                key=lambda e: e['length'],
+                default=None
+            )
+        
+        cached_length = entry['length'] if entry else 0
+        if sum(_contents_chars(c) for c in contents[cached_length:prefix_len]) >= min_chars:
+            try:
+                cached = caching.CachedContent.create(
+                    model=model_name,
+                    system_instruction=system or None,
+                    contents=contents[:prefix_len],
+                    ttl=ttl
+                )
+                entry = {
+                    'length': prefix_len,
+                    'digest': digests[prefix_len - 1],
+                    'model': genai.GenerativeModel.from_cached_content(cached),
+                    # Stop using the cache slightly before the server expires it
+                    'expires_at': now + ttl - 30
+                }
+                with self._lock:
+                    entries = self._context_caches.setdefault(key, [])
+                    entries.append(entry)
+                    # Older prefixes are superseded and expire on the server
+                    del entries[:-2]
+                logger.info(f"Created Gemini context cache for {model_name} covering {prefix_len} turns")
+            except Exception as e:
+                logger.warning(f"Gemini context cache unavailable for {model_name}: {str(e)}")
+        
+        if entry is None:
+            return None
+        return self._send(entry['model'], contents[entry['length']:], generation_config)
+
+
+class MockModel(AIModel):
+    """Local mock model for load tests and offline development; makes no network calls"""
+    
+    def __init__(self, model_config: Dict[str, Any]):
+        """
+        Initialize the mock model.
+        
+        Latency, throughput, response text and failure injection are set by the
+        'mock' section of the model configuration (see ai_toolkit.mock_provider).
+        
+        Args:
+            model_config (Dict[str, Any]): Model configuration
+        """
+        super().__init__(model_config)
+        
+        from .mock_provider import MockEngine
+        self.engine = MockEngine(model_config.get('mock'))
+        
+        logger.info(f"Initialized mock model: {model_config.get('model', 'unknown')}")
+
+    def generate_content(self, prompt: Union[str, Dict, List, Conversation]) -> str:
+        """
+        Generate content using the mock model.
+        
+        Args:
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
+            
+        Returns:
+            str: Generated content
+        """
+        conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+        
+        started = time.perf_counter()
+        content = ''.join(self.engine.complete(conversation, self.model_config.get('model', 'mock'),
+                                               self.model_config.get('max_tokens')))
+        self._record_usage(conversation, content, started)
+        
+        # Apply JSON template if provided
+        json_template = conversation.options.get('json_template')
+        if json_template:
+            return self._format_json_response(content, json_template)
+            
+        return content
+
+    def stream_content(self, prompt: Union[str, Dict, List, Conversation]) -> Iterator[str]:
+        """
+        Generate content token by token at the configured speed.
+        
+        Args:
+            prompt (Union[str, Dict, List, Conversation]): Prompt for content generation
+            
+        Yields:
+            str: Next chunk of the response
+        """
+        conversation = build_conversation(prompt, self.model_config.get('system_message', ''))
+        
+        started = time.perf_counter()
+        ttft_ms = None
+        chunks = []
+        for chunk in self.engine.stream(conversation, self.model_config.get('model', 'mock'),
+                                        self.model_config.get('max_tokens')):
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            chunks.append(chunk)
+            yield chunk
+        self._record_usage(conversation, ''.join(chunks), started)
+        self.last_usage['ttft_ms'] = ttft_ms
+
+    def _record_usage(self, conversation: Conversation, content: str, started: float):
+        from .mock_provider import estimate_tokens
+        
+        input_tokens = estimate_tokens(conversation.system) + sum(
+            estimate_tokens(message_text(message.content)) for message in conversation.messages
+        )
+        self.last_usage = {
+            'input_tokens': input_tokens,
+            'output_tokens': estimate_tokens(content),
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': 0,
+            'reasoning_tokens': 0,
+            'latency_ms': (time.perf_counter() - started) * 1000
+        }
+
+
+def _contents_chars(content: Dict[str, Any]) -> int:
+    """Approximate size of a Gemini content entry in characters"""
+    return sum(len(p) if isinstance(p, str) else len(p.get('data', b'')) for p in content['parts'])
+
+
+def _prefix_digests(system: str, contents: List[Dict[str, Any]]) -> List[str]:
+    """Running digests identifying each prefix of the contents"""
+    h = hashlib.sha256(system.encode('utf-8'))
+    digests = []
+    for content in contents:
+        h.update(content['role'].encode('utf-8'))
+        for part in content['parts']:
+            h.update(part.encode('utf-8') if isinstance(part, str) else part.get('data', b''))
+        digests.append(h.copy().hexdigest())
+    return digests
+
 
-# Model factory function
 def get_model_class(model_type: str, provider_mapping=None) -> Optional[Type[AIModel]]:
     """
     Get the appropriate model class for a given model type.
@@ -811,7 +894,8 @@ def get_model_class(model_type: str, provider_mapping=None) -> Optional[Type[AIM
         'openai': GPTModel,      # Both GPT and o3-mini are handled by OpenAI
         'anthropic': ClaudeModel,
         'google': GeminiModel,
-        'xai': XAIModel
+        'xai': XAIModel,
+        'mock': MockModel
     }
     
     # Special case for o3-mini models - they use the O3MiniModel class
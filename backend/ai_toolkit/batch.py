@@ -0,0 +1,615 @@
+# ai_toolkit/batch.py
+import os
+import io
+import json
+import time
+import uuid
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple, Callable
+
+from .messages import build_conversation
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Batch states reported by backends
+BATCH_RUNNING = 'running'
+BATCH_COMPLETED = 'completed'
+BATCH_FAILED = 'failed'
+
+DEFAULT_BATCH_SETTINGS = {
+    # 'provider' uses the provider batch API where the model supports one and the
+    # local backend otherwise; 'local' always uses the local backend
+    'backend': 'provider',
+    'directory': './data/batches',
+    'poll_interval': 30,
+    'timeout': 86400
+}
+
+# Upper bound on waits for local batches; they signal completion, so this only
+# bounds how long a cancellation through stop_event takes to be noticed
+LOCAL_POLL_INTERVAL = 0.5
+
+
+class BatchRequest(NamedTuple):
+    """One generation request of a batch"""
+
+    # Caller-chosen identifier used to match the result; unique within a run
+    custom_id: str
+    model_type: str
+    # String prompt, message list or payload dict, as accepted by generate_content
+    prompt: Any
+    # Optional temperature / max_tokens overrides
+    parameters: Optional[Dict[str, Any]] = None
+
+
+class BatchResult(NamedTuple):
+    """Outcome of one batch request"""
+
+    custom_id: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+
+
+class BatchSubmission(NamedTuple):
+    """A batch job submitted to one backend"""
+
+    backend: 'BatchBackend'
+    batch_id: str
+    custom_ids: Tuple[str, ...]
+
+
+class BatchBackend(ABC):
+    """Base class for services that run batches of generation requests"""
+
+    name = ''
+
+    @abstractmethod
+    def submit(self, entries: List[Tuple[BatchRequest, Any]]) -> str:
+        """
+        Submit requests as one batch job.
+
+        Args:
+            entries (List[Tuple[BatchRequest, Any]]): Requests with the model instance
+                configured for each of them (None for the local backend)
+
+        Returns:
+            str: Batch ID
+        """
+        pass
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> str:
+        """
+        Get the state of a batch job.
+
+        Args:
+            batch_id (str): Batch ID
+
+        Returns:
+            str: BATCH_RUNNING, BATCH_COMPLETED or BATCH_FAILED
+        """
+        pass
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        """
+        Get the results of a completed batch job.
+
+        Args:
+            batch_id (str): Batch ID
+
+        Returns:
+            Dict[str, BatchResult]: Results by custom ID
+        """
+        pass
+
+    def cancel(self, batch_id: str):
+        """
+        Cancel a batch job; requests already processed may still be billed.
+
+        Args:
+            batch_id (str): Batch ID
+        """
+        pass
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API: a JSONL file of Chat Completions requests processed within 24 hours"""
+
+    name = 'openai'
+
+    def __init__(self, client):
+        """
+        Initialize the backend.
+
+        Args:
+            client: OpenAI client
+        """
+        self.client = client
+
+    def submit(self, entries: List[Tuple[BatchRequest, Any]]) -> str:
+        lines = []
+        for request, model in entries:
+            conversation = build_conversation(request.prompt, model.model_config.get('system_message', ''))
+            lines.append(json.dumps({
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": model.build_request(conversation)
+            }, ensure_ascii=False))
+
+        data = ("\n".join(lines) + "\n").encode('utf-8')
+        input_file = self.client.files.create(file=("batch.jsonl", io.BytesIO(data)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        status = self.client.batches.retrieve(batch_id).status
+        if status == 'completed':
+            return BATCH_COMPLETED
+        if status in ('failed', 'expired', 'cancelled'):
+            return BATCH_FAILED
+        return BATCH_RUNNING
+
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    result = self._parse_line(json.loads(line))
+                    results[result.custom_id] = result
+        return results
+
+    def cancel(self, batch_id: str):
+        self.client.batches.cancel(batch_id)
+
+    def _parse_line(self, line: Dict[str, Any]) -> BatchResult:
+        """Convert one output file line into a result"""
+        custom_id = line.get("custom_id")
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or body.get("error") or {}
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            return BatchResult(custom_id, error=message or f"HTTP {response.get('status_code')}")
+
+        usage = body.get("usage") or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        return BatchResult(
+            custom_id,
+            content=body["choices"][0]["message"]["content"],
+            usage={
+                'input_tokens': (usage.get("prompt_tokens", 0) or 0) - cached,
+                'output_tokens': usage.get("completion_tokens", 0) or 0,
+                'cache_creation_input_tokens': 0,
+                'cache_read_input_tokens': cached,
+                'reasoning_tokens': (usage.get("completion_tokens_details") or {}).get("reasoning_tokens", 0) or 0
+            }
+        )
+
+
+class AnthropicBatchBackend(BatchBackend):
+    """Anthropic Message Batches API"""
+
+    name = 'anthropic'
+
+    def __init__(self, client):
+        """
+        Initialize the backend.
+
+        Args:
+            client: Anthropic client
+        """
+        self.client = client
+
+    def submit(self, entries: List[Tuple[BatchRequest, Any]]) -> str:
+        requests = []
+        for request, model in entries:
+            conversation = build_conversation(request.prompt, model.model_config.get('system_message', ''))
+            params = model.build_request(conversation)
+            # Batched requests can share prompt cache entries like interactive ones
+            if model.model_config.get('prompt_caching', True):
+                params = model._apply_cache_breakpoints(params)
+            requests.append({"custom_id": request.custom_id, "params": params})
+
+        return self.client.messages.batches.create(requests=requests).id
+
+    def poll(self, batch_id: str) -> str:
+        status = self.client.messages.batches.retrieve(batch_id).processing_status
+        return BATCH_COMPLETED if status == 'ended' else BATCH_RUNNING
+
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type != 'succeeded':
+                error = getattr(getattr(result, 'error', None), 'error', None)
+                message = getattr(error, 'message', None) or result.type
+                results[entry.custom_id] = BatchResult(entry.custom_id, error=message)
+                continue
+
+            usage = result.message.usage
+            results[entry.custom_id] = BatchResult(
+                entry.custom_id,
+                content=result.message.content[0].text,
+                usage={
+                    'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+                    'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+                    'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+                    'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+                    'reasoning_tokens': 0
+                }
+            )
+        return results
+
+    def cancel(self, batch_id: str):
+        self.client.messages.batches.cancel(batch_id)
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for provider batch APIs.
+
+    Each batch is a directory holding requests.jsonl, results.jsonl and
+    status.json. Requests are processed in a background thread through the
+    regular interactive path, so batches work for every provider and can be
+    exercised offline. Processing resumes from results.jsonl when a batch is
+    polled after a restart.
+    """
+
+    name = 'local'
+
+    def __init__(self, directory: str, processor: Optional[Callable[[BatchRequest], Tuple[str, Any]]] = None):
+        """
+        Initialize the backend.
+
+        Args:
+            directory (str): Directory holding one subdirectory per batch
+            processor (Optional[Callable], optional): Function turning a request into
+                (content, usage). Defaults to generating through a ModelManager.
+        """
+        self.directory = directory
+        self.processor = processor or _generate_with_model_manager
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._finished = threading.Condition()
+        self.finished_count = 0  # Batches whose worker has stopped, completed or not
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, entries: List[Tuple[BatchRequest, Any]]) -> str:
+        batch_id = f"local_{uuid.uuid4().hex}"
+        batch_dir = os.path.join(self.directory, batch_id)
+        os.makedirs(batch_dir)
+
+        with open(os.path.join(batch_dir, 'requests.jsonl'), 'w', encoding='utf-8') as f:
+            for request, _ in entries:
+                f.write(json.dumps({
+                    "custom_id": request.custom_id,
+                    "model_type": request.model_type,
+                    "prompt": _prompt_to_json(request.prompt),
+                    "parameters": request.parameters or {}
+                }, ensure_ascii=False) + "\n")
+        self._write_status(batch_id, {
+            "status": BATCH_RUNNING,
+            "request_count": len(entries),
+            "created_at": datetime.now().isoformat()
+        })
+
+        self._start_worker(batch_id)
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        status = self._read_status(batch_id).get("status", BATCH_FAILED)
+        if status == BATCH_RUNNING:
+            # Resume batches left unfinished by a previous process
+            self._start_worker(batch_id)
+        return status
+
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        return {
+            custom_id: BatchResult(custom_id, line.get("content"), line.get("error"), line.get("usage"))
+            for custom_id, line in self._read_results(batch_id).items()
+        }
+
+    def cancel(self, batch_id: str):
+        status = self._read_status(batch_id)
+        if status.get("status") == BATCH_RUNNING:
+            status["status"] = BATCH_FAILED
+            status["cancelled_at"] = datetime.now().isoformat()
+            self._write_status(batch_id, status)
+
+    def _start_worker(self, batch_id: str):
+        with self._lock:
+            worker = self._workers.get(batch_id)
+            if worker is not None and worker.is_alive():
+                return
+            worker = threading.Thread(target=self._run_worker, args=(batch_id,), name=f"batch-{batch_id}", daemon=True)
+            self._workers[batch_id] = worker
+            worker.start()
+
+    def wait_finished(self, seen: int, timeout: float) -> int:
+        """
+        Wait until a worker stops after the first `seen` had, or until the timeout.
+
+        Args:
+            seen (int): Value of finished_count read before the batches were last polled
+            timeout (float): Maximum wait in seconds
+
+        Returns:
+            int: Current finished_count
+        """
+        with self._finished:
+            self._finished.wait_for(lambda: self.finished_count != seen, timeout)
+            return self.finished_count
+
+    def _run_worker(self, batch_id: str):
+        try:
+            self._process(batch_id)
+        except Exception as e:
+            logger.error(f"Local batch {batch_id} failed: {e}")
+        finally:
+            with self._finished:
+                self.finished_count += 1
+                self._finished.notify_all()
+
+    def _process(self, batch_id: str):
+        """Process the requests of a batch that have no result yet"""
+        batch_dir = os.path.join(self.directory, batch_id)
+        done = set(self._read_results(batch_id))
+
+        with open(os.path.join(batch_dir, 'requests.jsonl'), encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+
+        with open(os.path.join(batch_dir, 'results.jsonl'), 'a', encoding='utf-8') as out:
+            for line in lines:
+                if line["custom_id"] in done:
+                    continue
+                if self._read_status(batch_id).get("status") != BATCH_RUNNING:
+                    logger.info(f"Local batch {batch_id} was cancelled")
+                    return
+
+                request = BatchRequest(line["custom_id"], line["model_type"], line["prompt"], line.get("parameters"))
+                result = {"custom_id": request.custom_id}
+                try:
+                    result["content"], result["usage"] = self.processor(request)
+                except Exception as e:
+                    result["error"] = str(e)
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+
+        status = self._read_status(batch_id)
+        if status.get("status") == BATCH_RUNNING:
+            status["status"] = BATCH_COMPLETED
+            status["completed_at"] = datetime.now().isoformat()
+            self._write_status(batch_id, status)
+        logger.info(f"Local batch {batch_id} processed {len(lines)} requests")
+
+    def _read_results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        path = os.path.join(self.directory, batch_id, 'results.jsonl')
+        if not os.path.exists(path):
+            return {}
+        results = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash; its request is processed again
+                    continue
+                results[result["custom_id"]] = result
+        return results
+
+    def _read_status(self, batch_id: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.directory, batch_id, 'status.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_status(self, batch_id: str, status: Dict[str, Any]):
+        path = os.path.join(self.directory, batch_id, 'status.json')
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(temp_path, path)
+
+
+class BatchRunner:
+    """Submits generation requests as batch jobs, grouped per backend, and collects their results"""
+
+    def __init__(self, config_dir: str = None, settings: Optional[Dict[str, Any]] = None,
+                 local_backend: Optional[LocalBatchBackend] = None):
+        """
+        Initialize the runner.
+
+        Args:
+            config_dir (str, optional): Directory containing config files. Defaults to './configs/'.
+            settings (Optional[Dict[str, Any]], optional): Overrides for the 'batch' section
+                of config.yaml (backend, directory, poll_interval, timeout). Defaults to None.
+            local_backend (Optional[LocalBatchBackend], optional): Local backend to use.
+                Defaults to one in the configured directory.
+        """
+        # Imported here to avoid circular imports
+        from .model_manager import ModelManager
+
+        self.config_dir = config_dir
+        self.manager = ModelManager(config_dir)
+        self.settings = dict(DEFAULT_BATCH_SETTINGS)
+        self.settings.update(self.manager.config.get('batch', {}) or {})
+        self.settings.update(settings or {})
+        self.local_backend = local_backend or LocalBatchBackend(self.settings['directory'])
+
+    def run(self, requests: List[BatchRequest], stop_event: Optional[threading.Event] = None) -> Dict[str, BatchResult]:
+        """
+        Submit requests and wait for all of their results.
+
+        Args:
+            requests (List[BatchRequest]): Requests with unique custom IDs
+            stop_event (Optional[threading.Event], optional): Cancels the outstanding
+                batches when set. Defaults to None.
+
+        Returns:
+            Dict[str, BatchResult]: Result for every request, by custom ID
+        """
+        submissions, results = self.submit(requests)
+        results.update(self.wait(submissions, stop_event))
+        return results
+
+    def submit(self, requests: List[BatchRequest]) -> Tuple[List[BatchSubmission], Dict[str, BatchResult]]:
+        """
+        Submit requests as one batch job per backend and model.
+
+        Args:
+            requests (List[BatchRequest]): Requests with unique custom IDs
+
+        Returns:
+            Tuple[List[BatchSubmission], Dict[str, BatchResult]]: Submitted batches, and
+                results for requests that failed before submission
+        """
+        groups = {}
+        results = {}
+        for request in requests:
+            try:
+                key, backend, model = self._route(request)
+            except Exception as e:
+                results[request.custom_id] = BatchResult(request.custom_id, error=str(e))
+                continue
+            groups.setdefault(key, (backend, []))[1].append((request, model))
+
+        submissions = []
+        for key, (backend, entries) in groups.items():
+            custom_ids = tuple(request.custom_id for request, _ in entries)
+            try:
+                batch_id = backend.submit(entries)
+            except Exception as e:
+                logger.error(f"Submitting {len(entries)} requests to the {backend.name} batch backend failed: {e}")
+                for custom_id in custom_ids:
+                    results[custom_id] = BatchResult(custom_id, error=f"Batch submission failed: {e}")
+                continue
+            logger.info(f"Submitted batch {batch_id} with {len(entries)} requests to the {backend.name} backend")
+            submissions.append(BatchSubmission(backend, batch_id, custom_ids))
+        return submissions, results
+
+    def wait(self, submissions: List[BatchSubmission], stop_event: Optional[threading.Event] = None) -> Dict[str, BatchResult]:
+        """
+        Poll submitted batches until they finish, time out or are cancelled.
+
+        Args:
+            submissions (List[BatchSubmission]): Submitted batches
+            stop_event (Optional[threading.Event], optional): Cancels the outstanding
+                batches when set. Defaults to None.
+
+        Returns:
+            Dict[str, BatchResult]: Result for every submitted request, by custom ID
+        """
+        deadline = time.monotonic() + float(self.settings['timeout'])
+        poll_interval = float(self.settings['poll_interval'])
+        pending = list(submissions)
+        results = {}
+
+        while pending:
+            finished = self.local_backend.finished_count
+            for submission in list(pending):
+                try:
+                    status = submission.backend.poll(submission.batch_id)
+                    if status == BATCH_RUNNING:
+                        continue
+                    if status == BATCH_COMPLETED:
+                        results.update(submission.backend.results(submission.batch_id))
+                except Exception as e:
+                    # Transient polling errors are retried on the next round
+                    logger.warning(f"Polling batch {submission.batch_id} failed: {e}")
+                    continue
+                pending.remove(submission)
+                self._fill_missing(results, submission, f"Batch {submission.batch_id} {status}")
+
+            if not pending:
+                break
+
+            reason = None
+            if stop_event is not None and stop_event.is_set():
+                reason = "cancelled"
+            elif time.monotonic() >= deadline:
+                reason = "timed out"
+            if reason:
+                for submission in pending:
+                    try:
+                        submission.backend.cancel(submission.batch_id)
+                    except Exception as e:
+                        logger.warning(f"Cancelling batch {submission.batch_id} failed: {e}")
+                    self._fill_missing(results, submission, f"Batch {submission.batch_id} {reason}")
+                break
+
+            if all(submission.backend is self.local_backend for submission in pending):
+                # Local batches wake the runner as soon as they finish
+                self.local_backend.wait_finished(finished, min(poll_interval, LOCAL_POLL_INTERVAL))
+            elif stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+
+        return results
+
+    def _route(self, request: BatchRequest) -> Tuple[Tuple, BatchBackend, Any]:
+        """Choose the backend for a request; returns (group key, backend, model instance)"""
+        if self.manager.get_model_record(request.model_type) is None:
+            raise ValueError(f"Unknown model: {request.model_type}")
+
+        if self.settings['backend'] != 'local':
+            # Configure the model exactly as an interactive request would
+            manager = type(self.manager)(self.config_dir)
+            manager.change_model(request.model_type, persist=False)
+            if request.parameters:
+                manager.set_parameters(**request.parameters)
+            model = manager._get_model_instance(request.model_type)
+
+            if model is not None and model.batch_api == 'openai':
+                # An OpenAI batch file may only reference one model
+                return ('openai', model.model_config['model']), OpenAIBatchBackend(model.client), model
+            if model is not None and model.batch_api == 'anthropic':
+                return ('anthropic',), AnthropicBatchBackend(model.client), model
+
+        return ('local',), self.local_backend, None
+
+    def _fill_missing(self, results: Dict[str, BatchResult], submission: BatchSubmission, error: str):
+        for custom_id in submission.custom_ids:
+            if custom_id not in results:
+                results[custom_id] = BatchResult(custom_id, error=error)
+
+
+def _prompt_to_json(prompt: Any) -> Any:
+    """Convert a prompt into plain JSON data, turning message objects into dicts"""
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, dict):
+        return dict(prompt, messages=_prompt_to_json(prompt.get('messages', [])))
+    return [
+        message if isinstance(message, dict) else {'role': message.role, 'content': message.content}
+        for message in prompt
+    ]
+
+
+def _generate_with_model_manager(request: BatchRequest) -> Tuple[str, Any]:
+    """Generate a batch request through the interactive path; returns (content, usage)"""
+    # Imported here to avoid circular imports
+    from .model_manager import ModelManager
+
+    manager = ModelManager()
+    manager.change_model(request.model_type, persist=False)
+    if request.parameters:
+        manager.set_parameters(**request.parameters)
+    content = manager.generate_content(request.prompt, model_type=request.model_type, raise_errors=True)
+    return content, manager.last_usage
@@ -0,0 +1,422 @@
+# ai_toolkit/config_registry.py
+import os
+import time
+import atexit
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable
+
+import yaml
+
+from .frozen import FrozenDict, freeze, thaw
+from .model_index import ModelIndex
+
+# Prefer the libyaml bindings; fall back to the pure-Python implementation
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_DIR = os.path.join(os.path.dirname(__file__), 'configs')
+
+# Config file name for each section of a snapshot
+CONFIG_FILES = {
+    'config': 'config.yaml',
+    'prompts': 'prompt.yaml',
+    'json_templates': 'json_template.yaml'
+}
+
+DEFAULT_CONFIG = {
+    'current_model': 'gpt-4o',
+    'current_img_model': 'gpt-4o',
+    'json_mode': False,
+    # Offline batch jobs (see ai_toolkit.batch)
+    'batch': {
+        'backend': 'provider',
+        'directory': './data/batches',
+        'poll_interval': 30,
+        'timeout': 86400
+    },
+    # Chat history compaction (see services.compaction_service); a model's
+    # optional 'context_window' lowers the threshold to context_ratio of it
+    'compaction': {
+        'enabled': True,
+        'model': 'gemini-2.0-flash-lite',
+        'threshold_tokens': 24000,
+        'context_ratio': 0.5,
+        'keep_recent': 8,
+        'summary_max_tokens': 1024
+    },
+    'providers': {
+        'openai': {
+            'gpt': ['gpt-4', 'gpt-4o', 'gpt-4.5'],
+            'o3': ['o3-mini']
+        },
+        'anthropic': {
+            'claude': ['claude-3-7-sonnet-latest', 'claude-3-5-haiku-latest']
+        },
+        'google': {
+            'gemini': ['gemini-2.0-flash', 'gemini-1.5-pro']
+        },
+        'xai': {
+            'grok': ['grok-3-latest']
+        },
+        'mock': {
+            'mock': ['mock-instant', 'mock-realistic']
+        }
+    },
+    # Concurrent requests allowed per provider
+    'provider_limits': {
+        'openai': 8,
+        'anthropic': 8,
+        'google': 8,
+        'xai': 8,
+        'mock': 64
+    },
+    'provider_mapping': {
+        'gpt-4': {'provider': 'openai', 'category': 'gpt'},
+        'gpt-4o': {'provider': 'openai', 'category': 'gpt'},
+        'gpt-4.5': {'provider': 'openai', 'category': 'gpt'},
+        'o3-mini': {'provider': 'openai', 'category': 'o3'},
+        'claude-3-7-sonnet-latest': {'provider': 'anthropic', 'category': 'claude'},
+        'claude-3-5-haiku-latest': {'provider': 'anthropic', 'category': 'claude'},
+        'gemini-2.0-flash': {'provider': 'google', 'category': 'gemini'},
+        'gemini-1.5-pro': {'provider': 'google', 'category': 'gemini'},
+        'grok-3-latest': {'provider': 'xai', 'category': 'grok'},
+        'mock-instant': {'provider': 'mock', 'category': 'mock'},
+        'mock-realistic': {'provider': 'mock', 'category': 'mock'}
+    },
+    'models': {
+        'gpt-4o': {
+            'provider': 'openai',
+            'category': 'gpt',
+            'model': 'gpt-4o',
+            'max_tokens': 4000,
+            'temperature': 0.7,
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': True
+        },
+        'o3-mini': {
+            'provider': 'openai',
+            'category': 'o3',
+            'model': 'o3-mini',
+            'max_tokens': 45000,
+            'temperature': 0.7,
+            'reasoning_effort': 'high',
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': False
+        },
+        'claude-3-7-sonnet-latest': {
+            'provider': 'anthropic',
+            'category': 'claude',
+            'model': 'claude-3-7-sonnet-20240229',
+            'max_tokens': 4000,
+            'temperature': 0.7,
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': True
+        },
+        'gemini-2.0-flash': {
+            'provider': 'google',
+            'category': 'gemini',
+            'model': 'gemini-2.0-flash',
+            'max_tokens': 4000,
+            'temperature': 0.7,
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': True
+        },
+        'grok-3-latest': {
+            'provider': 'xai',
+            'category': 'grok',
+            'model': 'grok-3-latest',
+            'max_tokens': 4000,
+            'temperature': 0.7,
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': True
+        },
+        # Local mock models for load tests; see ai_toolkit.mock_provider for the settings
+        'mock-instant': {
+            'provider': 'mock',
+            'category': 'mock',
+            'model': 'mock-instant',
+            'max_tokens': 4000,
+            'temperature': 0.7,
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': True,
+            'mock': {'output_tokens': 64}
+        },
+        'mock-realistic': {
+            'provider': 'mock',
+            'category': 'mock',
+            'model': 'mock-realistic',
+            'max_tokens': 4000,
+            'temperature': 0.7,
+            'system_prompt_key': 'default_system',
+            'supports_system_prompt': True,
+            'mock': {
+                'output_tokens': 200,
+                'ttft_ms': 400,
+                'tokens_per_sec': 80,
+                'jitter': 'exponential',
+                'jitter_ms': 150,
+                'error_rates': {'429': 0.01, '500': 0.005, 'timeout': 0.001},
+                'timeout_s': 30
+            }
+        }
+    }
+}
+
+DEFAULT_PROMPTS = {
+    'system_prompts': {
+        'default_system': 'You are a helpful, accurate, and friendly AI assistant.',
+        'creative_system': 'You are a creative AI assistant that excels at generating imaginative content.',
+        'technical_system': 'You are a technical AI assistant that provides precise and accurate information.'
+    },
+    'user_prompts': {
+        'explain_ai': 'Explain the concept of artificial intelligence.',
+        'write_story': 'Write a short story about a character who discovers something unexpected.'
+    }
+}
+
+DEFAULT_JSON_TEMPLATES = {
+    'json_template': {
+        'default': {
+            'response': '',
+            'metadata': {
+                'model': '',
+                'timestamp': ''
+            }
+        },
+        'detailed': {
+            'response': {
+                'content': '',
+                'summary': ''
+            },
+            'metadata': {
+                'model': '',
+                'timestamp': '',
+                'processing_time': ''
+            }
+        }
+    }
+}
+
+DEFAULTS = {
+    'config': DEFAULT_CONFIG,
+    'prompts': DEFAULT_PROMPTS,
+    'json_templates': DEFAULT_JSON_TEMPLATES
+}
+
+
+class ConfigSnapshot:
+    """Immutable view of config.yaml, prompt.yaml and json_template.yaml at one point in time"""
+
+    __slots__ = ('config', 'prompts', 'json_templates', 'version', 'index')
+
+    def __init__(self, config: FrozenDict, prompts: FrozenDict, json_templates: FrozenDict, version: int):
+        """
+        Initialize a snapshot and index its models.
+
+        Args:
+            config (FrozenDict): Frozen config.yaml contents
+            prompts (FrozenDict): Frozen prompt.yaml contents
+            json_templates (FrozenDict): Frozen json_template.yaml contents
+            version (int): Monotonic version, incremented on every change
+        """
+        self.config = config
+        self.prompts = prompts
+        self.json_templates = json_templates
+        self.version = version
+        self.index = ModelIndex(config, prompts)
+
+    def replace(self, section: str, data: FrozenDict) -> 'ConfigSnapshot':
+        """
+        Build the next snapshot with one section replaced.
+
+        Args:
+            section (str): 'config', 'prompts' or 'json_templates'
+            data (FrozenDict): New frozen contents for the section
+
+        Returns:
+            ConfigSnapshot: New snapshot with an incremented version
+        """
+        sections = {name: getattr(self, name) for name in CONFIG_FILES}
+        sections[section] = data
+        return ConfigSnapshot(version=self.version + 1, **sections)
+
+
+class ConfigRegistry:
+    """Process-wide owner of the YAML configuration for one config directory"""
+
+    def __init__(self, config_dir: str, reload_interval: float = 1.0, write_delay: float = 0.5):
+        """
+        Initialize the registry and load the configuration files.
+
+        Args:
+            config_dir (str): Directory containing the config files
+            reload_interval (float, optional): Minimum seconds between file mtime checks. Defaults to 1.0.
+            write_delay (float, optional): Seconds to coalesce updates before writing. Defaults to 0.5.
+        """
+        self.config_dir = config_dir
+        self.reload_interval = reload_interval
+        self.write_delay = write_delay
+        self.paths = {section: os.path.join(config_dir, filename) for section, filename in CONFIG_FILES.items()}
+
+        self._lock = threading.RLock()
+        self._mtimes = {}
+        self._pending = set()
+        self._timer = None
+        self._next_check = 0.0
+
+        os.makedirs(config_dir, exist_ok=True)
+        sections = {section: freeze(self._load(section)) for section in CONFIG_FILES}
+        self._snapshot = ConfigSnapshot(version=1, **sections)
+        logger.info(f"Configuration loaded from {config_dir}")
+
+    def snapshot(self) -> ConfigSnapshot:
+        """
+        Get the current configuration snapshot, reloading files changed on disk.
+
+        Returns:
+            ConfigSnapshot: Current immutable snapshot
+        """
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self._reload_changed()
+        return self._snapshot
+
+    def update(self, section: str, mutate: Callable[[Dict[str, Any]], None]) -> ConfigSnapshot:
+        """
+        Apply a change to one section and publish a new snapshot.
+
+        The mutation runs on a private, mutable copy of the section; the result is
+        frozen and swapped in atomically, and the file write is scheduled.
+
+        Args:
+            section (str): 'config', 'prompts' or 'json_templates'
+            mutate (Callable[[Dict[str, Any]], None]): Function modifying the copy in place
+
+        Returns:
+            ConfigSnapshot: The published snapshot
+        """
+        with self._lock:
+            self._reload_changed()
+            data = thaw(getattr(self._snapshot, section))
+            mutate(data)
+            self._snapshot = self._snapshot.replace(section, freeze(data))
+            self._schedule_write(section)
+            return self._snapshot
+
+    def flush(self):
+        """Write all pending changes to disk immediately"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, set()
+            for section in pending:
+                self._write(section, thaw(getattr(self._snapshot, section)))
+
+    def _schedule_write(self, section: str):
+        """Debounce writes so bursts of updates produce a single file write"""
+        self._pending.add(section)
+        if self._timer is None:
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _stat(self, section: str):
+        try:
+            st = os.stat(self.paths[section])
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _reload_changed(self):
+        """Reload sections whose file changed since it was last read or written"""
+        with self._lock:
+            for section in CONFIG_FILES:
+                # In-memory changes not yet written take precedence over the file
+                if section in self._pending:
+                    continue
+                if self._stat(section) == self._mtimes.get(section):
+                    continue
+                data = freeze(self._load(section))
+                self._snapshot = self._snapshot.replace(section, data)
+                logger.info(f"Reloaded {self.paths[section]} (config version {self._snapshot.version})")
+
+    def _load(self, section: str) -> Dict[str, Any]:
+        """
+        Load one config file, creating it from defaults if it does not exist.
+
+        Args:
+            section (str): Section name
+
+        Returns:
+            Dict[str, Any]: Parsed file contents
+        """
+        path = self.paths[section]
+        if not os.path.exists(path):
+            self._write(section, DEFAULTS[section])
+            logger.info(f"Created default configuration at {path}")
+
+        # Record the version being read so a broken file is not retried on every check
+        self._mtimes[section] = self._stat(section)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return yaml.load(f, Loader=_YamlLoader) or {}
+        except Exception as e:
+            logger.error(f"Error loading config from {path}: {e}")
+            # Keep the previous contents if a reload fails
+            previous = getattr(getattr(self, '_snapshot', None), section, None)
+            return thaw(previous) if previous is not None else {}
+
+    def _write(self, section: str, data: Dict[str, Any]):
+        """Write a section atomically through a temporary file and rename"""
+        path = self.paths[section]
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yaml.dump(data, f, Dumper=_YamlDumper, default_flow_style=False, allow_unicode=True)
+            os.replace(tmp_path, path)
+            self._mtimes[section] = self._stat(section)
+        except Exception as e:
+            logger.error(f"Error saving config to {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_config_registry(config_dir: Optional[str] = None) -> ConfigRegistry:
+    """
+    Get the process-wide registry for a config directory, loading it on first use.
+
+    Args:
+        config_dir (Optional[str], optional): Config directory. Defaults to the toolkit's configs directory.
+
+    Returns:
+        ConfigRegistry: Shared registry
+    """
+    key = os.path.realpath(config_dir or DEFAULT_CONFIG_DIR)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ConfigRegistry(key)
+            _registries[key] = registry
+        return registry
+
+
+@atexit.register
+def _flush_registries():
+    """Persist debounced changes on interpreter shutdown"""
+    for registry in list(_registries.values()):
+        registry.flush()
@@ -0,0 +1,234 @@
+# ai_toolkit/messages.py
+import re
+import base64
+from typing import Dict, Any, Union, List, Optional, Tuple, NamedTuple
+
+_DATA_URL = re.compile(r'^data:(?P<media_type>[\w/+.-]+);base64,(?P<data>.*)$', re.DOTALL)
+
+
+class ChatMessage(NamedTuple):
+    """Canonical, immutable chat message shared by every provider adapter"""
+
+    # 'system', 'user' or 'assistant'
+    role: str
+    # Plain text, or a tuple of OpenAI-style content parts for multimodal messages
+    content: Union[str, Tuple[Dict[str, Any], ...]]
+
+    @property
+    def text(self) -> str:
+        """Text of the message, joining the text parts of multimodal content"""
+        return message_text(self.content)
+
+
+class Conversation:
+    """Canonical request: system prompt, ordered messages and request options"""
+
+    __slots__ = ('system', 'messages', 'options')
+
+    def __init__(self, system: str = '', messages: Tuple[Any, ...] = (), options: Optional[Dict[str, Any]] = None):
+        """
+        Initialize a canonical conversation.
+
+        Args:
+            system (str, optional): System prompt. Defaults to ''.
+            messages (Tuple[Any, ...], optional): Conversation turns; ChatMessage objects or
+                any read-only objects exposing role and content. Defaults to ().
+            options (Optional[Dict[str, Any]], optional): Request options such as
+                response_format, json_template or a model override. Defaults to None.
+        """
+        self.system = system
+        self.messages = tuple(messages)
+        self.options = options or {}
+
+    def cache_repr(self) -> List:
+        """Stable, JSON-serializable representation used for request keys"""
+        # json_template is included because providers format their output with it
+        return [self.system, [[m.role, m.content] for m in self.messages], dict(self.options)]
+
+
+def message_text(content: Union[str, Tuple[Dict[str, Any], ...]]) -> str:
+    """Text of message content, joining the text parts of multimodal content"""
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get('text', '') for part in content if part.get('type') == 'text')
+
+
+def _content_from_raw(content: Any) -> Union[str, Tuple[Dict[str, Any], ...]]:
+    """Collapse OpenAI-style text arrays to strings; keep real multimodal content as parts"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, (list, tuple)):
+        if len(content) == 1 and isinstance(content[0], dict) and content[0].get('type', 'text') == 'text':
+            return content[0].get('text', '')
+        return tuple(dict(part) if isinstance(part, dict) else {'type': 'text', 'text': str(part)} for part in content)
+    return '' if content is None else str(content)
+
+
+def _message_from_dict(raw: Dict[str, Any]) -> ChatMessage:
+    return ChatMessage(raw.get('role', 'user'), _content_from_raw(raw.get('content', '')))
+
+
+def build_conversation(prompt: Union[str, Dict, List, Conversation], default_system: str = '') -> Conversation:
+    """
+    Build the canonical conversation for a request in a single pass.
+
+    Message dicts are converted to ChatMessage; ChatMessage objects and other
+    objects exposing role and content (such as stored chat messages) are kept by
+    reference, so no per-message copy is made for them. Leading system messages
+    become the system prompt. System messages appearing later in the history
+    (e.g. stored error notices) stay in place so OpenAI-style providers can see
+    them; other adapters skip them.
+
+    Args:
+        prompt (Union[str, Dict, List, Conversation]): String prompt, list of messages,
+            or a payload dict with a 'messages' key
+        default_system (str, optional): System prompt used for plain string prompts. Defaults to ''.
+
+    Returns:
+        Conversation: Canonical conversation
+
+    Raises:
+        TypeError: If the prompt format is not supported
+    """
+    if isinstance(prompt, Conversation):
+        return prompt
+
+    if isinstance(prompt, str):
+        return Conversation(default_system or '', (ChatMessage('user', prompt),))
+
+    options = {}
+    system_parts = []
+    if isinstance(prompt, dict):
+        if 'messages' not in prompt:
+            raise TypeError("Prompt dict must contain 'messages'")
+        raw_messages = prompt['messages']
+        if prompt.get('system'):
+            system_parts.append(prompt['system'])
+        for key in ('model', 'response_format', 'json_template'):
+            if key in prompt:
+                options[key] = prompt[key]
+    elif isinstance(prompt, (list, tuple)):
+        raw_messages = prompt
+    else:
+        raise TypeError(f"Unsupported prompt type: {type(prompt).__name__}")
+
+    # Leading system messages form the system prompt
+    start = 0
+    for raw in raw_messages:
+        message = _message_from_dict(raw) if isinstance(raw, dict) else raw
+        if not hasattr(message, 'role') or not hasattr(message, 'content'):
+            raise TypeError(f"Unsupported message type: {type(raw).__name__}")
+        if message.role != 'system':
+            break
+        system_parts.append(message_text(message.content))
+        start += 1
+
+    messages = tuple([
+        _message_from_dict(raw) if raw.__class__ is dict else raw
+        for raw in raw_messages[start:]
+    ])
+
+    return Conversation("\n\n".join(p for p in system_parts if p), messages, options)
+
+
+def to_openai_messages(conversation: Conversation) -> List[Dict[str, Any]]:
+    """
+    Serialize a conversation to the Chat Completions wire format.
+
+    Args:
+        conversation (Conversation): Canonical conversation
+
+    Returns:
+        List[Dict[str, Any]]: Messages for chat.completions.create
+    """
+    messages = [{"role": "system", "content": conversation.system}] if conversation.system else []
+
+    # Plain strings are valid content for every role, so text needs no wrapping
+    messages.extend([
+        {"role": m.role, "content": m.content if isinstance(m.content, str) else list(m.content)}
+        for m in conversation.messages
+    ])
+
+    return messages
+
+
+def to_anthropic_messages(conversation: Conversation) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Serialize a conversation to the Anthropic Messages wire format.
+
+    Args:
+        conversation (Conversation): Canonical conversation
+
+    Returns:
+        Tuple[str, List[Dict[str, Any]]]: System prompt and messages for messages.create
+    """
+    messages = []
+    for message in conversation.messages:
+        if message.role == 'system':
+            continue
+        content = message.content
+        if not isinstance(content, str):
+            content = [_anthropic_block(part) for part in content]
+        messages.append({"role": message.role, "content": content})
+
+    return conversation.system, messages
+
+
+def _anthropic_block(part: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate an OpenAI-style content part into an Anthropic content block"""
+    if part.get('type') == 'image_url':
+        url = part.get('image_url', {}).get('url', '')
+        match = _DATA_URL.match(url)
+        if match:
+            return {
+                "type": "image",
+                "source": {"type": "base64", "media_type": match.group('media_type'), "data": match.group('data')}
+            }
+        return {"type": "image", "source": {"type": "url", "url": url}}
+    return {"type": "text", "text": part.get('text', '')}
+
+
+def to_gemini_contents(conversation: Conversation) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Serialize a conversation to Gemini structured contents.
+
+    Assistant turns use Gemini's 'model' role and consecutive turns from the same
+    role are merged, since the API expects user and model turns to alternate.
+
+    Args:
+        conversation (Conversation): Canonical conversation
+
+    Returns:
+        Tuple[str, List[Dict[str, Any]]]: System instruction and contents for generate_content
+    """
+    contents = []
+    last_role = None
+    for message in conversation.messages:
+        if message.role == 'system':
+            continue
+        role = 'model' if message.role == 'assistant' else 'user'
+        content = message.content
+        if isinstance(content, str):
+            if not content:
+                continue
+            parts = [content]
+        else:
+            parts = [_gemini_part(part) for part in content]
+        if role == last_role:
+            contents[-1]['parts'].extend(parts)
+        else:
+            contents.append({"role": role, "parts": parts})
+            last_role = role
+
+    return conversation.system, contents
+
+
+def _gemini_part(part: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+    """Translate an OpenAI-style content part into a Gemini part"""
+    if part.get('type') == 'image_url':
+        url = part.get('image_url', {}).get('url', '')
+        match = _DATA_URL.match(url)
+        if match:
+            return {"mime_type": match.group('media_type'), "data": base64.b64decode(match.group('data'))}
+        return url
+    return part.get('text', '')
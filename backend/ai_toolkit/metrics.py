@@ -0,0 +1,240 @@
+# ai_toolkit/metrics.py
+import bisect
+import logging
+import threading
+from typing import Dict, Any, Callable, Iterable, List, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast store reads to slow provider calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# A collector returns (name, type, help, [(label dict, value), ...]) families at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class _Metric:
+    """Base class for a metric family with a fixed set of label names"""
+
+    type_name = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _label_pairs(self, label_values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.label_names, label_values))
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, *label_values):
+        """
+        Add to the counter; does nothing while metrics are disabled.
+
+        Args:
+            amount (float, optional): Increment. Defaults to 1.
+            *label_values: Values for the family's labels, in order
+        """
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._label_pairs(labels), value) for labels, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        """
+        Record one observation; does nothing while metrics are disabled.
+
+        Args:
+            value (float): Observed value
+            *label_values: Values for the family's labels, in order
+        """
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        for labels, counts, total, count in items:
+            pairs = self._label_pairs(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", dict(pairs, le=_format_value(bound)), cumulative))
+            samples.append((f"{self.name}_sum", pairs, total))
+            samples.append((f"{self.name}_count", pairs, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide metric families rendered in the Prometheus text format"""
+
+    def __init__(self, enabled: bool = False):
+        """
+        Initialize the registry.
+
+        Recording calls return immediately while the registry is disabled, so
+        instrumented code paths cost one attribute check.
+
+        Args:
+            enabled (bool, optional): Whether metrics are recorded. Defaults to False.
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        """
+        Get or create a counter family.
+
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the exposition
+            label_names (Tuple[str, ...], optional): Label names. Defaults to ().
+
+        Returns:
+            Counter: Counter family
+        """
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Get or create a histogram family.
+
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the exposition
+            label_names (Tuple[str, ...], optional): Label names. Defaults to ().
+            buckets (Tuple[float, ...], optional): Bucket upper bounds. Defaults to DEFAULT_BUCKETS.
+
+        Returns:
+            Histogram: Histogram family
+        """
+        return self._get_or_create(Histogram, name, help_text, label_names, buckets)
+
+    def register_collector(self, collector: Collector):
+        """
+        Add a function that reports gauge or counter families at scrape time.
+
+        Args:
+            collector (Collector): Function returning (name, type, help, samples) families
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render every family in the Prometheus text exposition format.
+
+        Returns:
+            str: Exposition text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+                continue
+            for name, type_name, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(self, cls, name, help_text, label_names, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help_text, label_names, *args)
+            return metric
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Process-wide registry shared by the toolkit and the application
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry"""
+    return _metrics
+
+
+def configure_metrics(enabled: bool) -> MetricsRegistry:
+    """
+    Turn metric recording on or off.
+
+    Args:
+        enabled (bool): Whether metrics are recorded
+
+    Returns:
+        MetricsRegistry: The process-wide registry
+    """
+    _metrics.enabled = bool(enabled)
+    logger.info(f"Metrics {'enabled' if _metrics.enabled else 'disabled'}")
+    return _metrics
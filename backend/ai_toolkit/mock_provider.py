@@ -0,0 +1,393 @@
+# ai_toolkit/mock_provider.py
+import json
+import time
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Iterator, List, Optional
+
+from .messages import Conversation, build_conversation, message_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_MOCK_SETTINGS = {
+    # Response template; None produces deterministic filler text. Available fields:
+    # {model}, {last_message}, {message_count}, {digest}
+    'response': None,
+    # Tokens of filler text per response, capped by the request's max_tokens
+    'output_tokens': 64,
+    # Time to first token and generation speed; 0 tokens_per_sec returns instantly
+    'ttft_ms': 0,
+    'tokens_per_sec': 0,
+    # Latency jitter added to the time to first token: none, uniform, normal or exponential
+    'jitter': 'none',
+    'jitter_ms': 0,
+    # Probability of each injected failure: '429', '500' and 'timeout'
+    'error_rates': {},
+    # How long a simulated timeout hangs before failing
+    'timeout_s': 30,
+    # Seed for latency and failure sampling; None draws a fresh sequence per engine
+    'seed': None
+}
+
+_FILLER_WORDS = (
+    'the', 'model', 'response', 'loop', 'message', 'data', 'system', 'value', 'result', 'token',
+    'request', 'user', 'context', 'cache', 'stream', 'latency', 'simple', 'local', 'output', 'test'
+)
+
+
+class MockProviderError(Exception):
+    """Injected provider failure carrying the HTTP status a real API would return"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class MockEngine:
+    """Generates deterministic responses with simulated latency, throughput and failures"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            settings (Optional[Dict[str, Any]], optional): Overrides for DEFAULT_MOCK_SETTINGS.
+                Defaults to None.
+        """
+        self.settings = dict(DEFAULT_MOCK_SETTINGS)
+        self.settings.update(settings or {})
+        self._random = random.Random(self.settings['seed'])
+        self._lock = threading.Lock()
+
+    def complete(self, conversation: Conversation, model: str = 'mock', max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Generate a full response, waiting as long as streaming it would take.
+
+        Args:
+            conversation (Conversation): Canonical conversation
+            model (str, optional): Model name used in templates. Defaults to 'mock'.
+            max_tokens (Optional[int], optional): Output token limit. Defaults to None.
+
+        Returns:
+            List[str]: Response tokens; joined they form the response text
+
+        Raises:
+            MockProviderError: For injected 429 and 500 failures
+            TimeoutError: For injected timeouts
+        """
+        ttft = self._start_request()
+        tokens = self._render(conversation, model, max_tokens)
+        self._sleep(ttft + self._generation_time(len(tokens)))
+        return tokens
+
+    def stream(self, conversation: Conversation, model: str = 'mock', max_tokens: Optional[int] = None) -> Iterator[str]:
+        """
+        Generate a response token by token at the configured speed.
+
+        Args:
+            conversation (Conversation): Canonical conversation
+            model (str, optional): Model name used in templates. Defaults to 'mock'.
+            max_tokens (Optional[int], optional): Output token limit. Defaults to None.
+
+        Yields:
+            str: Next token
+
+        Raises:
+            MockProviderError: For injected 429 and 500 failures
+            TimeoutError: For injected timeouts
+        """
+        ttft = self._start_request()
+        tokens = self._render(conversation, model, max_tokens)
+        interval = self._generation_time(1)
+        self._sleep(ttft)
+        for index, token in enumerate(tokens):
+            if index:
+                self._sleep(interval)
+            yield token
+
+    def _start_request(self) -> float:
+        """Sample the failure and first-token latency of a request; returns the latency in seconds"""
+        with self._lock:
+            roll = self._random.random()
+            ttft_ms = float(self.settings['ttft_ms'] or 0) + self._jitter_ms()
+
+        # Failures are drawn from one roll so their rates add up
+        threshold = 0.0
+        for failure in ('429', '500', 'timeout'):
+            threshold += float((self.settings['error_rates'] or {}).get(failure, 0) or 0)
+            if roll < threshold:
+                if failure == 'timeout':
+                    self._sleep(float(self.settings['timeout_s']))
+                    raise TimeoutError("Mock provider request timed out")
+                if failure == '429':
+                    raise MockProviderError(429, "Mock provider rate limit exceeded")
+                raise MockProviderError(500, "Mock provider internal error")
+
+        return max(0.0, ttft_ms) / 1000
+
+    def _jitter_ms(self) -> float:
+        scale = float(self.settings['jitter_ms'] or 0)
+        distribution = self.settings['jitter']
+        if not scale or distribution == 'none':
+            return 0.0
+        if distribution == 'uniform':
+            return self._random.uniform(-scale, scale)
+        if distribution == 'normal':
+            return self._random.gauss(0, scale)
+        if distribution == 'exponential':
+            return self._random.expovariate(1 / scale)
+        raise ValueError(f"Unknown jitter distribution: {distribution}")
+
+    def _generation_time(self, token_count: int) -> float:
+        tokens_per_sec = float(self.settings['tokens_per_sec'] or 0)
+        return token_count / tokens_per_sec if tokens_per_sec > 0 else 0.0
+
+    def _render(self, conversation: Conversation, model: str, max_tokens: Optional[int]) -> List[str]:
+        """Build the response tokens; identical conversations get identical responses"""
+        last_message = message_text(conversation.messages[-1].content) if conversation.messages else ''
+        hasher = hashlib.sha1(model.encode('utf-8'))
+        hasher.update(conversation.system.encode('utf-8'))
+        for message in conversation.messages:
+            hasher.update(message.role.encode('utf-8'))
+            hasher.update(message_text(message.content).encode('utf-8'))
+        digest = hasher.hexdigest()
+
+        limit = int(self.settings['output_tokens'])
+        if max_tokens:
+            limit = min(limit, int(max_tokens))
+
+        template = self.settings['response']
+        if template:
+            text = template.format_map(_TemplateFields(
+                model=model,
+                last_message=last_message,
+                message_count=len(conversation.messages),
+                digest=digest[:12]
+            ))
+            words = text.split(' ')
+            return [word + ' ' for word in words[:-1]] + words[-1:]
+
+        rng = random.Random(digest)
+        return [rng.choice(_FILLER_WORDS) + (' ' if index < limit - 1 else '.') for index in range(limit)]
+
+    def _sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class _TemplateFields(dict):
+    """Template fields that leave unknown placeholders untouched"""
+
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for mock usage reports"""
+    return max(1, len(text) // 4) if text else 0
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /v1/chat/completions and /v1/models endpoints"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/v1/models':
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            conversation = build_conversation(body.get('messages') or [])
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": {"message": str(e), "type": "invalid_request_error"}})
+            return
+
+        model = body.get('model', 'mock')
+        max_tokens = body.get('max_completion_tokens') or body.get('max_tokens')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        engine = self.server.engine
+
+        try:
+            if body.get('stream'):
+                self._stream(engine.stream(conversation, model, max_tokens), completion_id, model)
+                return
+            content = ''.join(engine.complete(conversation, model, max_tokens))
+        except MockProviderError as e:
+            self._send_error(e)
+            return
+        except TimeoutError:
+            # Hang up without a response, as a stalled upstream would
+            self.close_connection = True
+            return
+
+        prompt_tokens = estimate_tokens(conversation.system) + sum(
+            estimate_tokens(message_text(message.content)) for message in conversation.messages
+        )
+        completion_tokens = estimate_tokens(content)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def _stream(self, tokens: Iterator[str], completion_id: str, model: str):
+        """Send tokens as chat.completion.chunk server-sent events"""
+        try:
+            first = next(tokens)
+        except StopIteration:
+            first = ''
+        except MockProviderError as e:
+            self._send_error(e)
+            return
+        except TimeoutError:
+            self.close_connection = True
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        event({"role": "assistant", "content": first})
+        for token in tokens:
+            event({"content": token})
+        event({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_error(self, error: MockProviderError):
+        error_type = 'rate_limit_error' if error.status_code == 429 else 'server_error'
+        self._send_json(error.status_code, {"error": {"message": str(error), "type": error_type}})
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MockServer:
+    """Local HTTP server speaking the OpenAI chat completions wire format"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        Initialize the server.
+
+        Point an OpenAI SDK client at it with base_url=server.url (or the
+        OPENAI_BASE_URL environment variable) and any API key.
+
+        Args:
+            settings (Optional[Dict[str, Any]], optional): Mock engine settings. Defaults to None.
+            host (str, optional): Interface to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): Port to listen on; 0 picks a free port. Defaults to 0.
+        """
+        self.httpd = ThreadingHTTPServer((host, port), _MockRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.engine = MockEngine(settings)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the OpenAI-compatible API"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'MockServer':
+        """Serve requests in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-provider', daemon=True)
+        self._thread.start()
+        logger.info(f"Mock provider listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local OpenAI-compatible mock provider')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--response', default=None, help='Response template')
+    parser.add_argument('--output-tokens', type=int, default=DEFAULT_MOCK_SETTINGS['output_tokens'])
+    parser.add_argument('--ttft-ms', type=float, default=0)
+    parser.add_argument('--tokens-per-sec', type=float, default=0)
+    parser.add_argument('--jitter', default='none', choices=['none', 'uniform', 'normal', 'exponential'])
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-429', type=float, default=0)
+    parser.add_argument('--rate-500', type=float, default=0)
+    parser.add_argument('--rate-timeout', type=float, default=0)
+    parser.add_argument('--timeout-s', type=float, default=DEFAULT_MOCK_SETTINGS['timeout_s'])
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockServer({
+        'response': args.response,
+        'output_tokens': args.output_tokens,
+        'ttft_ms': args.ttft_ms,
+        'tokens_per_sec': args.tokens_per_sec,
+        'jitter': args.jitter,
+        'jitter_ms': args.jitter_ms,
+        'error_rates': {'429': args.rate_429, '500': args.rate_500, 'timeout': args.rate_timeout},
+        'timeout_s': args.timeout_s,
+        'seed': args.seed
+    }, args.host, args.port)
+    logger.info(f"Mock provider listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
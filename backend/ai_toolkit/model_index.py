@@ -0,0 +1,127 @@
+# ai_toolkit/model_index.py
+from typing import Dict, Any, Optional, Tuple, NamedTuple
+from .frozen import FrozenDict, freeze
+
+# Defaults applied when a model entry omits a sampling parameter
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 4000
+
+
+class ModelRecord(NamedTuple):
+    """Resolved, immutable parameters of one configured model"""
+
+    key: str
+    provider: Optional[str]
+    category: Optional[str]
+    model: str
+    temperature: float
+    max_tokens: int
+    reasoning_effort: Optional[str]
+    safety_settings: Any
+    system_prompt_key: Optional[str]
+    # System prompt text resolved from prompt.yaml
+    system_message: str
+    supports_system_prompt: bool
+    json_template: str
+    # The model's raw entry in config.yaml
+    config: FrozenDict
+    # Request parameters as returned by ModelManager.get_parameters
+    parameters: FrozenDict
+
+
+class ModelIndex:
+    """Lookup tables over the models of one configuration snapshot"""
+
+    __slots__ = ('by_key', 'by_provider_model', 'by_category', 'providers')
+
+    def __init__(self, config: Dict[str, Any], prompts: Dict[str, Any]):
+        """
+        Build the index for a configuration snapshot.
+
+        Args:
+            config (Dict[str, Any]): Frozen config.yaml contents
+            prompts (Dict[str, Any]): Frozen prompt.yaml contents
+        """
+        system_prompts = prompts.get('system_prompts') or {}
+        provider_mapping = config.get('provider_mapping') or {}
+
+        by_key = {}
+        by_provider_model = {}
+        by_category = {}
+        for key, model_data in (config.get('models') or {}).items():
+            record = _build_record(key, model_data, provider_mapping.get(key) or {}, system_prompts)
+            by_key[key] = record
+            # The first entry wins, as with the previous linear scan
+            by_provider_model.setdefault((record.provider, record.model), record)
+            by_category.setdefault(record.category, []).append(record)
+
+        # Provider of each model key; provider_mapping takes precedence over model entries
+        providers = {key: record.provider for key, record in by_key.items()}
+        providers.update({key: info.get('provider') for key, info in provider_mapping.items()})
+
+        self.by_key = by_key
+        self.by_provider_model = by_provider_model
+        self.by_category = {category: tuple(records) for category, records in by_category.items()}
+        self.providers = providers
+
+    def get(self, key: str) -> Optional[ModelRecord]:
+        """Record for a model key"""
+        return self.by_key.get(key)
+
+    def find(self, provider: str, model: str) -> Optional[ModelRecord]:
+        """Record for a provider and provider-side model id"""
+        return self.by_provider_model.get((provider, model))
+
+    def in_category(self, category: str) -> Tuple[ModelRecord, ...]:
+        """Records of all models in a category"""
+        return self.by_category.get(category, ())
+
+    def provider_of(self, key: str) -> Optional[str]:
+        """Provider serving a model key"""
+        return self.providers.get(key)
+
+
+def _build_record(key: str, model_data: Dict[str, Any], mapping: Dict[str, Any],
+                  system_prompts: Dict[str, str]) -> ModelRecord:
+    """Resolve one config.yaml model entry into a ModelRecord"""
+    provider = model_data.get('provider') or mapping.get('provider')
+    model = model_data.get('model', key)
+    temperature = model_data.get('temperature', DEFAULT_TEMPERATURE)
+    max_tokens = model_data.get('max_tokens', DEFAULT_MAX_TOKENS)
+
+    system_prompt_key = model_data.get('system_prompt_key')
+    if system_prompt_key:
+        system_message = system_prompts.get(system_prompt_key, '')
+    else:
+        system_message = model_data.get('system_message', '')
+
+    parameters = {
+        'model': model,
+        'temperature': temperature,
+        'max_tokens': max_tokens
+    }
+    # Add provider-specific parameters
+    if provider == 'google' and 'safety_settings' in model_data:
+        parameters['safety_settings'] = model_data['safety_settings']
+    # Add reasoning effort if available (used for o3-mini)
+    if 'reasoning_effort' in model_data:
+        parameters['reasoning_effort'] = model_data['reasoning_effort']
+    if system_message:
+        parameters['system_message'] = system_message
+
+    return ModelRecord(
+        key=key,
+        provider=provider,
+        category=model_data.get('category') or mapping.get('category'),
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        reasoning_effort=model_data.get('reasoning_effort'),
+        safety_settings=model_data.get('safety_settings'),
+        system_prompt_key=system_prompt_key,
+        system_message=system_message,
+        supports_system_prompt=model_data.get('supports_system_prompt', True),
+        json_template=model_data.get('json_template', 'default'),
+        config=model_data,
+        parameters=freeze(parameters)
+    )
@@ -1,318 +1,213 @@
 import os
-import yaml
+import time
 import base64
 import json
 import logging
-from typing import Dict, Any, Optional, List, Union
+import threading
+from typing import Dict, Any, Optional, List, Union, Tuple
 from datetime import datetime
 from pathlib import Path
+from .response_cache import ResponseCache, get_response_cache
+from .single_flight import get_single_flight
+from .provider_limiter import get_provider_limiter
+from .messages import build_conversation
+from .config_registry import get_config_registry
+from .frozen import thaw
+from .model_index import ModelRecord, DEFAULT_TEMPERATURE, DEFAULT_MAX_TOKENS
+from .metrics import get_metrics
+from .tokens import get_token_estimator
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Provider call metrics, recorded only while metrics are enabled
+_metrics = get_metrics()
+PROVIDER_REQUEST_SECONDS = _metrics.histogram(
+    'ai_provider_request_duration_seconds', 'Provider call latency by model', ('provider', 'model'))
+PROVIDER_TTFT_SECONDS = _metrics.histogram(
+    'ai_provider_time_to_first_token_seconds', 'Time to first token of streamed provider calls', ('provider', 'model'))
+PROVIDER_TOKENS = _metrics.counter(
+    'ai_provider_tokens_total', 'Tokens reported by providers by model and kind', ('provider', 'model', 'kind'))
+PROVIDER_ERRORS = _metrics.counter(
+    'ai_provider_errors_total', 'Failed provider calls by model', ('provider', 'model'))
+
+# Usage keys reported as token kinds
+USAGE_TOKEN_KINDS = (
+    ('input_tokens', 'input'),
+    ('output_tokens', 'output'),
+    ('cache_read_input_tokens', 'cache_read'),
+    ('cache_creation_input_tokens', 'cache_write'),
+    ('reasoning_tokens', 'reasoning')
+)
+
+# Model config 'pricing' keys (USD per million tokens) for each usage key
+PRICING_KEYS = (
+    ('input_tokens', 'input'),
+    ('output_tokens', 'output'),
+    ('cache_read_input_tokens', 'cache_read'),
+    ('cache_creation_input_tokens', 'cache_write')
+)
+
+# Environment variable holding the API key for each provider
+PROVIDER_API_KEYS = {
+    'openai': 'OPENAI_API_KEY',
+    'anthropic': 'ANTHROPIC_API_KEY',
+    'google': 'GENAI_API_KEY',
+    'xai': 'XAI_API_KEY',
+    # The local mock provider needs no key
+    'mock': None
+}
+
 class ModelManager:
     def __init__(self, config_dir: str = None):
         """
-        Initialize the ModelManager with configuration files.
+        Initialize the ModelManager on top of the shared configuration registry.
+        
+        Configuration is read from process-wide immutable snapshots, so every
+        instance sees the same files and changes made through any instance.
+        Model selections made with persist=False and parameter overrides from
+        set_parameters stay local to this instance.
         
         Args:
             config_dir (str, optional): Directory containing config files. Defaults to './configs/'.
         """
-        # Set default config directory if not provided
-        self.config_dir = config_dir or os.path.join(os.path.dirname(__file__), 'configs')
-        
-        # Ensure config directory exists
-        os.makedirs(self.config_dir, exist_ok=True)
+        self.registry = get_config_registry(config_dir)
+        self.config_dir = self.registry.config_dir
         
         # Define config file paths
-        self.config_path = os.path.join(self.config_dir, 'config.yaml')
-        self.prompt_path = os.path.join(self.config_dir, 'prompt.yaml')
-        self.json_template_path = os.path.join(self.config_dir, 'json_template.yaml')
+        self.config_path = self.registry.paths['config']
+        self.prompt_path = self.registry.paths['prompts']
+        self.json_template_path = self.registry.paths['json_templates']
         
-        # Load configurations
-        self.config = self._load_config(self.config_path)
-        self.prompts = self._load_config(self.prompt_path)
-        self.json_templates = self._load_config(self.json_template_path)
+        # Instance-local model selection and parameter overrides
+        self._selected_models = {}
+        self._parameter_overrides = {}
+        
+        # Model instances by model type, valid for one config snapshot version
+        self._instances = {}
+        self._instances_version = None
         
         # Initialize model instances
         self.current_model = None
         self.current_img_model = None
         
+        # Provider-reported token usage of the last generate_content call, per thread
+        self._usage_local = threading.local()
+        self.last_usage = None
+        
         # Don't initialize models at startup to avoid API key errors
         # Models will be initialized on-demand when needed
         logger.info(f"ModelManager initialized with configurations loaded")
 
-    def _load_config(self, config_path: str) -> Dict:
+    @property
+    def config(self) -> Dict:
+        """Current config.yaml contents (read-only)"""
+        return self.registry.snapshot().config
+
+    @property
+    def prompts(self) -> Dict:
+        """Current prompt.yaml contents (read-only)"""
+        return self.registry.snapshot().prompts
+
+    @property
+    def json_templates(self) -> Dict:
+        """Current json_template.yaml contents (read-only)"""
+        return self.registry.snapshot().json_templates
+
+    @property
+    def last_usage(self) -> Optional[Dict[str, Any]]:
+        """Usage record of the calling thread's last generate_content call"""
+        return getattr(self._usage_local, 'usage', None)
+
+    @last_usage.setter
+    def last_usage(self, usage: Optional[Dict[str, Any]]):
+        self._usage_local.usage = usage
+
+    def _get_model_instance(self, model_type: str):
         """
-        Load configuration from YAML file, or create default if not exists.
+        Get the model instance for a model type, creating it if its API key is available.
+        
+        Instances are rebuilt when the configuration snapshot changes, so edits to
+        model settings or system prompts made anywhere in the process take effect.
         
         Args:
-            config_path (str): Path to the configuration file
+            model_type (str): Model type (config key)
             
         Returns:
-            Dict: Configuration dictionary
+            Optional[AIModel]: Model instance, or None if it cannot be created
         """
-        if not os.path.exists(config_path):
-            # Create default config files based on file path
-            if 'config.yaml' in config_path:
-                self._create_default_config()
-            elif 'prompt.yaml' in config_path:
-                self._create_default_prompts()
-            elif 'json_template.yaml' in config_path:
-                self._create_default_json_templates()
-        
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
-        except Exception as e:
-            logger.error(f"Error loading config from {config_path}: {e}")
-            # Return empty dict as fallback
-            return {}
-
-    def _create_default_config(self):
-        """Create default configuration file"""
-        default_config = {
-            'current_model': 'gpt-4o',
-            'current_img_model': 'gpt-4o',
-            'json_mode': False,
-            'providers': {
-                'openai': {
-                    'gpt': ['gpt-4', 'gpt-4o', 'gpt-4.5'],
-                    'o3': ['o3-mini']
-                },
-                'anthropic': {
-                    'claude': ['claude-3-7-sonnet-latest', 'claude-3-5-haiku-latest']
-                },
-                'google': {
-                    'gemini': ['gemini-2.0-flash', 'gemini-1.5-pro']
-                },
-                'xai': {
-                    'grok': ['grok-3-latest']
-                }
-            },
-            'provider_mapping': {
-                'gpt-4': {'provider': 'openai', 'category': 'gpt'},
-                'gpt-4o': {'provider': 'openai', 'category': 'gpt'},
-                'gpt-4.5': {'provider': 'openai', 'category': 'gpt'},
-                'o3-mini': {'provider': 'openai', 'category': 'o3'},
-                'claude-3-7-sonnet-latest': {'provider': 'anthropic', 'category': 'claude'},
-                'claude-3-5-haiku-latest': {'provider': 'anthropic', 'category': 'claude'},
-                'gemini-2.0-flash': {'provider': 'google', 'category': 'gemini'},
-                'gemini-1.5-pro': {'provider': 'google', 'category': 'gemini'},
-                'grok-3-latest': {'provider': 'xai', 'category': 'grok'}
-            },
-            'models': {
-                'gpt-4o': {
-                    'provider': 'openai',
-                    'category': 'gpt',
-                    'model': 'gpt-4o',
-                    'max_tokens': 4000,
-                    'temperature': 0.7,
-                    'system_prompt_key': 'default_system',
-                    'supports_system_prompt': True
-                },
-                'o3-mini': {
-                    'provider': 'openai',
-                    'category': 'o3',
-                    'model': 'o3-mini',
-                    'max_tokens': 45000,
-                    'temperature': 0.7,
-                    'reasoning_effort': 'high',
-                    'system_prompt_key': 'default_system',
-                    'supports_system_prompt': False
-                },
-                'claude-3-7-sonnet-latest': {
-                    'provider': 'anthropic',
-                    'category': 'claude',
-                    'model': 'claude-3-7-sonnet-20240229',
-                    'max_tokens': 4000,
-                    'temperature': 0.7,
-                    'system_prompt_key': 'default_system',
-                    'supports_system_prompt': True
-                },
-                'gemini-2.0-flash': {
-                    'provider': 'google',
-                    'category': 'gemini',
-                    'model': 'gemini-2.0-flash',
-                    'max_tokens': 4000,
-                    'temperature': 0.7,
-                    'system_prompt_key': 'default_system',
-                    'supports_system_prompt': True
-                },
-                'grok-3-latest': {
-                    'provider': 'xai',
-                    'category': 'grok',
-                    'model': 'grok-3-latest',
-                    'max_tokens': 4000,
-                    'temperature': 0.7,
-                    'system_prompt_key': 'default_system',
-                    'supports_system_prompt': True
-                }
-            }
-        }
-        
-        self._save_config(self.config_path, default_config)
-
-    def _create_default_prompts(self):
-        """Create default prompts file"""
-        default_prompts = {
-            'system_prompts': {
-                'default_system': 'You are a helpful, accurate, and friendly AI assistant.',
-                'creative_system': 'You are a creative AI assistant that excels at generating imaginative content.',
-                'technical_system': 'You are a technical AI assistant that provides precise and accurate information.'
-            },
-            'user_prompts': {
-                'explain_ai': 'Explain the concept of artificial intelligence.',
-                'write_story': 'Write a short story about a character who discovers something unexpected.'
-            }
-        }
-        self._save_config(self.prompt_path, default_prompts)
-
-    def _create_default_json_templates(self):
-        """Create default JSON templates file"""
-        default_templates = {
-            'json_template': {
-                'default': {
-                    'response': '',
-                    'metadata': {
-                        'model': '',
-                        'timestamp': ''
-                    }
-                },
-                'detailed': {
-                    'response': {
-                        'content': '',
-                        'summary': ''
-                    },
-                    'metadata': {
-                        'model': '',
-                        'timestamp': '',
-                        'processing_time': ''
-                    }
-                }
-            }
-        }
-        self._save_config(self.json_template_path, default_templates)
-
-    def _save_config(self, config_path: str, config_data: Dict):
-        """
-        Save configuration to a YAML file.
-        
-        Args:
-            config_path (str): Path to save the configuration file
-            config_data (Dict): Configuration data to save
-        """
-        try:
-            os.makedirs(os.path.dirname(config_path), exist_ok=True)
-            with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(config_data, f, default_flow_style=False, allow_unicode=True)
-            logger.info(f"Created default configuration at {config_path}")
-        except Exception as e:
-            logger.error(f"Error saving config to {config_path}: {e}")
-
-    def _initialize_models(self):
-        """Initialize model instances based on current configuration"""
         # Import here to avoid circular imports
         from .ai_models import get_model_class
         
+        snapshot = self.registry.snapshot()
+        if snapshot.version != self._instances_version:
+            self._instances = {}
+            self._instances_version = snapshot.version
+        
+        if model_type in self._instances:
+            return self._instances[model_type]
+        
+        instance = None
         try:
-            # Get current model types from config
-            model_type = self.config.get('current_model', 'gpt')
-            img_model_type = self.config.get('current_img_model', model_type)
-            
-            # Get model configurations
-            model_config = self.config.get('models', {}).get(model_type, {})
-            img_model_config = self.config.get('models', {}).get(img_model_type, {})
-            
-            # Get provider mapping
-            provider_mapping = self.config.get('provider_mapping', {})
-            
-            # Inject system prompts if configured
-            if 'system_prompt_key' in model_config:
-                prompt_key = model_config['system_prompt_key']
-                system_prompt = self.prompts.get('system_prompts', {}).get(prompt_key, '')
-                model_config['system_message'] = system_prompt
-                
-            if 'system_prompt_key' in img_model_config:
-                prompt_key = img_model_config['system_prompt_key']
-                system_prompt = self.prompts.get('system_prompts', {}).get(prompt_key, '')
-                img_model_config['system_message'] = system_prompt
+            record = snapshot.index.get(model_type)
+            
+            # Work on a private copy; model instances adjust their config in place
+            model_config = thaw(record.config) if record else {}
             
-            # Get appropriate model classes with provider mapping
-            model_class = get_model_class(model_type, provider_mapping)
-            img_model_class = get_model_class(img_model_type, provider_mapping)
+            # Inject the resolved system prompt if configured
+            if record and record.system_prompt_key:
+                model_config['system_message'] = record.system_message
             
+            model_config.update(self._parameter_overrides.get(model_type, {}))
+            
+            # Get appropriate model class with provider mapping
+            model_class = get_model_class(model_type, snapshot.config.get('provider_mapping', {}))
             if model_class is None:
                 raise ValueError(f"Unsupported model type: {model_type}")
-                
-            if img_model_class is None:
-                raise ValueError(f"Unsupported image model type: {img_model_type}")
-            
-            # Check for required API keys before creating model instances
-            provider = model_config.get('provider', '')
-            img_provider = img_model_config.get('provider', '')
             
             # Only create model instances if required API keys are available
-            self.current_model = None
-            self.current_img_model = None
-            
-            try:
-                # Create model instances only if API keys are available
-                if provider == 'openai' and os.getenv('OPENAI_API_KEY'):
-                    self.current_model = model_class(model_config)
-                    logger.info(f"Initialized {model_type} model with provider {provider}")
-                elif provider == 'anthropic' and os.getenv('ANTHROPIC_API_KEY'):
-                    self.current_model = model_class(model_config)
-                    logger.info(f"Initialized {model_type} model with provider {provider}")
-                elif provider == 'google' and os.getenv('GENAI_API_KEY'):
-                    self.current_model = model_class(model_config)
-                    logger.info(f"Initialized {model_type} model with provider {provider}")
-                elif provider == 'xai' and os.getenv('XAI_API_KEY'):
-                    self.current_model = model_class(model_config)
-                    logger.info(f"Initialized {model_type} model with provider {provider}")
-                    
-                # Initialize image model if API key is available
-                if img_provider == 'openai' and os.getenv('OPENAI_API_KEY'):
-                    self.current_img_model = img_model_class(img_model_config)
-                    logger.info(f"Initialized {img_model_type} image model with provider {img_provider}")
-                elif img_provider == 'anthropic' and os.getenv('ANTHROPIC_API_KEY'):
-                    self.current_img_model = img_model_class(img_model_config)
-                    logger.info(f"Initialized {img_model_type} image model with provider {img_provider}")
-                elif img_provider == 'google' and os.getenv('GENAI_API_KEY'):
-                    self.current_img_model = img_model_class(img_model_config)
-                    logger.info(f"Initialized {img_model_type} image model with provider {img_provider}")
-                elif img_provider == 'xai' and os.getenv('XAI_API_KEY'):
-                    self.current_img_model = img_model_class(img_model_config)
-                    logger.info(f"Initialized {img_model_type} image model with provider {img_provider}")
-            except Exception as e:
-                logger.warning(f"Some models couldn't be initialized: {e}")
-                # Continue anyway - we'll check for None models when generating content
-                    
+            provider = model_config.get('provider', '')
+            api_key_var = PROVIDER_API_KEYS.get(provider)
+            if provider in PROVIDER_API_KEYS and (api_key_var is None or os.getenv(api_key_var)):
+                instance = model_class(model_config)
+                logger.info(f"Initialized {model_type} model with provider {provider}")
+        except Exception as e:
+            logger.warning(f"Model {model_type} couldn't be initialized: {e}")
+            # Continue anyway - we'll check for None models when generating content
+        
+        self._instances[model_type] = instance
+        return instance
+
+    def _initialize_models(self):
+        """Initialize model instances based on current configuration"""
+        try:
+            self.current_model = self._get_model_instance(self.get_current_model())
+            self.current_img_model = self._get_model_instance(self.get_current_img_model())
         except Exception as e:
             logger.error(f"Error initializing models: {e}")
             # Don't raise - this allows the app to start even if model initialization fails
             # We'll check for None models when generating content
 
-    def change_model(self, model_type: str, is_img_model: bool = False):
+    def change_model(self, model_type: str, is_img_model: bool = False, persist: bool = True):
         """
         Change the current model to the specified type.
         
         Args:
             model_type (str): Type of model to change to
             is_img_model (bool, optional): Whether to change the image model. Defaults to False.
+            persist (bool, optional): Save the selection to the shared configuration. If False,
+                only this instance switches models. Defaults to True.
         """
         if model_type not in self.config.get('models', {}):
             raise ValueError(f"Unsupported model type: {model_type}")
         
-        # Update config
-        if is_img_model:
-            self.config['current_img_model'] = model_type
+        key = 'current_img_model' if is_img_model else 'current_model'
+        if persist:
+            self.registry.update('config', lambda config: config.__setitem__(key, model_type))
+            self._selected_models.pop(key, None)
         else:
-            self.config['current_model'] = model_type
-        
-        # Save updated config
-        self._save_config(self.config_path, self.config)
+            self._selected_models[key] = model_type
         
         # Reinitialize models
         self._initialize_models()
@@ -326,8 +221,7 @@ class ModelManager:
         Args:
             enabled (bool, optional): Whether to enable JSON mode. Defaults to True.
         """
-        self.config['json_mode'] = enabled
-        self._save_config(self.config_path, self.config)
+        self.registry.update('config', lambda config: config.__setitem__('json_mode', enabled))
         logger.info(f"JSON mode {'enabled' if enabled else 'disabled'}")
 
     def get_current_model(self) -> str:
@@ -337,7 +231,7 @@ class ModelManager:
         Returns:
             str: Current model type
         """
-        return self.config.get('current_model', 'gpt')
+        return self._selected_models.get('current_model') or self.config.get('current_model', 'gpt')
     # Method to get all model configs
     def get_all_model_configs(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -359,7 +253,57 @@ class ModelManager:
         Returns:
             Optional[Dict[str, Any]]: Model configuration or None if not found
         """
-        return self.config.get('models', {}).get(model_name)
+        record = self.registry.snapshot().index.get(model_name)
+        return record.config if record else None
+
+    def get_model_record(self, model_type: str) -> Optional[ModelRecord]:
+        """
+        Get the resolved parameter record of a model.
+        
+        Args:
+            model_type (str): Model type (config key)
+            
+        Returns:
+            Optional[ModelRecord]: Frozen record, or None if the model is not configured
+        """
+        return self.registry.snapshot().index.get(model_type)
+
+    def find_model(self, provider: str, model: str) -> Optional[ModelRecord]:
+        """
+        Find the record of a model by provider and provider-side model id.
+        
+        Args:
+            provider (str): Provider name
+            model (str): Model id, e.g. 'claude-3-7-sonnet-20250219'
+            
+        Returns:
+            Optional[ModelRecord]: Frozen record, or None if no model matches
+        """
+        return self.registry.snapshot().index.find(provider, model)
+
+    def get_models_in_category(self, category: str) -> Tuple[ModelRecord, ...]:
+        """
+        Get the records of all models in a category.
+        
+        Args:
+            category (str): Category name, e.g. 'claude'
+            
+        Returns:
+            Tuple[ModelRecord, ...]: Frozen records in configuration order
+        """
+        return self.registry.snapshot().index.in_category(category)
+
+    def get_provider(self, model_type: str) -> Optional[str]:
+        """
+        Get the provider serving a model.
+        
+        Args:
+            model_type (str): Model type (config key)
+            
+        Returns:
+            Optional[str]: Provider name, or None if unknown
+        """
+        return self.registry.snapshot().index.provider_of(model_type)
     
     def get_current_img_model(self) -> str:
         """
@@ -368,7 +312,9 @@ class ModelManager:
         Returns:
             str: Current image model type
         """
-        return self.config.get('current_img_model', self.config.get('current_model', 'gpt'))
+        config = self.config
+        return (self._selected_models.get('current_img_model')
+                or config.get('current_img_model', self.get_current_model()))
     
     def get_parameters(self, provider: str, model: str) -> Dict[str, Any]:
         """
@@ -379,43 +325,27 @@ class ModelManager:
             model (str): Model name
             
         Returns:
-            Dict[str, Any]: Model parameters
-        """
-        # Lookup in model configuration
-        models_config = self.config.get('models', {})
-        for model_key, model_data in models_config.items():
-            if model_data.get('provider') == provider and model_data.get('model') == model:
-                parameters = {
-                    'model': model,
-                    'temperature': model_data.get('temperature', 0.7),
-                    'max_tokens': model_data.get('max_tokens', 4000)
-                }
-                
-                # Add provider-specific parameters
-                if provider == 'google' and 'safety_settings' in model_data:
-                    parameters['safety_settings'] = model_data['safety_settings']
-                
-                # Add reasoning effort if available (used for o3-mini)
-                if 'reasoning_effort' in model_data:
-                    parameters['reasoning_effort'] = model_data['reasoning_effort']
-                    
-                # Add reasoning if available (used for gemini)
-                if 'system_message' in model_data:
-                    parameters['system_message'] = model_data['system_message']
-                    
-                return parameters
+            Dict[str, Any]: Model parameters (read-only for configured models)
+        """
+        # Records are resolved when the configuration snapshot is loaded
+        record = self.registry.snapshot().index.find(provider, model)
+        if record is not None:
+            return record.parameters
                 
         # Return default parameters if not found
         return {
             'model': model,
-            'temperature': 0.7,
-            'max_tokens': 4000
+            'temperature': DEFAULT_TEMPERATURE,
+            'max_tokens': DEFAULT_MAX_TOKENS
         }
     
     def set_parameters(self, temperature=None, max_tokens=None):
         """
         Set model parameters like temperature and max_tokens for the current model.
         
+        The values apply to this ModelManager instance only; use
+        update_model_parameters to change the shared configuration.
+        
         Args:
             temperature (float, optional): Temperature for text generation
             max_tokens (int, optional): Maximum tokens for generation
@@ -427,36 +357,46 @@ class ModelManager:
             logger.warning("Cannot set parameters: No current model is selected")
             return False
             
-        # Get current model details
-        model_type = self.config.get('current_model')
-        model_config = self.config.get('models', {}).get(model_type, {})
-        
-        # Update model configuration with new parameters
+        model_params = {}
         if temperature is not None:
-            model_config['temperature'] = float(temperature)
-            
+            model_params['temperature'] = float(temperature)
         if max_tokens is not None:
-            model_config['max_tokens'] = int(max_tokens)
+            model_params['max_tokens'] = int(max_tokens)
+        
+        # Remember the overrides so rebuilt instances keep them
+        model_type = self.get_current_model()
+        self._parameter_overrides.setdefault(model_type, {}).update(model_params)
             
         # Set the parameters directly on the model instance if available
         if hasattr(self.current_model, 'set_parameters'):
             try:
-                model_params = {}
-                if temperature is not None:
-                    model_params['temperature'] = float(temperature)
-                if max_tokens is not None:
-                    model_params['max_tokens'] = int(max_tokens)
-                    
                 self.current_model.set_parameters(**model_params)
             except Exception as e:
                 logger.error(f"Error setting parameters on model: {e}")
                 return False
-                
-        # Update the configuration
-        self.config['models'][model_type] = model_config
         
         return True
 
+    def update_model_parameters(self, model_type: str, parameters: Dict[str, Any]):
+        """
+        Update parameters of a model in the shared configuration.
+        
+        Args:
+            model_type (str): Model type to update
+            parameters (Dict[str, Any]): Parameters to set; only temperature and max_tokens are applied
+        """
+        if model_type not in self.config.get('models', {}):
+            raise ValueError(f"Unknown model: {model_type}")
+        
+        def apply(config):
+            model_config = config['models'][model_type]
+            for key, value in parameters.items():
+                if key in ['temperature', 'max_tokens']:
+                    model_config[key] = value
+        
+        self.registry.update('config', apply)
+        logger.info(f"Updated parameters for {model_type}")
+
     def _prepare_json_template(self, model_type: str) -> Dict:
         """
         Prepare JSON template with metadata.
@@ -468,8 +408,9 @@ class ModelManager:
             Dict: Prepared JSON template
         """
         # Get template from config or use default
-        template_name = self.config.get('models', {}).get(model_type, {}).get('json_template', 'default')
-        template = self.json_templates.get('json_template', {}).get(template_name, {})
+        record = self.get_model_record(model_type)
+        template_name = record.json_template if record else 'default'
+        template = thaw(self.json_templates.get('json_template', {}).get(template_name, {}))
         
         if not template:
             # Fallback to minimal template
@@ -488,62 +429,90 @@ class ModelManager:
             
         return template
 
-    def generate_content(self, prompt: Union[str, Dict], use_img_model: bool = False) -> str:
+    def generate_content(self, prompt: Union[str, Dict], use_img_model: bool = False, cache: Optional[bool] = None,
+                         model_type: Optional[str] = None, raise_errors: bool = False) -> str:
         """
         Generate content from the current model using the provided prompt.
         
         Args:
             prompt (Union[str, Dict]): Prompt for content generation
             use_img_model (bool, optional): Whether to use the image model. Defaults to False.
+            cache (Optional[bool], optional): Force the response cache on or off. By default only
+                requests with temperature 0 are cached.
+            model_type (Optional[str], optional): Model to use instead of the current model,
+                without changing the selection. Defaults to None.
+            raise_errors (bool, optional): Raise provider and configuration errors instead of
+                returning them as error text. Defaults to False.
             
         Returns:
             str: Generated content
         """
-        # Determine which model to use
-        model_type = self.get_current_img_model() if use_img_model else self.get_current_model()
-        provider = self.config.get('models', {}).get(model_type, {}).get('provider', '')
+        self.last_usage = None
         
-        # Try to initialize models if they aren't already initialized
-        if self.current_model is None or self.current_img_model is None:
-            try:
-                self._initialize_models()
-            except Exception as e:
-                logger.warning(f"Model initialization attempt failed: {e}")
-                # Continue - we'll check the specific model below
+        # Determine which model to use
+        if model_type is None:
+            model_type = self.get_current_img_model() if use_img_model else self.get_current_model()
+        provider = self.get_provider(model_type) or ''
         
-        # Get the appropriate model based on use_img_model flag
-        model = self.current_img_model if use_img_model else self.current_model
+        # Get the model instance, initializing it on first use or after a config change
+        model = self._get_model_instance(model_type)
         
         # Check if required model is available
         if model is None:
-            # Check which API key is missing
-            if provider == 'openai':
-                api_key = os.getenv('OPENAI_API_KEY')
-                if not api_key:
-                    return f"Error: OpenAI API key not found. Please provide an API key for {provider}."
-            elif provider == 'anthropic':
-                api_key = os.getenv('ANTHROPIC_API_KEY')
-                if not api_key:
-                    return f"Error: Anthropic API key not found. Please provide an API key for {provider}."
-            elif provider == 'google':
-                api_key = os.getenv('GENAI_API_KEY')
-                if not api_key:
-                    return f"Error: Google AI API key not found. Please provide an API key for {provider}."
-            elif provider == 'xai':
-                api_key = os.getenv('XAI_API_KEY')
-                if not api_key:
-                    return f"Error: xAI API key not found. Please provide an API key for {provider}."
-            return f"Error: Model {model_type} could not be initialized. Please check API keys and try again."
+            error = self._unavailable_model_error(model_type, provider)
+            if raise_errors:
+                raise ValueError(error)
+            return error
         
         # Check for JSON mode
         json_mode = self.config.get('json_mode', False)
         
-        # Format messages based on provider
-        formatted_prompt = self._format_prompt_for_provider(prompt, provider, model_type, json_mode)
+        # Build the canonical conversation once; providers serialize it directly
+        try:
+            conversation = build_conversation(prompt, model.model_config.get('system_message', ''))
+        except TypeError as e:
+            logger.error(f"Invalid prompt: {e}")
+            if raise_errors:
+                raise
+            return f"Error generating content: {e}"
+        
+        # Identify the request by its normalized messages, model and sampling parameters
+        cache_params = self._get_cache_params(model, json_mode)
+        request_key = ResponseCache.make_key(conversation, model_type, cache_params)
+        
+        # Serve repeated deterministic requests from the response cache
+        response_cache = get_response_cache()
+        cache_key = None
+        if response_cache.enabled:
+            use_cache = cache if cache is not None else cache_params.get('temperature') == 0
+            if use_cache:
+                cache_key = request_key
+                cached_response = response_cache.get(cache_key)
+                if cached_response is not None:
+                    logger.info(f"Response cache hit for {model_type}")
+                    return cached_response
         
         try:
-            # Generate content
-            response = model.generate_content(formatted_prompt)
+            provider_limit = self.config.get('provider_limits', {}).get(provider)
+            
+            def call_provider():
+                # Respect the provider's concurrency limit across all managers
+                with get_provider_limiter().limit(provider, provider_limit):
+                    started = time.perf_counter()
+                    try:
+                        content = model.generate_content(conversation)
+                    except Exception:
+                        PROVIDER_ERRORS.inc(1, provider, model_type)
+                        raise
+                    self._record_provider_metrics(provider, model_type, time.perf_counter() - started, model.last_usage)
+                self._calibrate_estimator(provider, model_type, conversation, model.last_usage)
+                return content, model.last_usage
+            
+            # Generate content, sharing one provider call among identical concurrent requests
+            (response, usage), shared = get_single_flight().do(request_key, call_provider)
+            
+            # Usage is attributed only to the caller that actually paid for the request
+            self.last_usage = None if shared else self._usage_record(model, model_type, usage)
             
             # Process JSON response if in JSON mode
             if json_mode:
@@ -587,10 +556,15 @@ class ModelManager:
                             }
                         }, ensure_ascii=False, indent=2)
             
+            if cache_key is not None:
+                response_cache.set(cache_key, response)
+            
             return response
             
         except Exception as e:
             logger.error(f"Error generating content: {e}")
+            if raise_errors:
+                raise
             error_msg = str(e)
             
             # Check for specific API key errors
@@ -608,61 +582,149 @@ class ModelManager:
             else:
                 return f"Error generating content: {error_msg}"
 
-    def _format_prompt_for_provider(self, prompt, provider, model_type, json_mode=False):
-        """Format the prompt based on the provider's requirements"""
-        # If already formatted correctly, return as is
-        if isinstance(prompt, dict) and "messages" in prompt:
-            # For OpenAI, ensure user messages have the right format
-            if provider == 'openai':
-                for i, message in enumerate(prompt["messages"]):
-                    if message.get("role") == "user" and isinstance(message.get("content"), str):
-                        prompt["messages"][i]["content"] = [{"type": "text", "text": message["content"]}]
-            return prompt
-        
-        # If it's a list of messages
-        if isinstance(prompt, list):
-            # For OpenAI, ensure user messages have the right format
-            if provider == 'openai':
-                for i, message in enumerate(prompt):
-                    if message.get("role") == "user" and isinstance(message.get("content"), str):
-                        prompt[i]["content"] = [{"type": "text", "text": message["content"]}]
-            return prompt
+    def generate_with_usage(self, prompt: Union[str, Dict], **kwargs) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Generate content and return it with the usage record of the call.
+        
+        Safe to use from several threads sharing one manager, unlike reading
+        last_usage after a call made by another thread.
         
-        # If it's a string, convert to proper format
-        if isinstance(prompt, str):
-            system_message = self.current_model.model_config.get('system_message', '') if self.current_model else ''
+        Args:
+            prompt (Union[str, Dict]): Prompt for content generation
+            **kwargs: Options accepted by generate_content
             
-            if provider == 'openai' or provider == 'xai':
-                messages = []
-                if system_message:
-                    messages.append({"role": "system", "content": system_message})
-                messages.append({
-                    "role": "user",
-                    "content": [{"type": "text", "text": prompt}]
-                })
-                return {"messages": messages}
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]]]: Generated content and its usage record, or None
+                when no provider call was paid for (cache hit, shared call or error)
+        """
+        content = self.generate_content(prompt, **kwargs)
+        return content, self.last_usage
+
+    def estimate_tokens(self, prompt: Union[str, Dict, List], model_type: Optional[str] = None) -> int:
+        """
+        Estimate the input tokens of a prompt for a model, using the calibrated estimator of its provider.
+        
+        Args:
+            prompt (Union[str, Dict, List]): Prompt in any form accepted by generate_content
+            model_type (Optional[str], optional): Model to estimate for. Defaults to the current model.
             
-            elif provider == 'anthropic':
-                if system_message:
-                    return {
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "system": system_message
-                    }
-                else:
-                    return {
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ]
-                    }
+        Returns:
+            int: Estimated input tokens
+        """
+        model_type = model_type or self.get_current_model()
+        record = self.get_model_record(model_type)
+        default_system = record.config.get('system_message', '') if record else ''
+        estimator = get_token_estimator(self.get_provider(model_type))
+        return estimator.estimate(estimator.count_conversation(build_conversation(prompt, default_system)), model_type)
+
+    def _calibrate_estimator(self, provider: str, model_type: str, conversation, usage: Optional[Dict[str, Any]]):
+        """
+        Record the estimate for a request in its usage and calibrate the estimator with the reported count.
+        
+        Args:
+            provider (str): Provider name
+            model_type (str): Model type
+            conversation: Canonical conversation that was sent
+            usage (Optional[Dict[str, Any]]): Usage reported by the model, if any
+        """
+        if not usage:
+            return
+        estimator = get_token_estimator(provider)
+        raw_count = estimator.count_conversation(conversation)
+        usage['estimated_input_tokens'] = estimator.estimate(raw_count, model_type)
+        reported = sum(usage.get(key, 0) or 0 for key in
+                       ('input_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens'))
+        estimator.calibrate(model_type, raw_count, reported)
+
+    def _usage_record(self, model, model_type: str, usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Build the usage record of a provider call.
+        
+        Args:
+            model: Model instance that made the call
+            model_type (str): Model type
+            usage (Optional[Dict[str, Any]]): Usage reported by the model
             
-            # For other providers, return as is
-            return prompt
+        Returns:
+            Optional[Dict[str, Any]]: Token counts, latency and model, plus cost_usd when the
+                model config has 'pricing' (USD per million tokens)
+        """
+        if not usage:
+            return None
+        
+        record = dict(usage, model=model_type)
+        pricing = model.model_config.get('pricing')
+        if pricing:
+            record['cost_usd'] = sum(
+                (usage.get(key, 0) or 0) * float(pricing.get(price_key, pricing.get('input', 0)) or 0)
+                for key, price_key in PRICING_KEYS
+            ) / 1_000_000
+        return record
+
+    def _record_provider_metrics(self, provider: str, model_type: str, seconds: float, usage: Optional[Dict[str, Any]]):
+        """
+        Record latency and token usage of a provider call.
         
-        # Default case, return unchanged
-        return prompt
-    
+        Args:
+            provider (str): Provider name
+            model_type (str): Model type
+            seconds (float): Call duration
+            usage (Optional[Dict[str, Any]]): Usage reported by the model, if any
+        """
+        if not _metrics.enabled:
+            return
+        PROVIDER_REQUEST_SECONDS.observe(seconds, provider, model_type)
+        if not usage:
+            return
+        for key, kind in USAGE_TOKEN_KINDS:
+            if usage.get(key):
+                PROVIDER_TOKENS.inc(usage[key], provider, model_type, kind)
+        if usage.get('ttft_ms') is not None:
+            PROVIDER_TTFT_SECONDS.observe(usage['ttft_ms'] / 1000, provider, model_type)
+
+    def _get_cache_params(self, model, json_mode: bool) -> Dict[str, Any]:
+        """
+        Collect the model settings that influence a response, for use in cache keys.
+        
+        Args:
+            model: Initialized model instance
+            json_mode (bool): Whether JSON mode is enabled
+            
+        Returns:
+            Dict[str, Any]: Model name and sampling parameters
+        """
+        model_config = model.model_config
+        return {
+            'model': model_config.get('model'),
+            'temperature': model_config.get('temperature'),
+            'max_tokens': model_config.get('max_tokens'),
+            'reasoning_effort': model_config.get('reasoning_effort'),
+            'system_message': model_config.get('system_message', ''),
+            'json_mode': json_mode
+        }
+
+    def _unavailable_model_error(self, model_type: str, provider: str) -> str:
+        """
+        Describe why a model instance could not be created.
+        
+        Args:
+            model_type (str): Model type
+            provider (str): Provider of the model
+            
+        Returns:
+            str: Error message
+        """
+        # Check which API key is missing
+        if provider == 'openai' and not os.getenv('OPENAI_API_KEY'):
+            return f"Error: OpenAI API key not found. Please provide an API key for {provider}."
+        elif provider == 'anthropic' and not os.getenv('ANTHROPIC_API_KEY'):
+            return f"Error: Anthropic API key not found. Please provide an API key for {provider}."
+        elif provider == 'google' and not os.getenv('GENAI_API_KEY'):
+            return f"Error: Google AI API key not found. Please provide an API key for {provider}."
+        elif provider == 'xai' and not os.getenv('XAI_API_KEY'):
+            return f"Error: xAI API key not found. Please provide an API key for {provider}."
+        return f"Error: Model {model_type} could not be initialized. Please check API keys and try again."
+
     def generate_content_with_image(self, prompt: str, image_path: str) -> str:
         """
         Generate content using the current image model with an image.
@@ -677,16 +739,12 @@ class ModelManager:
         model_type = self.get_current_img_model()
         json_mode = self.config.get('json_mode', False)
         
-        # Try to initialize models if they aren't already initialized
-        if self.current_img_model is None:
-            try:
-                self._initialize_models()
-            except Exception as e:
-                logger.warning(f"Model initialization attempt failed: {e}")
+        # Get the image model, initializing it on first use or after a config change
+        self.current_img_model = self._get_model_instance(model_type)
         
         # Check if image model is available
         if self.current_img_model is None:
-            provider = self.config.get('models', {}).get(model_type, {}).get('provider', '')
+            provider = self.get_provider(model_type) or ''
             if provider == 'openai':
                 return f"Error: OpenAI API key not found. Please provide an API key for {provider}."
             elif provider == 'anthropic':
@@ -703,7 +761,7 @@ class ModelManager:
                 image_data = f.read()
             
             # Prepare based on model provider
-            provider = self.config.get('models', {}).get(model_type, {}).get('provider', '')
+            provider = self.get_provider(model_type) or ''
             
             if provider == 'google':
                 # Gemini model handling
@@ -816,8 +874,9 @@ class ModelManager:
             raise ValueError(f"Unknown system prompt key: {prompt_key}")
         
         # Update config
-        self.config['models'][model_type]['system_prompt_key'] = prompt_key
-        self._save_config(self.config_path, self.config)
+        self.registry.update(
+            'config', lambda config: config['models'][model_type].__setitem__('system_prompt_key', prompt_key)
+        )
         
         # Reinitialize models
         self._initialize_models()
@@ -832,10 +891,24 @@ class ModelManager:
             key (str): Key for the new system prompt
             prompt (str): System prompt text
         """
-        if 'system_prompts' not in self.prompts:
-            self.prompts['system_prompts'] = {}
+        self.registry.update('prompts', lambda prompts: prompts.setdefault('system_prompts', {}).__setitem__(key, prompt))
+        
+        logger.info(f"Added system prompt: {key}")
+
+    def delete_system_prompt(self, key: str) -> bool:
+        """
+        Delete a system prompt.
+        
+        Args:
+            key (str): Key of the system prompt to delete
             
-        self.prompts['system_prompts'][key] = prompt
-        self._save_config(self.prompt_path, self.prompts)
+        Returns:
+            bool: True if the prompt existed and was deleted
+        """
+        if key not in self.prompts.get('system_prompts', {}):
+            return False
         
-        logger.info(f"Added system prompt: {key}")
\ No newline at end of file
+        self.registry.update('prompts', lambda prompts: prompts.get('system_prompts', {}).pop(key, None))
+        
+        logger.info(f"Deleted system prompt: {key}")
+        return True
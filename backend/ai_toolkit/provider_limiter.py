@@ -0,0 +1,83 @@
+# ai_toolkit/provider_limiter.py
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class ProviderLimiter:
+    """Caps the number of concurrent requests sent to each provider"""
+
+    def __init__(self, default_limit: int = 8):
+        """
+        Initialize the limiter.
+
+        Args:
+            default_limit (int, optional): Concurrent requests allowed per provider when
+                no explicit limit is given. Defaults to 8.
+        """
+        self.default_limit = default_limit
+        self._cond = threading.Condition()
+        self._active = {}
+        self._waiting = {}
+        self._limits = {}
+
+    @contextmanager
+    def limit(self, provider: str, max_concurrent: Optional[int] = None):
+        """
+        Hold one of the provider's request slots for the duration of the block.
+
+        The limit is passed on every call, so changes in the configuration apply
+        to the next request without rebuilding the limiter.
+
+        Args:
+            provider (str): Provider name
+            max_concurrent (Optional[int], optional): Concurrent request limit. Defaults to default_limit.
+        """
+        limit = max(1, int(max_concurrent or self.default_limit))
+        with self._cond:
+            self._limits[provider] = limit
+            if self._active.get(provider, 0) >= limit:
+                self._waiting[provider] = self._waiting.get(provider, 0) + 1
+                try:
+                    while self._active.get(provider, 0) >= limit:
+                        self._cond.wait()
+                finally:
+                    self._waiting[provider] -= 1
+            self._active[provider] = self._active.get(provider, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[provider] -= 1
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get per-provider concurrency.
+
+        Returns:
+            Dict[str, Any]: Active requests, waiting callers and limit for each provider
+        """
+        with self._cond:
+            return {
+                provider: {
+                    'active': self._active.get(provider, 0),
+                    'waiting': self._waiting.get(provider, 0),
+                    'limit': limit
+                }
+                for provider, limit in self._limits.items()
+            }
+
+
+# Process-wide limiter shared by every ModelManager instance
+_provider_limiter = ProviderLimiter()
+
+
+def get_provider_limiter() -> ProviderLimiter:
+    """Get the process-wide provider limiter"""
+    return _provider_limiter
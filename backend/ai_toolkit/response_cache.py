@@ -0,0 +1,264 @@
+# ai_toolkit/response_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Union, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """LRU cache with TTL for deterministic model responses, with an optional on-disk tier"""
+
+    def __init__(self, max_size: int = 50, ttl: int = 3600, disk_dir: Optional[str] = None):
+        """
+        Initialize the response cache.
+
+        Args:
+            max_size (int, optional): Maximum number of in-memory entries. Defaults to 50.
+            ttl (int, optional): Entry lifetime in seconds (0 disables expiry). Defaults to 3600.
+            disk_dir (Optional[str], optional): Directory for the persistent tier. Defaults to None.
+        """
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.configure(max_size, ttl, disk_dir)
+
+    def configure(self, max_size: int = 50, ttl: int = 3600, disk_dir: Optional[str] = None):
+        """
+        Reconfigure cache limits and the on-disk tier.
+
+        Args:
+            max_size (int, optional): Maximum number of in-memory entries. Defaults to 50.
+            ttl (int, optional): Entry lifetime in seconds (0 disables expiry). Defaults to 3600.
+            disk_dir (Optional[str], optional): Directory for the persistent tier. Defaults to None.
+        """
+        with self._lock:
+            self.max_size = max(0, int(max_size))
+            self.ttl = max(0, int(ttl))
+            self.disk_dir = disk_dir or None
+            if self.disk_dir:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            self._evict_overflow()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 or bool(self.disk_dir)
+
+    @staticmethod
+    def make_key(prompt: Union[str, Dict, List], model: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Build a cache key from the normalized prompt, model and sampling parameters.
+
+        Args:
+            prompt (Union[str, Dict, List]): Prompt in any format accepted by ModelManager, or a Conversation
+            model (str): Model key
+            params (Optional[Dict[str, Any]], optional): Sampling parameters. Defaults to None.
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        payload = {
+            'model': model,
+            'params': params or {},
+            'prompt': _normalize_prompt(prompt)
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response, checking memory first and then disk.
+
+        Args:
+            key (str): Cache key from make_key
+
+        Returns:
+            Optional[str]: Cached response or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_fresh(entry[0], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, entry[0], entry[1])
+            return entry[1]
+
+    def set(self, key: str, value: str):
+        """
+        Store a response in memory and, if configured, on disk.
+
+        Args:
+            key (str): Cache key from make_key
+            value (str): Response text
+        """
+        created_at = time.time()
+        with self._lock:
+            self._store(key, created_at, value)
+        self._write_disk(key, created_at, value)
+
+    def clear(self):
+        """Remove all entries from memory and disk and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            disk_dir = self.disk_dir
+        if disk_dir and os.path.isdir(disk_dir):
+            for filename in os.listdir(disk_dir):
+                if filename.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(disk_dir, filename))
+                    except OSError:
+                        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache hit-ratio metrics.
+
+        Returns:
+            Dict[str, Any]: Entry count, limits, hit/miss counters and hit ratio
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'disk_enabled': bool(self.disk_dir),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def _is_fresh(self, created_at: float, now: float) -> bool:
+        return not self.ttl or now - created_at < self.ttl
+
+    def _store(self, key: str, created_at: float, value: str):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        self._evict_overflow()
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float):
+        path = self._disk_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            created_at = data['created_at']
+            if not self._is_fresh(created_at, now):
+                os.remove(path)
+                return None
+            return created_at, data['value']
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _write_disk(self, key: str, created_at: float, value: str):
+        path = self._disk_path(key)
+        if not path:
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'created_at': created_at, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not persist cache entry {path}: {e}")
+
+
+def _normalize_prompt(prompt: Union[str, Dict, List]) -> Any:
+    """Reduce the different prompt shapes to a stable structure of plain strings"""
+    if hasattr(prompt, 'cache_repr'):
+        return prompt.cache_repr()
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, dict):
+        normalized = {k: v for k, v in prompt.items() if k != 'messages'}
+        if 'messages' in prompt:
+            normalized['messages'] = _normalize_messages(prompt['messages'])
+        return normalized
+    if isinstance(prompt, list):
+        return _normalize_messages(prompt)
+    return repr(prompt)
+
+
+def _normalize_messages(messages: List) -> List:
+    normalized = []
+    for msg in messages:
+        if not isinstance(msg, dict):
+            normalized.append(msg)
+            continue
+        content = msg.get('content', '')
+        # OpenAI-style content arrays and plain strings hash identically
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if isinstance(part, dict) and part.get('type', 'text') == 'text':
+                    parts.append(part.get('text', ''))
+                else:
+                    parts.append(part)
+            content = parts[0] if len(parts) == 1 and isinstance(parts[0], str) else parts
+        normalized.append([msg.get('role', ''), content])
+    return normalized
+
+
+# Process-wide cache shared by every ModelManager instance
+_response_cache = ResponseCache()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache"""
+    return _response_cache
+
+
+def configure_response_cache(max_size: int = 50, ttl: int = 3600, disk_dir: Optional[str] = None) -> ResponseCache:
+    """
+    Configure the process-wide response cache.
+
+    Args:
+        max_size (int, optional): Maximum number of in-memory entries. Defaults to 50.
+        ttl (int, optional): Entry lifetime in seconds. Defaults to 3600.
+        disk_dir (Optional[str], optional): Directory for the persistent tier. Defaults to None.
+
+    Returns:
+        ResponseCache: The configured cache
+    """
+    _response_cache.configure(max_size, ttl, disk_dir)
+    logger.info(f"Response cache configured: max_size={max_size}, ttl={ttl}, disk_dir={disk_dir or 'disabled'}")
+    return _response_cache
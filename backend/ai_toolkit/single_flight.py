@@ -0,0 +1,99 @@
+# ai_toolkit/single_flight.py
+import logging
+import threading
+from typing import Dict, Any, Callable, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """A provider request that is currently in flight"""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        The first caller executes fn; callers arriving while it is in flight wait
+        for it and receive the same result, or have the same exception re-raised.
+        Nothing is retained once the call completes, so later calls run again.
+
+        Args:
+            key (str): Request identity, e.g. a response cache key
+            fn (Callable[[], Any]): Function performing the request
+
+        Returns:
+            Tuple[Any, bool]: The result and whether it was shared from another caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                logger.info(f"Shared one provider call with {call.waiters} concurrent duplicate request(s)")
+            call.done.set()
+        return call.result, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing metrics.
+
+        Returns:
+            Dict[str, Any]: In-flight count, executions and coalesced callers
+        """
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
+
+
+# Process-wide registry of in-flight provider requests
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Get the process-wide single-flight group"""
+    return _single_flight
@@ -0,0 +1,240 @@
+# ai_toolkit/tokens.py
+import os
+import re
+import logging
+import threading
+from typing import Dict, Any, Optional, Union, Tuple
+
+from .messages import Conversation, message_text
+
+# tiktoken is optional; its tables are only used when they are available offline
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tokenizer family of each provider
+PROVIDER_FAMILIES = {
+    'openai': 'openai',
+    'xai': 'openai',
+    'mock': 'openai',
+    'anthropic': 'anthropic',
+    'google': 'gemini'
+}
+
+# Heuristic parameters per family: ASCII characters per token, tokens per CJK/Hangul
+# character, tokens per other non-ASCII character, per-message overhead and per-image cost
+FAMILY_PARAMETERS = {
+    'openai': {'ascii_chars_per_token': 4.0, 'cjk_tokens': 1.0, 'other_tokens': 0.5,
+               'message_overhead': 4, 'image_tokens': 765},
+    'anthropic': {'ascii_chars_per_token': 3.5, 'cjk_tokens': 1.2, 'other_tokens': 0.6,
+                  'message_overhead': 3, 'image_tokens': 1600},
+    'gemini': {'ascii_chars_per_token': 4.0, 'cjk_tokens': 0.8, 'other_tokens': 0.5,
+               'message_overhead': 0, 'image_tokens': 258}
+}
+
+# Calibration: smoothing of the observed/estimated ratio, its bounds, and the smallest
+# request that is trusted to update it
+CALIBRATION_ALPHA = 0.1
+CALIBRATION_BOUNDS = (0.5, 2.0)
+CALIBRATION_MIN_TOKENS = 50
+
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+_CJK = re.compile(r'[\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+class TokenEstimator:
+    """Estimates token counts for one tokenizer family and calibrates them against provider usage"""
+
+    def __init__(self, family: str, encoding=None):
+        """
+        Initialize the estimator.
+
+        Args:
+            family (str): Tokenizer family ('openai', 'anthropic' or 'gemini')
+            encoding (optional): tiktoken encoding used instead of the heuristic for text. Defaults to None.
+        """
+        self.family = family
+        self.params = FAMILY_PARAMETERS.get(family, FAMILY_PARAMETERS['openai'])
+        self.encoding = encoding
+        # Key under which raw counts are cached on messages
+        self.cache_key = f"{family}:tiktoken" if encoding is not None else family
+        self._lock = threading.Lock()
+        self._factors = {}  # Calibration factor by model type
+        self._samples = {}
+
+    def count_text(self, text: str) -> int:
+        """
+        Count the tokens of a text, without calibration.
+
+        Args:
+            text (str): Text
+
+        Returns:
+            int: Token count
+        """
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+
+        non_ascii = len(_NON_ASCII.findall(text))
+        cjk = len(_CJK.findall(text)) if non_ascii else 0
+        estimate = ((len(text) - non_ascii) / self.params['ascii_chars_per_token']
+                    + cjk * self.params['cjk_tokens']
+                    + (non_ascii - cjk) * self.params['other_tokens'])
+        return max(1, int(estimate + 0.5))
+
+    def count_content(self, content: Union[str, Tuple[Dict[str, Any], ...]]) -> int:
+        """
+        Count the tokens of message content, including image parts.
+
+        Args:
+            content (Union[str, Tuple[Dict[str, Any], ...]]): Text or content parts
+
+        Returns:
+            int: Token count
+        """
+        if isinstance(content, str):
+            return self.count_text(content)
+        images = sum(1 for part in content if part.get('type') == 'image_url')
+        return self.count_text(message_text(content)) + images * self.params['image_tokens']
+
+    def count_message(self, message: Any) -> int:
+        """
+        Count the tokens of one message, without calibration.
+
+        Objects with a 'token_counts' dict (stored chat and loop messages) cache the
+        result there, so each message is counted once per estimator.
+
+        Args:
+            message (Any): Object exposing role and content, or a message dict
+
+        Returns:
+            int: Token count including the per-message overhead
+        """
+        content = message.get('content', '') if isinstance(message, dict) else message.content
+        cache = getattr(message, 'token_counts', None)
+        if cache is not None:
+            count = cache.get(self.cache_key)
+            if count is None:
+                count = cache[self.cache_key] = self.count_content(content)
+        else:
+            count = self.count_content(content)
+        return count + self.params['message_overhead']
+
+    def count_conversation(self, conversation: Conversation) -> int:
+        """
+        Count the tokens of a request, without calibration.
+
+        Args:
+            conversation (Conversation): Canonical conversation
+
+        Returns:
+            int: Token count
+        """
+        total = sum(self.count_message(message) for message in conversation.messages)
+        if conversation.system:
+            total += self.count_text(conversation.system) + self.params['message_overhead']
+        return total
+
+    def estimate(self, raw_count: int, model_type: Optional[str] = None) -> int:
+        """
+        Apply the model's calibration to a raw count.
+
+        Args:
+            raw_count (int): Count from one of the count_* methods
+            model_type (Optional[str], optional): Model the count is for. Defaults to None.
+
+        Returns:
+            int: Calibrated estimate
+        """
+        factor = self._factors.get(model_type, 1.0) if model_type else 1.0
+        return int(raw_count * factor + 0.5)
+
+    def calibrate(self, model_type: str, raw_count: int, reported: int):
+        """
+        Move the model's calibration toward the ratio between reported and estimated tokens.
+
+        Args:
+            model_type (str): Model that served the request
+            raw_count (int): Uncalibrated estimate of the request
+            reported (int): Input tokens reported by the provider
+        """
+        if raw_count < CALIBRATION_MIN_TOKENS or reported <= 0:
+            return
+        ratio = min(max(reported / raw_count, CALIBRATION_BOUNDS[0]), CALIBRATION_BOUNDS[1])
+        with self._lock:
+            factor = self._factors.get(model_type)
+            self._factors[model_type] = ratio if factor is None else factor + CALIBRATION_ALPHA * (ratio - factor)
+            self._samples[model_type] = self._samples.get(model_type, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get calibration state.
+
+        Returns:
+            Dict[str, Any]: Family, tokenizer and per-model calibration factors
+        """
+        with self._lock:
+            return {
+                'family': self.family,
+                'tokenizer': 'tiktoken' if self.encoding is not None else 'heuristic',
+                'models': {
+                    model_type: {'factor': factor, 'samples': self._samples.get(model_type, 0)}
+                    for model_type, factor in self._factors.items()
+                }
+            }
+
+
+def _load_tiktoken_encoding():
+    """o200k_base encoding when tiktoken and its cached tables are available, else None"""
+    # Without a local cache directory tiktoken would download the tables
+    if tiktoken is None or not os.environ.get('TIKTOKEN_CACHE_DIR'):
+        return None
+    try:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        logger.warning(f"tiktoken tables unavailable, using heuristic token counts: {e}")
+        return None
+
+
+# Process-wide estimators by family, created on first use
+_estimators = {}
+_estimators_lock = threading.Lock()
+
+
+def get_token_estimator(provider: Optional[str] = None) -> TokenEstimator:
+    """
+    Get the shared estimator for a provider's tokenizer family.
+
+    Args:
+        provider (Optional[str], optional): Provider name; unknown providers use the
+            OpenAI family. Defaults to None.
+
+    Returns:
+        TokenEstimator: Shared estimator
+    """
+    family = PROVIDER_FAMILIES.get(provider or '', 'openai')
+    estimator = _estimators.get(family)
+    if estimator is None:
+        with _estimators_lock:
+            estimator = _estimators.get(family)
+            if estimator is None:
+                encoding = _load_tiktoken_encoding() if family == 'openai' else None
+                estimator = _estimators[family] = TokenEstimator(family, encoding)
+    return estimator
+
+
+def get_token_estimator_stats() -> Dict[str, Any]:
+    """
+    Get the calibration state of every estimator created so far.
+
+    Returns:
+        Dict[str, Any]: Stats by family
+    """
+    return {family: estimator.get_stats() for family, estimator in list(_estimators.items())}
@@ -1,4 +1,5 @@
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
 import sys
@@ -12,15 +13,48 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import routes
-from routes.chat_routes import chat_bp
-from routes.model_routes import model_bp
+from routes.chat_routes import chat_bp, chat_job_service
+from routes.model_routes import model_bp, batch_service
 from routes.settings_routes import settings_bp
 from routes.auth_routes import auth_bp
-from routes.loop_routes import loop_bp  # Import the new loop blueprint
+from routes.loop_routes import loop_bp, loop_service  # Import the new loop blueprint
+from routes.metrics_routes import metrics_bp, init_metrics
+from routes.admin_routes import admin_bp
+from routes.search_routes import search_bp
+from routes.storage_routes import storage_bp, tiering_service
+from models.search_index import configure_search_index
+from models.file_writer import configure_file_writer
+from ai_toolkit import configure_response_cache
+from models.serialization import orjson
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson when it is installed"""
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {'indent', 'separators'} or kwargs.get('indent') not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        
+        # Dates go through Flask's default() so responses match the standard provider
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            # Values orjson rejects, such as integers beyond 64 bits
+            return super().dumps(obj, **kwargs)
+    
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
 
 def create_app():
     """Create and configure Flask application"""
     app = Flask(__name__, static_folder='../frontend/build', static_url_path='/')
+    app.json = FastJSONProvider(app)
     
     # Configure app with environment variables
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
@@ -32,12 +66,54 @@ def create_app():
     app.config['LOOP_MAX_TOKENS'] = int(os.environ.get('LOOP_MAX_TOKENS', 8000))
     app.config['LOOP_WORKER_THREADS'] = int(os.environ.get('LOOP_WORKER_THREADS', 4))
     app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 50))
+    app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+    app.config['RESPONSE_CACHE_DIR'] = os.environ.get('RESPONSE_CACHE_DIR', '')
+    app.config['CHAT_JOB_WORKERS'] = int(os.environ.get('CHAT_JOB_WORKERS', 4))
+    app.config['CHAT_JOB_QUEUE_SIZE'] = int(os.environ.get('CHAT_JOB_QUEUE_SIZE', 100))
+    app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 8))
+    app.config['BATCH_MAX_ITEMS'] = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    app.config['PROFILING_TOKEN'] = os.environ.get('PROFILING_TOKEN', '')
+    app.config['SEARCH_INDEX_DIR'] = os.environ.get('SEARCH_INDEX_DIR', 'data/search')
+    app.config['COLD_STORAGE_IDLE_DAYS'] = float(os.environ.get('COLD_STORAGE_IDLE_DAYS', 30))
+    app.config['COLD_STORAGE_INTERVAL'] = int(os.environ.get('COLD_STORAGE_INTERVAL', 21600))
+    app.config['STORE_FSYNC'] = os.environ.get('STORE_FSYNC', '1') == '1'
+    app.config['STORE_GROUP_COMMIT_MS'] = int(os.environ.get('STORE_GROUP_COMMIT_MS', 0))
     
     logger.info(f"Runtime settings: " + 
                 f"REQUEST_TIMEOUT={app.config['LOOP_REQUEST_TIMEOUT']}, " +
                 f"MAX_TOKENS={app.config['LOOP_MAX_TOKENS']}, " +
                 f"WORKER_THREADS={app.config['LOOP_WORKER_THREADS']}")
     
+    # Shared response cache used by every ModelManager instance
+    configure_response_cache(
+        app.config['RESPONSE_CACHE_SIZE'],
+        app.config['RESPONSE_CACHE_TTL'],
+        app.config['RESPONSE_CACHE_DIR'] or None
+    )
+    
+    # Background pool for asynchronous chat responses
+    chat_job_service.configure(app.config['CHAT_JOB_WORKERS'], app.config['CHAT_JOB_QUEUE_SIZE'])
+    
+    # Bounded pool for /api/models/batch
+    batch_service.configure(app.config['BATCH_WORKERS'], app.config['BATCH_MAX_ITEMS'])
+    
+    # Ceiling on the max_tokens of every loop turn
+    loop_service.configure(app.config['LOOP_MAX_TOKENS'])
+    
+    # Atomic chat and loop writes; STORE_GROUP_COMMIT_MS batches directory fsyncs of concurrent writers
+    configure_file_writer(app.config['STORE_FSYNC'], app.config['STORE_GROUP_COMMIT_MS'])
+    
+    # Full-text search index, loaded in the background and rebuilt from the stores if missing
+    configure_search_index(app.config['SEARCH_INDEX_DIR']).warm()
+    
+    # Compress chats and loops idle for COLD_STORAGE_IDLE_DAYS; 0 disables the job
+    tiering_service.configure(app.config['COLD_STORAGE_IDLE_DAYS'], app.config['COLD_STORAGE_INTERVAL'])
+    
+    # Prometheus metrics; off unless METRICS_ENABLED=1
+    init_metrics(app)
+    
     # Enable CORS with proper configuration
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     
@@ -47,6 +123,10 @@ def create_app():
     app.register_blueprint(model_bp, url_prefix='/api/models')
     app.register_blueprint(settings_bp, url_prefix='/api/settings')
     app.register_blueprint(loop_bp, url_prefix='/api/loop')  # Register the loop blueprint
+    app.register_blueprint(metrics_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(storage_bp, url_prefix='/api/storage')
     
     # Health check route
     @app.route('/api/health')
@@ -0,0 +1,380 @@
+"""
+End-to-end performance benchmark for the chat and loop paths.
+
+Drives create_app() through the Flask test client and a real waitress server,
+with every request answered by the local mock provider, and measures:
+
+  chat   create/list/get/message latency (p50/p95/p99) and throughput for
+         chats with 10 to 10k stored messages
+  loop   turn throughput with 1 to 500 loops running concurrently
+  store  ChatStore/LoopStore save, load and list costs
+
+The app runs in a temporary directory on a copy of the configuration, so the
+real chats, loops and config files are never touched. Results are written to
+a JSON file; --compare reports the change against an earlier result file and
+exits with status 1 when a metric regressed by more than --threshold percent.
+
+Usage:
+    python benchmarks/bench_end_to_end.py [--suites chat,loop,store] [--output results.json]
+    python benchmarks/bench_end_to_end.py --compare baseline.json        # run, then compare
+    python benchmarks/bench_end_to_end.py --compare baseline.json new.json  # compare only
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+MOCK_MODEL = 'mock-instant'
+
+# Metrics where a larger value is an improvement; every other metric is a cost
+HIGHER_IS_BETTER = ('ops_per_sec', 'turns_per_sec')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(latencies_ms, elapsed_s):
+    """Latency percentiles and throughput of one measured operation"""
+    return {
+        'count': len(latencies_ms),
+        'mean_ms': statistics.fmean(latencies_ms),
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+        'ops_per_sec': len(latencies_ms) / elapsed_s if elapsed_s else 0.0
+    }
+
+
+def setup_environment(workdir):
+    """Run the app from a scratch directory on a copy of the configs, answering with the mock provider"""
+    configs = os.path.join(workdir, 'configs')
+    shutil.copytree(os.path.join(BACKEND_DIR, 'ai_toolkit', 'configs'), configs)
+    os.chdir(workdir)
+
+    # Must happen before the services are imported: they bind their registries on construction
+    from ai_toolkit import config_registry
+    config_registry.DEFAULT_CONFIG_DIR = configs
+
+    from ai_toolkit import ModelManager
+    manager = ModelManager()
+    manager.change_model(MOCK_MODEL)
+    manager.registry.flush()
+
+    from app import create_app
+    return create_app()
+
+
+class TestClientTransport:
+    """Issues requests in-process through the Flask test client"""
+
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}")
+        return response.get_json()
+
+    def close(self):
+        pass
+
+
+class WaitressTransport:
+    """Issues requests over HTTP to a waitress server running the app"""
+
+    name = 'waitress'
+
+    def __init__(self, app, threads=8):
+        import requests
+        from waitress.server import create_server
+
+        self.server = create_server(app, host='127.0.0.1', port=0, threads=threads)
+        self.base_url = f"http://127.0.0.1:{self.server.effective_port}"
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+        self._thread.start()
+        self._requests = requests
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.base_url + path, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}")
+        return response.json()
+
+    def close(self):
+        self.server.close()
+
+
+def measure(operation, count, concurrency):
+    """Run an operation count times on concurrency threads; returns latency samples and elapsed time"""
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(index):
+        started = time.perf_counter()
+        operation(index)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed_ms)
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for index in range(count):
+            timed(index)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, range(count)))
+    return latencies, time.perf_counter() - started
+
+
+def clear_dir(path):
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+
+
+def bench_chat(app, args, results):
+    """Chat create/list/get/message for each history size and transport"""
+    from routes.chat_routes import chat_service
+    from models.chat import Chat
+
+    store = chat_service.chat_store
+    for transport in (TestClientTransport(app), WaitressTransport(app, args.server_threads)):
+        try:
+            for size in args.history_sizes:
+                clear_dir(store.storage_dir)
+
+                # A seeded chat with `size` messages, among a realistic number of small chats
+                chat = Chat("Benchmark")
+                chat.model = MOCK_MODEL
+                chat.provider = 'mock'
+                for i in range(size):
+                    chat.add_message('user' if i % 2 == 0 else 'assistant', f"Message {i}: " + "lorem ipsum dolor sit amet " * 8)
+                store.save_chat(chat)
+                for _ in range(args.background_chats):
+                    transport.request('POST', '/api/chat/new', {})
+
+                operations = {
+                    'create': lambda i: transport.request('POST', '/api/chat/new', {'title': f"Chat {i}"}),
+                    'list': lambda i: transport.request('GET', '/api/chat/list'),
+                    'get': lambda i: transport.request('GET', f"/api/chat/{chat.id}"),
+                    'message': lambda i: transport.request('POST', f"/api/chat/{chat.id}/message", {'content': f"Question {i}"})
+                }
+                for name, operation in operations.items():
+                    # Messages to one chat are serialized by its lock, so they run one at a time
+                    concurrency = 1 if name == 'message' else args.concurrency
+                    latencies, elapsed = measure(operation, args.requests, concurrency)
+                    key = f"chat.{name}.{transport.name}.h{size}"
+                    results[key] = summarize(latencies, elapsed)
+                    print(f"{key:<40} p50 {results[key]['p50_ms']:9.2f} ms  p99 {results[key]['p99_ms']:9.2f} ms  "
+                          f"{results[key]['ops_per_sec']:9.1f} ops/s")
+        finally:
+            transport.close()
+    clear_dir(store.storage_dir)
+
+
+def bench_loop(app, args, results):
+    """Loop turns per second with many loops running at once"""
+    from routes.loop_routes import loop_service
+
+    client = TestClientTransport(app)
+    for count in args.loop_counts:
+        loop_ids = []
+        for i in range(count):
+            loop = client.request('POST', '/api/loop/new', {'title': f"Loop {i}"})
+            for name in ('Alice', 'Bob'):
+                client.request('POST', f"/api/loop/{loop['id']}/participant", {
+                    'model': MOCK_MODEL,
+                    'display_name': name,
+                    'system_prompt': f"You are {name}."
+                })
+            loop_ids.append(loop['id'])
+
+        started = time.perf_counter()
+        for loop_id in loop_ids:
+            client.request('POST', f"/api/loop/{loop_id}/start", {'initial_prompt': 'Discuss benchmarks.'})
+        time.sleep(args.loop_seconds)
+
+        # Stop in parallel; each stop waits briefly for its thread
+        with ThreadPoolExecutor(max_workers=min(64, count)) as pool:
+            list(pool.map(loop_service.stop_loop, loop_ids))
+        elapsed = time.perf_counter() - started
+
+        turns = 0
+        intervals = []
+        for loop_id in loop_ids:
+            loop = loop_service.get_loop(loop_id)
+            replies = [message for message in loop.messages if message.sender not in ('user', 'system')]
+            turns += len(replies)
+            stamps = [message.timestamp for message in loop.messages if message.sender != 'system']
+            intervals.extend((b - a).total_seconds() * 1000 for a, b in zip(stamps, stamps[1:]))
+            loop_service.delete_loop(loop_id)
+
+        key = f"loop.turns.l{count}"
+        results[key] = {
+            'loops': count,
+            'turns': turns,
+            'turns_per_sec': turns / elapsed,
+            'turn_interval_p50_ms': percentile(intervals, 50) if intervals else None,
+            'turn_interval_p95_ms': percentile(intervals, 95) if intervals else None
+        }
+        print(f"{key:<40} {turns:6d} turns  {results[key]['turns_per_sec']:9.1f} turns/s")
+
+
+def bench_store(app, args, results):
+    """Raw store costs, without HTTP or model calls"""
+    from routes.chat_routes import chat_service
+    from routes.loop_routes import loop_service
+    from models.chat import Chat
+    from models.loop import Loop
+
+    chat_store = chat_service.chat_store
+    loop_store = loop_service.loop_store
+    for size in args.history_sizes:
+        clear_dir(chat_store.storage_dir)
+        chat = Chat("Store benchmark")
+        loop = Loop("Store benchmark")
+        for i in range(size):
+            text = f"Message {i}: " + "lorem ipsum dolor sit amet " * 8
+            chat.add_message('user' if i % 2 == 0 else 'assistant', text)
+            loop.add_message(text, 'user')
+
+        operations = {
+            f"store.chat_save.h{size}": lambda i: chat_store.save_chat(chat),
+            f"store.chat_load.h{size}": lambda i: chat_store.get_chat(chat.id),
+            f"store.loop_save.h{size}": lambda i: loop_store.save_loop(loop),
+            f"store.loop_load.h{size}": lambda i: loop_store.get_loop(loop.id)
+        }
+        for key, operation in operations.items():
+            latencies, elapsed = measure(operation, args.requests, 1)
+            results[key] = summarize(latencies, elapsed)
+            print(f"{key:<40} p50 {results[key]['p50_ms']:9.2f} ms")
+
+        path = os.path.join(chat_store.storage_dir, f"{chat.id}.json")
+        results[f"store.chat_bytes.h{size}"] = {'bytes': os.path.getsize(path)}
+        loop_store.delete_loop(loop.id)
+
+    # Listing scans every chat file
+    clear_dir(chat_store.storage_dir)
+    for i in range(args.list_chats):
+        chat = Chat(f"Chat {i}")
+        for j in range(10):
+            chat.add_message('user', f"Message {j}")
+        chat_store.save_chat(chat)
+    latencies, elapsed = measure(lambda i: chat_store.list_chats(), max(5, args.requests // 5), 1)
+    key = f"store.chat_list.n{args.list_chats}"
+    results[key] = summarize(latencies, elapsed)
+    print(f"{key:<40} p50 {results[key]['p50_ms']:9.2f} ms")
+    clear_dir(chat_store.storage_dir)
+
+
+def compare(baseline, current, threshold):
+    """Print the change of every shared metric; returns the number of regressions"""
+    regressions = 0
+    print(f"{'metric':<58}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key in sorted(set(baseline['results']) & set(current['results'])):
+        old, new = baseline['results'][key], current['results'][key]
+        for metric in sorted(set(old) & set(new)):
+            if metric in ('count', 'loops') or not isinstance(old[metric], (int, float)) or not isinstance(new[metric], (int, float)):
+                continue
+            if not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] * 100
+            worse = -change if metric in HIGHER_IS_BETTER or metric == 'turns' else change
+            flag = ''
+            if worse > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{key + '.' + metric:<58}{old[metric]:>12.2f}{new[metric]:>12.2f}{change:>+9.1f}%{flag}")
+    print(f"{regressions} regression(s) above {threshold:.0f}%")
+    return regressions
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--suites', default='chat,loop,store')
+    parser.add_argument('--history-sizes', type=int_list, default=[10, 100, 1000, 10000])
+    parser.add_argument('--loop-counts', type=int_list, default=[1, 10, 100, 500])
+    parser.add_argument('--loop-seconds', type=float, default=5.0)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per measured operation')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--server-threads', type=int, default=8)
+    parser.add_argument('--background-chats', type=int, default=20)
+    parser.add_argument('--list-chats', type=int, default=200)
+    parser.add_argument('--output', default=None, help='Result file (default: bench-<timestamp>.json)')
+    parser.add_argument('--compare', nargs='+', metavar='FILE',
+                        help='Baseline result file, and optionally a second file to compare instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent')
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    output = os.path.abspath(args.output or f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    baseline_path = os.path.abspath(args.compare[0]) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix='bench-e2e-')
+    results = {}
+    try:
+        app = setup_environment(workdir)
+        suites = {'chat': bench_chat, 'loop': bench_loop, 'store': bench_store}
+        for name in args.suites.split(','):
+            suites[name](app, args, results)
+    finally:
+        os.chdir(BACKEND_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')}
+        },
+        'results': results
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, report, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
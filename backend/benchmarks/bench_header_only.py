@@ -0,0 +1,80 @@
+"""
+Benchmark metadata updates on chats with long histories.
+
+Compares the previous single-file layout, where renaming a chat reads, decodes
+and rewrites every message, with the split layout, where the header is loaded
+and saved on its own and messages are read only when accessed.
+
+Usage:
+    python benchmarks/bench_header_only.py [--messages 10000] [--repeat 5]
+"""
+import os
+import sys
+import argparse
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.chat import Chat, ChatStore
+from models.file_writer import get_file_writer
+from models.serialization import STORAGE_FORMAT, dumps, loads
+from models.search_index import configure_search_index
+
+
+def make_chat(size):
+    chat = Chat("Benchmark")
+    for i in range(size):
+        chat.add_message('user' if i % 2 == 0 else 'assistant', f"Message {i}: " + "lorem ipsum dolor sit amet " * 8)
+    return chat
+
+
+# Previous single-file layout, reproduced for comparison
+
+def inline_rename(path, title):
+    with open(path, 'rb') as f:
+        chat = Chat.from_dict(loads(f.read()))
+    chat.title = title
+    data = chat.to_dict(storage=True)
+    data["format"] = STORAGE_FORMAT
+    get_file_writer().write(path, dumps(data))
+
+
+def split_rename(store, chat_id, title):
+    chat = store.get_chat(chat_id)
+    chat.title = title
+    store.save_chat(chat)
+
+
+def run(size, repeat):
+    get_file_writer().configure(fsync=False, group_commit_ms=0)
+    with tempfile.TemporaryDirectory() as root:
+        configure_search_index(os.path.join(root, "search"), os.path.join(root, "chats"), os.path.join(root, "loops"))
+        store = ChatStore(os.path.join(root, "chats"))
+        chat = make_chat(size)
+        store.save_chat(chat)
+        inline_path = os.path.join(root, "inline.json")
+        get_file_writer().write(inline_path, dumps(chat.to_dict(storage=True)))
+
+        cases = [
+            ('single file', lambda: inline_rename(inline_path, "Renamed")),
+            ('split', lambda: split_rename(store, chat.id, "Renamed")),
+        ]
+        print(f"Chat rename, {size} messages, best of {repeat} runs")
+        results = []
+        for name, rename in cases:
+            elapsed_ms = min(timeit.repeat(rename, number=1, repeat=repeat)) * 1000
+            results.append(elapsed_ms)
+            print(f"{name:<14}{elapsed_ms:>10.2f} ms")
+        print(f"{'ratio':<14}{results[0] / results[1]:>10.1f}x")
+
+        # The rename left the messages untouched
+        assert len(store.get_chat(chat.id).messages) == size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.messages, args.repeat)
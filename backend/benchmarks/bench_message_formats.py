@@ -0,0 +1,134 @@
+"""
+Benchmark message conversion cost for long chat histories.
+
+Compares the previous per-layer conversions (ChatService wrapping, in-place
+ModelManager formatting and per-provider reformatting) with the canonical
+conversation built once and serialized by a provider adapter.
+
+Usage:
+    python benchmarks/bench_message_formats.py [--messages 500] [--repeat 200]
+"""
+import os
+import sys
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_toolkit.messages import (
+    build_conversation, to_openai_messages, to_anthropic_messages, to_gemini_contents
+)
+from models.chat import Message
+
+
+def make_history(size):
+    """Build stored chat messages"""
+    history = [Message('system', 'You are a helpful, accurate, and friendly AI assistant.')]
+    for i in range(size - 1):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        history.append(Message(role, f"Message {i}: " + "lorem ipsum dolor sit amet " * 8))
+    return history
+
+
+# Previous pipeline, reproduced for comparison
+
+def legacy_chat_service(history, provider):
+    messages = []
+    for msg in history:
+        role, content = msg.role, msg.content
+        if provider == 'openai' and role == 'user':
+            messages.append({"role": role, "content": [{"type": "text", "text": content}]})
+        else:
+            messages.append({"role": role, "content": content})
+    return messages
+
+
+def legacy_format_for_provider(prompt, provider):
+    if provider == 'openai':
+        for i, message in enumerate(prompt):
+            if message.get("role") == "user" and isinstance(message.get("content"), str):
+                prompt[i]["content"] = [{"type": "text", "text": message["content"]}]
+    return prompt
+
+
+def legacy_openai(history):
+    prompt = legacy_format_for_provider(legacy_chat_service(history, 'openai'), 'openai')
+    formatted = []
+    for msg in prompt:
+        if msg["role"] == "user" and isinstance(msg["content"], str):
+            formatted.append({"role": msg["role"], "content": [{"type": "text", "text": msg["content"]}]})
+        else:
+            formatted.append(msg)
+    return formatted
+
+
+def legacy_anthropic(history):
+    prompt = legacy_format_for_provider(legacy_chat_service(history, 'anthropic'), 'anthropic')
+    system_message = None
+    filtered = []
+    for msg in prompt:
+        if isinstance(msg["content"], list) and len(msg["content"]) > 0 and "text" in msg["content"][0]:
+            if msg["role"] == "system":
+                system_message = msg["content"][0]["text"]
+            else:
+                filtered.append({"role": msg["role"], "content": msg["content"][0]["text"]})
+        else:
+            if msg["role"] == "system":
+                system_message = msg["content"]
+            else:
+                filtered.append(msg)
+    return system_message, filtered
+
+
+def legacy_gemini(history):
+    messages = legacy_format_for_provider(legacy_chat_service(history, 'google'), 'google')
+    formatted_prompt = ""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), None)
+    if system:
+        formatted_prompt += f"System Instructions: {system}\n\n"
+        formatted_prompt += "You MUST follow the above system instructions in all your responses.\n\n"
+    for msg in messages:
+        role = msg.get("role", "")
+        if role == "system":
+            continue
+        content = msg.get("content", "")
+        if isinstance(content, list) and len(content) > 0 and "text" in content[0]:
+            content = content[0]["text"]
+        if not content:
+            continue
+        if role == "user":
+            formatted_prompt += f"User: {content}\n\n"
+        else:
+            formatted_prompt += f"Assistant: {content}\n\n"
+    return formatted_prompt + "Assistant: "
+
+
+# Canonical pipeline
+
+def canonical(history, adapter):
+    conversation = build_conversation(history)
+    return adapter(conversation)
+
+
+def run(size, repeat):
+    history = make_history(size)
+    cases = [
+        ('openai', lambda: legacy_openai(history), lambda: canonical(history, to_openai_messages)),
+        ('anthropic', lambda: legacy_anthropic(history), lambda: canonical(history, to_anthropic_messages)),
+        ('gemini', lambda: legacy_gemini(history), lambda: canonical(history, to_gemini_contents)),
+    ]
+
+    print(f"Message conversion, {size}-message history, best of 5 x {repeat} runs")
+    print(f"{'provider':<12}{'legacy (us)':>14}{'canonical (us)':>16}{'speedup':>10}")
+    for name, legacy, new in cases:
+        legacy_us = min(timeit.repeat(legacy, number=repeat, repeat=5)) / repeat * 1e6
+        new_us = min(timeit.repeat(new, number=repeat, repeat=5)) / repeat * 1e6
+        print(f"{name:<12}{legacy_us:>14.1f}{new_us:>16.1f}{legacy_us / new_us:>9.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    run(args.messages, args.repeat)
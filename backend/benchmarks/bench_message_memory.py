@@ -0,0 +1,94 @@
+"""
+Benchmark loading and holding long loop histories in memory.
+
+Compares the previous dict-backed Message (a UUID and clock read in __init__
+that from_dict overwrites, and an eager timestamp parse per message) with the
+slotted Message that is built without __init__ and parses timestamps lazily.
+Reports decode time and the memory held by the decoded messages.
+
+Usage:
+    python benchmarks/bench_message_memory.py [--messages 50000] [--repeat 5]
+"""
+import os
+import sys
+import uuid
+import argparse
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.loop import Loop, Message
+from models.serialization import dumps, loads, parse_timestamp
+
+
+# Previous message class, reproduced for comparison
+
+class LegacyMessage:
+    def __init__(self, content, sender, timestamp=None, usage=None):
+        self.id = str(uuid.uuid4())
+        self.content = content
+        self.sender = sender
+        self.timestamp = timestamp or datetime.now()
+        self.usage = usage
+        self.token_counts = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        msg = cls(data["content"], data["sender"], usage=data.get("usage"))
+        msg.token_counts = data.get("tokens") or {}
+        msg.id = data.get("id", str(uuid.uuid4()))
+        msg.timestamp = parse_timestamp(data["timestamp"]) if "timestamp" in data else datetime.now()
+        return msg
+
+
+def make_rows(size):
+    """Stored message dicts of a loop between two participants"""
+    loop = Loop("Benchmark")
+    for i in range(size):
+        usage = {"input_tokens": 900, "output_tokens": 250, "model": "gpt-4o"} if i % 2 else None
+        loop.messages.append(Message(f"Turn {i}: " + "lorem ipsum dolor sit amet " * 6, f"participant-{i % 2}", usage=usage))
+    return loads(dumps(loop.to_dict(storage=True)))["messages"]
+
+
+def held_bytes(build):
+    """Bytes still allocated by the objects build() returns"""
+    tracemalloc.start()
+    objects = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current
+
+
+def run(size, repeat):
+    rows = make_rows(size)
+    cases = [
+        ('dict-backed', lambda: [LegacyMessage.from_dict(row) for row in rows]),
+        ('slotted', lambda: [Message.from_dict(row) for row in rows]),
+    ]
+
+    print(f"Loop message decode, {size} messages, best of {repeat} runs")
+    print(f"{'':<14}{'decode (ms)':>14}{'memory (MB)':>14}")
+    results = []
+    for name, build in cases:
+        decode_ms = min(timeit.repeat(build, number=1, repeat=repeat)) * 1000
+        memory_mb = held_bytes(build) / 1024 / 1024
+        results.append((decode_ms, memory_mb))
+        print(f"{name:<14}{decode_ms:>14.1f}{memory_mb:>14.1f}")
+    (old_ms, old_mb), (new_ms, new_mb) = results
+    print(f"{'ratio':<14}{old_ms / new_ms:>13.2f}x{old_mb / new_mb:>13.2f}x")
+
+    # Saving unread messages passes their stored timestamps through
+    messages = cases[1][1]()
+    save_ms = min(timeit.repeat(lambda: [msg.to_dict(storage=True) for msg in messages], number=1, repeat=repeat)) * 1000
+    print(f"re-encode of unread slotted messages: {save_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.messages, args.repeat)
@@ -0,0 +1,88 @@
+"""
+Benchmark the stored chat format for long histories.
+
+Compares the original format (pretty-printed, ASCII-escaped JSON with ISO
+timestamps) with the compact format (no indentation, UTF-8, epoch-millisecond
+timestamps, orjson when installed) on file size, save and load time.
+
+Usage:
+    python benchmarks/bench_storage_format.py [--messages 10000] [--repeat 5]
+"""
+import os
+import sys
+import json
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.chat import Chat
+from models.serialization import STORAGE_FORMAT, dumps, loads, orjson
+
+
+def make_chat(size):
+    """Build a chat with English and Korean messages"""
+    chat = Chat("Benchmark")
+    chat.add_message('system', 'You are a helpful, accurate, and friendly AI assistant.')
+    for i in range(size - 1):
+        if i % 2 == 0:
+            chat.add_message('user', f"Message {i}: 이 문장은 저장 형식을 측정하기 위한 한국어 예시입니다. " * 2)
+        else:
+            usage = {"input_tokens": 1200, "output_tokens": 300, "latency_ms": 812.5, "model": "gpt-4o"}
+            chat.add_message('assistant', f"Reply {i}: " + "lorem ipsum dolor sit amet " * 8, usage=usage)
+    return chat
+
+
+# Original format, reproduced for comparison
+
+def legacy_save(chat):
+    return json.dumps(chat.to_dict(), indent=2).encode('utf-8')
+
+
+def legacy_load(raw):
+    return Chat.from_dict(json.loads(raw))
+
+
+# Compact format
+
+def compact_save(chat):
+    data = chat.to_dict(storage=True)
+    data["format"] = STORAGE_FORMAT
+    return dumps(data)
+
+
+def compact_load(raw):
+    return Chat.from_dict(loads(raw))
+
+
+def run(size, repeat):
+    chat = make_chat(size)
+    legacy_raw = legacy_save(chat)
+    compact_raw = compact_save(chat)
+
+    print(f"Stored chat format, {size} messages, best of {repeat} runs, codec: {'orjson' if orjson else 'json'}")
+    print(f"{'':<10}{'size (KB)':>12}{'save (ms)':>12}{'load (ms)':>12}")
+    rows = [
+        ('original', legacy_raw, lambda: legacy_save(chat), lambda: legacy_load(legacy_raw)),
+        ('compact', compact_raw, lambda: compact_save(chat), lambda: compact_load(compact_raw)),
+    ]
+    results = {}
+    for name, raw, save, load in rows:
+        save_ms = min(timeit.repeat(save, number=1, repeat=repeat)) * 1000
+        load_ms = min(timeit.repeat(load, number=1, repeat=repeat)) * 1000
+        results[name] = (len(raw), save_ms, load_ms)
+        print(f"{name:<10}{len(raw) / 1024:>12.0f}{save_ms:>12.1f}{load_ms:>12.1f}")
+
+    (old_size, old_save, old_load), (new_size, new_save, new_load) = results['original'], results['compact']
+    print(f"{'ratio':<10}{old_size / new_size:>11.2f}x{old_save / new_save:>11.2f}x{old_load / new_load:>11.2f}x")
+
+    # Files in the original format still load
+    assert len(compact_load(legacy_raw).messages) == size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.messages, args.repeat)
@@ -1,28 +1,88 @@
-import json
 import os
+import time
 import uuid
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from models.store_metrics import record_store_operation
+from models.cold_storage import ColdStorage
+from models.file_writer import get_file_writer
+from models.serialization import STORAGE_FORMAT, dumps, loads, parse_timestamp, format_timestamp
+from models.search_index import get_search_index, chat_documents
+from models.usage import empty_usage_totals, add_usage, summarize_usage
 
 class Message:
-    def __init__(self, role, content, timestamp=None):
+    __slots__ = ('id', 'role', '_content', 'usage', 'token_counts', '_timestamp', '_stored_timestamp')
+    
+    def __init__(self, role, content, timestamp=None, usage=None):
         self.id = str(uuid.uuid4())
         self.role = role  # 'user', 'assistant', or 'system'
         self.content = content
-        self.timestamp = timestamp or datetime.now()
+        self._timestamp = timestamp or datetime.now()
+        self._stored_timestamp = None  # Raw stored value until the timestamp is first read
+        self.usage = usage  # Provider usage record for generated messages
+        self.token_counts = {}  # Estimated token counts by tokenizer family, filled on first use
     
-    def to_dict(self):
-        return {
+    @property
+    def content(self):
+        return self._content
+    
+    @content.setter
+    def content(self, value):
+        # Token counts were estimated for the old content
+        self._content = value
+        self.token_counts = {}
+    
+    @property
+    def timestamp(self):
+        """Creation time, parsed from its stored form on first access"""
+        if self._timestamp is None:
+            self._timestamp = parse_timestamp(self._stored_timestamp)
+        return self._timestamp
+    
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+        self._stored_timestamp = None
+    
+    @property
+    def stored_timestamp(self):
+        """Timestamp in its stored form, without parsing it"""
+        if self._timestamp is None:
+            return self._stored_timestamp
+        return format_timestamp(self._timestamp, storage=True)
+    
+    def _timestamp_value(self, storage):
+        # Unparsed timestamps are passed through when they are already in the requested form
+        stored = self._stored_timestamp
+        if self._timestamp is None and isinstance(stored, int if storage else str):
+            return stored
+        return format_timestamp(self.timestamp, storage)
+    
+    def to_dict(self, storage=False):
+        data = {
             "id": self.id,
             "role": self.role,
             "content": self.content,
-            "timestamp": self.timestamp.isoformat()
+            "timestamp": self._timestamp_value(storage)
         }
+        if self.usage:
+            data["usage"] = self.usage
+        if self.token_counts:
+            data["tokens"] = self.token_counts
+        return data
     
     @classmethod
     def from_dict(cls, data):
-        msg = cls(data["role"], data["content"])
-        msg.id = data.get("id", str(uuid.uuid4()))
-        msg.timestamp = datetime.fromisoformat(data["timestamp"]) if "timestamp" in data else datetime.now()
+        # Skips __init__: no ID or clock reads that the stored values would overwrite
+        msg = cls.__new__(cls)
+        msg.id = data.get("id") or str(uuid.uuid4())
+        msg.role = data["role"]
+        msg._content = data["content"]
+        msg.usage = data.get("usage")
+        msg.token_counts = data.get("tokens") or {}
+        msg._stored_timestamp = data.get("timestamp")
+        msg._timestamp = None if msg._stored_timestamp is not None else datetime.now()
         return msg
 
 class Chat:
@@ -31,82 +91,392 @@ class Chat:
         self.title = title or "New Chat"
         self.provider = provider
         self.model = model
-        self.messages = []
+        self._messages = []
+        self._load_messages = None  # Reads the messages of a chat loaded header-only
+        self._message_count = 0
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
         self.parameters = {}  # Store model parameters
+        self.compaction = {}  # Per-chat overrides of the history compaction settings
+        self.summary = None  # Condensed history sent in place of older messages
+        self.base = None  # Shared message prefix in storage: {"segment", "upto", "length"}
+        self.forked_from = None  # {"chat_id", "message_id"} for forks
+        self._replaced_bases = []  # Prefix references to release once the next save has landed
+    
+    @property
+    def messages(self):
+        """Messages; read from storage on first access when the chat was loaded header-only"""
+        if self._messages is None:
+            self._messages = self._load_messages()
+            self._load_messages = None
+        return self._messages
+    
+    @messages.setter
+    def messages(self, value):
+        self._messages = value
+        self._load_messages = None
     
-    def add_message(self, role, content):
-        message = Message(role, content)
+    @property
+    def messages_loaded(self):
+        """Whether the messages are in memory, and so may have changed since loading"""
+        return self._messages is not None
+    
+    @property
+    def message_count(self):
+        return len(self._messages) if self._messages is not None else self._message_count
+    
+    def add_message(self, role, content, usage=None):
+        message = Message(role, content, usage=usage)
         self.messages.append(message)
         self.updated_at = datetime.now()
         return message
     
-    def to_dict(self):
+    def get_usage(self):
+        """Sum the usage of all generated messages, overall and per model"""
+        totals = empty_usage_totals()
+        by_model = {}
+        for message in self.messages:
+            if message.usage:
+                add_usage(totals, message.usage)
+                add_usage(by_model.setdefault(message.usage.get("model") or "unknown", empty_usage_totals()), message.usage)
+        return {
+            "total": summarize_usage(totals),
+            "models": {model: summarize_usage(model_totals) for model, model_totals in by_model.items()}
+        }
+    
+    def header_dict(self, storage=False):
+        """Every field except the messages; storage=True gives the stored form with epoch timestamps"""
         return {
             "id": self.id,
             "title": self.title,
             "provider": self.provider,
             "model": self.model,
-            "messages": [msg.to_dict() for msg in self.messages],
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-            "parameters": self.parameters
+            "message_count": self.message_count,
+            "created_at": format_timestamp(self.created_at, storage),
+            "updated_at": format_timestamp(self.updated_at, storage),
+            "parameters": self.parameters,
+            "compaction": self.compaction,
+            "summary": self.summary,
+            "base": self.base,
+            "forked_from": self.forked_from
         }
     
+    def to_dict(self, storage=False):
+        """Chat as a dict; storage=True gives the compact stored form with epoch timestamps"""
+        data = self.header_dict(storage)
+        data["messages"] = [msg.to_dict(storage) for msg in self.messages]
+        return data
+    
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, load_messages=None):
+        """Build a chat from a dict; without "messages", load_messages() reads them on first access"""
         chat = cls(data.get("title"), data.get("provider"), data.get("model"))
         chat.id = data.get("id", str(uuid.uuid4()))
-        chat.messages = [Message.from_dict(msg_data) for msg_data in data.get("messages", [])]
-        chat.created_at = datetime.fromisoformat(data["created_at"]) if "created_at" in data else datetime.now()
-        chat.updated_at = datetime.fromisoformat(data["updated_at"]) if "updated_at" in data else datetime.now()
+        if "messages" in data or load_messages is None:
+            chat.messages = [Message.from_dict(msg_data) for msg_data in data.get("messages", [])]
+        else:
+            chat._messages = None
+            chat._load_messages = load_messages
+            chat._message_count = data.get("message_count", 0)
+        chat.created_at = parse_timestamp(data["created_at"]) if "created_at" in data else datetime.now()
+        chat.updated_at = parse_timestamp(data["updated_at"]) if "updated_at" in data else datetime.now()
         chat.parameters = data.get("parameters", {})
+        chat.compaction = data.get("compaction") or {}
+        chat.summary = data.get("summary")
+        chat.base = data.get("base")
+        chat.forked_from = data.get("forked_from")
         return chat
 
+# Guards segment reference counts across ChatStore instances
+_segments_lock = threading.RLock()
+
+# Parsed shared segments kept in memory; segments never change once written
+SEGMENT_CACHE_SIZE = 128
+
 class ChatStore:
     """File-based storage for chats"""
     
     def __init__(self, storage_dir="./data/chats"):
         self.storage_dir = storage_dir
-        os.makedirs(storage_dir, exist_ok=True)
+        self.cold = ColdStorage(storage_dir)
+        self.segment_dir = os.path.join(storage_dir, "segments")
+        self.messages_dir = os.path.join(storage_dir, "messages")
+        os.makedirs(self.messages_dir, exist_ok=True)
+        self._segment_cache = OrderedDict()
     
     def save_chat(self, chat):
-        """Save a chat to file"""
+        """Save a chat; messages are rewritten only if they were loaded, and forks store only their own"""
+        started = time.perf_counter()
+        messages_path = self._messages_path(chat.id)
+        if not chat.messages_loaded and self._own_message_count(chat) and not os.path.exists(messages_path):
+            # Archived since it was loaded: bring the messages back from the archive before it is removed
+            chat.messages = self._read_messages(chat)
+        if chat.messages_loaded:
+            if chat.base:
+                self._detach_changed_prefix(chat)
+            own = chat.messages[chat.base["length"]:] if chat.base else chat.messages
+            # The messages file records the prefix it continues, so it stays readable if the header write is lost
+            data = {"format": STORAGE_FORMAT, "base": chat.base, "messages": [msg.to_dict(storage=True) for msg in own]}
+            try:
+                get_file_writer().write(messages_path, dumps(data))
+            except Exception:
+                self._restore_saved_base(chat)
+                raise
+            record_store_operation('chat', 'write_messages', started, messages_path)
+            started = time.perf_counter()
+        
+        # The header goes last, so its message count never runs ahead of the messages file
         file_path = os.path.join(self.storage_dir, f"{chat.id}.json")
-        with open(file_path, 'w') as f:
-            json.dump(chat.to_dict(), f, indent=2)
+        header = chat.header_dict(storage=True)
+        header["format"] = STORAGE_FORMAT
+        get_file_writer().write(file_path, dumps(header))
+        record_store_operation('chat', 'write', started, file_path)
+        self._release_replaced_bases(chat)
+        if chat.messages_loaded or not self._own_message_count(chat) or os.path.exists(messages_path):
+            # Otherwise the chat was archived mid-save and the archive still holds its only messages
+            self.cold.remove(chat.id)
+        
+        if chat.messages_loaded:
+            get_search_index().update('chat', chat.id, *chat_documents(chat))
+        else:
+            get_search_index().rename('chat', chat.id, chat.title)
         return chat
     
     def get_chat(self, chat_id):
-        """Get a chat by ID"""
-        file_path = os.path.join(self.storage_dir, f"{chat_id}.json")
-        if not os.path.exists(file_path):
+        """Get a chat by ID, from its file or its cold-storage archive"""
+        started = time.perf_counter()
+        data, file_path = self._read_data(chat_id)
+        if data is None:
             return None
         
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        return Chat.from_dict(data)
+        # Files from before the header/messages split and archives hold the messages inline
+        if "messages" in data and data.get("base"):
+            data["messages"] = self._load_prefix(data["base"]) + data["messages"]
+        chat = Chat.from_dict(data, lambda: self._read_messages(chat))
+        record_store_operation('chat', 'read' if file_path else 'cold_read', started, file_path)
+        return chat
+    
+    def _messages_path(self, chat_id):
+        return os.path.join(self.messages_dir, f"{chat_id}.json")
+    
+    def _own_message_count(self, chat):
+        """Messages a chat stores itself, after its shared prefix"""
+        return chat.message_count - (chat.base["length"] if chat.base else 0)
+    
+    def _read_messages(self, chat):
+        """Messages of a chat loaded header-only: its shared prefix, then its own messages"""
+        started = time.perf_counter()
+        file_path = self._messages_path(chat.id)
+        rows = []
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                stored = loads(f.read())
+            rows = stored["messages"]
+            if "base" in stored:
+                # Written before the header, so it wins if a save was cut short between the two
+                chat.base = stored["base"]
+        elif self._own_message_count(chat):
+            # The chat was archived after its header was read
+            archived = self.cold.read(chat.id)
+            if archived is None or "messages" not in archived:
+                raise FileNotFoundError(f"Messages of chat {chat.id} are missing: {file_path}")
+            rows = archived["messages"]
+            chat.base = archived.get("base")
+        if chat.base:
+            rows = self._load_prefix(chat.base) + rows
+        messages = [Message.from_dict(row) for row in rows]
+        record_store_operation('chat', 'read_messages', started, file_path)
+        return messages
+    
+    def _read_data(self, chat_id):
+        """Stored dict of a chat and its file path; the path is None for archived chats"""
+        file_path = os.path.join(self.storage_dir, f"{chat_id}.json")
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                return loads(f.read()), file_path
+        return self.cold.read(chat_id), None
     
     def list_chats(self):
         """List all chats"""
         chats = []
-        for filename in os.listdir(self.storage_dir):
-            if filename.endswith(".json"):
-                chat_id = filename[:-5]  # Remove '.json'
-                chat = self.get_chat(chat_id)
-                if chat:
-                    chats.append(chat)
+        chat_ids = [filename[:-5] for filename in os.listdir(self.storage_dir) if filename.endswith(".json")]
+        for chat_id in dict.fromkeys(chat_ids + self.cold.list_ids()):
+            chat = self.get_chat(chat_id)
+            if chat:
+                chats.append(chat)
         
         # Sort by updated_at (newest first)
         chats.sort(key=lambda c: c.updated_at, reverse=True)
         return chats
     
     def delete_chat(self, chat_id):
-        """Delete a chat by ID"""
-        file_path = os.path.join(self.storage_dir, f"{chat_id}.json")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
-        return False
\ No newline at end of file
+        """Delete a chat by ID; shared segments stay while other forks use them"""
+        with _segments_lock:
+            data, file_path = self._read_data(chat_id)
+            if data is None:
+                return False
+            # After an interrupted save the header and messages file can name different prefixes
+            bases = [data.get("base")]
+            messages_path = self._messages_path(chat_id)
+            if os.path.exists(messages_path):
+                with open(messages_path, 'rb') as f:
+                    bases.append(loads(f.read()).get("base"))
+                os.remove(messages_path)
+            if file_path:
+                os.remove(file_path)
+            self.cold.remove(chat_id)
+            self._release_segments(chat_id, bases)
+        get_search_index().remove('chat', chat_id)
+        return True
+    
+    def fork_chat(self, chat, count, title=None):
+        """Create and save a chat sharing the first count messages of chat without copying them"""
+        with _segments_lock:
+            base_length = chat.base["length"] if chat.base else 0
+            if count <= base_length:
+                # The fork point is inside the parent's own shared prefix
+                ref = self._prefix_ref(chat.base, count)
+            else:
+                # Freeze the parent's messages up to the fork point into a segment both chats share
+                segment_id = self._create_segment(chat.base, chat.messages[base_length:count])
+                ref = {"segment": segment_id, "upto": count - base_length, "length": count}
+                self._rebase(chat, ref)
+                self.save_chat(chat)
+            
+            fork = Chat(title or f"{chat.title} (fork)", chat.provider, chat.model)
+            fork.parameters = dict(chat.parameters)
+            fork.compaction = dict(chat.compaction)
+            fork.messages = [Message.from_dict(msg.to_dict(storage=True)) for msg in chat.messages[:count]]
+            fork.forked_from = {"chat_id": chat.id, "message_id": chat.messages[count - 1].id if count else None}
+            if chat.summary and any(msg.id == chat.summary["through_message_id"] for msg in fork.messages):
+                fork.summary = dict(chat.summary)
+            self._rebase(fork, ref)
+            return self.save_chat(fork)
+    
+    def _prefix_ref(self, ref, count):
+        """Reference to the first count messages of a shared prefix"""
+        while ref and count < ref["length"]:
+            segment = self._get_segment(ref["segment"])
+            below = ref["length"] - ref["upto"]
+            if count > below:
+                return {"segment": ref["segment"], "upto": count - below, "length": count}
+            ref = segment["base"]
+        return dict(ref) if ref and count else None
+    
+    def _load_prefix(self, ref):
+        """Message dicts of a shared prefix, oldest first"""
+        parts = []
+        while ref:
+            segment = self._get_segment(ref["segment"])
+            parts.append(segment["messages"][:ref["upto"]])
+            ref = segment["base"]
+        return [msg for part in reversed(parts) for msg in part]
+    
+    def _detach_changed_prefix(self, chat):
+        """Copy on write: keep only the part of the shared prefix the chat has not changed"""
+        prefix = self._load_prefix(chat.base)
+        shared = 0
+        for msg, stored in zip(chat.messages, prefix):
+            if msg.id != stored["id"] or msg.role != stored["role"] or msg.content != stored["content"]:
+                break
+            shared += 1
+        if shared < chat.base["length"]:
+            with _segments_lock:
+                self._rebase(chat, self._prefix_ref(chat.base, shared))
+    
+    def _rebase(self, chat, ref):
+        """Point a chat at another shared prefix; the old reference is released after the next save"""
+        with _segments_lock:
+            self._acquire_segment(chat.id, ref)
+            chat._replaced_bases.append(chat.base)
+            chat.base = ref
+    
+    def _release_replaced_bases(self, chat):
+        """Drop the prefix references a saved chat no longer uses"""
+        with _segments_lock:
+            self._release_segments(chat.id, chat._replaced_bases, keep=chat.base)
+            chat._replaced_bases = []
+    
+    def _restore_saved_base(self, chat):
+        """Undo rebases since the last save when its messages write failed; nothing on disk refers to them yet"""
+        with _segments_lock:
+            if chat._replaced_bases:
+                saved = chat._replaced_bases[0]
+                self._release_segments(chat.id, chat._replaced_bases[1:] + [chat.base], keep=saved)
+                chat.base = saved
+                chat._replaced_bases = []
+    
+    def _release_segments(self, holder_id, refs, keep=None):
+        # References are held per segment, so one release per segment, and none for the segment kept
+        released = {ref["segment"]: ref for ref in refs if ref}
+        if keep:
+            released.pop(keep["segment"], None)
+        for ref in released.values():
+            self._release_segment(holder_id, ref)
+    
+    def _create_segment(self, base, messages):
+        """Write an immutable segment of messages on top of a base prefix; returns its ID"""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        segment_id = str(uuid.uuid4())
+        data = {
+            "id": segment_id,
+            "base": base,
+            "messages": [msg.to_dict(storage=True) for msg in messages],
+            "created_at": format_timestamp(datetime.now(), storage=True),
+            "format": STORAGE_FORMAT
+        }
+        get_file_writer().write(os.path.join(self.segment_dir, f"{segment_id}.json"), dumps(data))
+        self._write_refs(segment_id, [])
+        self._acquire_segment(segment_id, base)
+        return segment_id
+    
+    def _get_segment(self, segment_id):
+        with _segments_lock:
+            segment = self._segment_cache.get(segment_id)
+            if segment is not None:
+                self._segment_cache.move_to_end(segment_id)
+                return segment
+            
+            started = time.perf_counter()
+            file_path = os.path.join(self.segment_dir, f"{segment_id}.json")
+            with open(file_path, 'rb') as f:
+                segment = loads(f.read())
+            record_store_operation('chat_segment', 'read', started, file_path)
+            
+            self._segment_cache[segment_id] = segment
+            if len(self._segment_cache) > SEGMENT_CACHE_SIZE:
+                self._segment_cache.popitem(last=False)
+            return segment
+    
+    def _acquire_segment(self, holder_id, ref):
+        if ref:
+            refs = self._read_refs(ref["segment"])
+            if holder_id not in refs:
+                self._write_refs(ref["segment"], refs + [holder_id])
+    
+    def _release_segment(self, holder_id, ref):
+        """Drop a holder's reference, deleting segments nothing refers to any more"""
+        while ref:
+            segment_id = ref["segment"]
+            refs = [holder for holder in self._read_refs(segment_id) if holder != holder_id]
+            if refs:
+                self._write_refs(segment_id, refs)
+                return
+            
+            ref = self._get_segment(segment_id)["base"]
+            for suffix in (".json", ".refs.json"):
+                path = os.path.join(self.segment_dir, f"{segment_id}{suffix}")
+                if os.path.exists(path):
+                    os.remove(path)
+            self._segment_cache.pop(segment_id, None)
+            holder_id = segment_id
+    
+    def _read_refs(self, segment_id):
+        file_path = os.path.join(self.segment_dir, f"{segment_id}.refs.json")
+        if not os.path.exists(file_path):
+            return []
+        with open(file_path, 'rb') as f:
+            return loads(f.read())
+    
+    def _write_refs(self, segment_id, refs):
+        get_file_writer().write(os.path.join(self.segment_dir, f"{segment_id}.refs.json"), dumps(refs))
\ No newline at end of file
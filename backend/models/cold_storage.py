@@ -0,0 +1,180 @@
+import os
+import gzip
+import time
+import logging
+import threading
+from models.file_writer import get_file_writer
+from models.serialization import dumps, loads
+
+# zstandard is optional; archives fall back to gzip without it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+# Archive suffixes by preference; both are always readable when their codec is installed
+ARCHIVE_SUFFIXES = ('.json.zst', '.json.gz')
+
+
+def _compress(data, suffix):
+    if suffix == '.json.zst':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _decompress(data, suffix):
+    if suffix == '.json.zst':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .json.zst archives")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def _signature(path):
+    """(mtime, size) of a file, to notice writes made while archiving it"""
+    if not os.path.exists(path):
+        return (None, None)
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ColdStorage:
+    """Compressed archive tier for stored chats or loops that have not changed in a while"""
+
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        self.cold_dir = os.path.join(storage_dir, "cold")
+        self.messages_dir = os.path.join(storage_dir, "messages")
+        self.suffix = ARCHIVE_SUFFIXES[0] if zstandard is not None else ARCHIVE_SUFFIXES[1]
+        self._lock = threading.Lock()
+        self._reads = 0
+        self._read_seconds = 0.0
+        self._max_read_seconds = 0.0
+
+    def find_archive(self, object_id):
+        """(path, suffix) of an object's archive, or None if it is not archived"""
+        for suffix in ARCHIVE_SUFFIXES:
+            path = os.path.join(self.cold_dir, f"{object_id}{suffix}")
+            if os.path.exists(path):
+                return path, suffix
+        return None
+
+    def list_ids(self):
+        """IDs of archived objects"""
+        if not os.path.isdir(self.cold_dir):
+            return []
+        ids = []
+        for filename in os.listdir(self.cold_dir):
+            for suffix in ARCHIVE_SUFFIXES:
+                if filename.endswith(suffix):
+                    ids.append(filename[:-len(suffix)])
+                    break
+        return ids
+
+    def read(self, object_id):
+        """Decompress and parse an archived object, or None if it is not archived"""
+        archive = self.find_archive(object_id)
+        if archive is None:
+            return None
+
+        started = time.perf_counter()
+        path, suffix = archive
+        with open(path, 'rb') as f:
+            data = loads(_decompress(f.read(), suffix))
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._reads += 1
+            self._read_seconds += elapsed
+            self._max_read_seconds = max(self._max_read_seconds, elapsed)
+        return data
+
+    def remove(self, object_id):
+        """Delete an object's archive; returns whether there was one"""
+        removed = False
+        for suffix in ARCHIVE_SUFFIXES:
+            path = os.path.join(self.cold_dir, f"{object_id}{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+                removed = True
+        return removed
+
+    def archive_idle(self, idle_seconds, skip=None):
+        """Move files unchanged for idle_seconds into compressed archives; skip(data) keeps an object hot"""
+        os.makedirs(self.cold_dir, exist_ok=True)
+        cutoff = time.time() - idle_seconds
+        result = {"archived": 0, "bytes_before": 0, "bytes_after": 0}
+
+        for filename in os.listdir(self.storage_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.storage_dir, filename)
+            messages_path = os.path.join(self.messages_dir, filename)
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            signature = _signature(path) + _signature(messages_path)
+
+            # Archives hold the header and messages together in one file
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                data = loads(raw)
+                if "messages" not in data and os.path.exists(messages_path):
+                    with open(messages_path, 'rb') as f:
+                        messages_raw = f.read()
+                    stored = loads(messages_raw)
+                    data["messages"] = stored["messages"]
+                    if "base" in stored:
+                        data["base"] = stored["base"]
+                    raw += messages_raw
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {filename} while archiving: {e}")
+                continue
+            if skip is not None and skip(data):
+                continue
+
+            object_id = filename[:-5]
+            # The archive is durable before the hot files go
+            archive_path = os.path.join(self.cold_dir, f"{object_id}{self.suffix}")
+            get_file_writer().write(archive_path, _compress(dumps(data), self.suffix))
+
+            # A save that landed while compressing wins and the stale archive is dropped; holding
+            # the write locks keeps a save from landing between this check and the removal
+            with get_file_writer().locked(path, messages_path):
+                if _signature(path) + _signature(messages_path) != signature:
+                    os.remove(archive_path)
+                    continue
+                os.remove(path)
+                if os.path.exists(messages_path):
+                    os.remove(messages_path)
+
+            result["archived"] += 1
+            result["bytes_before"] += len(raw)
+            result["bytes_after"] += os.path.getsize(archive_path)
+        return result
+
+    def get_stats(self):
+        """Sizes of the hot and cold tiers and the latency of reads from archives"""
+        hot = [os.path.join(self.storage_dir, f) for f in os.listdir(self.storage_dir) if f.endswith('.json')]
+        hot_messages = [os.path.join(self.messages_dir, os.path.basename(path)) for path in hot]
+        hot_bytes = sum(os.path.getsize(path) for path in hot + hot_messages if os.path.exists(path))
+        cold = [os.path.join(self.cold_dir, f"{object_id}{suffix}") for object_id in self.list_ids()
+                for suffix in ARCHIVE_SUFFIXES]
+        cold = [path for path in cold if os.path.exists(path)]
+        with self._lock:
+            reads = self._reads
+            average = self._read_seconds / reads * 1000 if reads else 0.0
+            maximum = self._max_read_seconds * 1000
+        return {
+            "codec": self.suffix.rsplit('.', 1)[1],
+            "hot": {"count": len(hot), "bytes": hot_bytes},
+            "cold": {"count": len(cold), "bytes": sum(os.path.getsize(path) for path in cold)},
+            "cold_reads": {"count": reads, "avg_ms": round(average, 2), "max_ms": round(maximum, 2)}
+        }
@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Writers of one file are serialized by one of a fixed set of locks picked by path hash
+LOCK_STRIPES = 64
+
+
+class FileWriter:
+    """Crash-safe file replacement: write to a temp file, fsync, rename over the target"""
+
+    def __init__(self, fsync=True, group_commit_ms=0):
+        self.fsync = fsync
+        self.group_commit_ms = group_commit_ms
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._cond = threading.Condition()
+        self._pending = {}  # Path -> {"data", "done", "error"} waiting for the next group commit
+        self._flusher = None
+        self._stats = {"writes": 0, "files_written": 0, "fsyncs": 0, "batches": 0}
+
+    def configure(self, fsync, group_commit_ms):
+        """Set durability; with group_commit_ms > 0 writes within that window share directory syncs"""
+        self.fsync = fsync
+        self.group_commit_ms = group_commit_ms
+        if group_commit_ms > 0 and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='store-group-commit', daemon=True)
+            self._flusher.start()
+
+    def write(self, path, data):
+        """Atomically replace path with data (bytes); returns once the write is durable"""
+        with self._cond:
+            self._stats["writes"] += 1
+        if self.group_commit_ms > 0 and self._flusher is not None:
+            self._write_grouped(path, data)
+            return
+        with self._path_lock(path):
+            self._replace(path, data)
+            if self.fsync:
+                self._sync_directory(os.path.dirname(path))
+
+    @contextmanager
+    def locked(self, *paths):
+        """Keep writes to paths from landing, e.g. while checking and removing those files"""
+        stripes = sorted({self._stripe(path) for path in paths})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+    def _stripe(self, path):
+        return hash(os.path.abspath(path)) % LOCK_STRIPES
+
+    def _path_lock(self, path):
+        """Lock serializing writers of one file"""
+        return self._locks[self._stripe(path)]
+
+    def _replace(self, path, data):
+        temp_path = self._write_temp(path, data, self.fsync)
+        os.replace(temp_path, path)
+
+    def _write_temp(self, path, data, sync):
+        """Write data next to path, to be renamed over it"""
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        with self._cond:
+            self._stats["files_written"] += 1
+            if sync:
+                self._stats["fsyncs"] += 1
+        return temp_path
+
+    def _sync_directory(self, directory):
+        """Persist renames in a directory; not supported on every platform"""
+        try:
+            fd = os.open(directory or '.', os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+            with self._cond:
+                self._stats["fsyncs"] += 1
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _write_grouped(self, path, data):
+        """Queue a write for the next group commit and wait for it"""
+        with self._cond:
+            entry = self._pending.get(path)
+            if entry is None:
+                entry = self._pending[path] = {"data": data, "done": threading.Event(), "error": None}
+                self._cond.notify()
+            else:
+                # A newer version of the same file supersedes the queued one
+                entry["data"] = data
+        entry["done"].wait()
+        if entry["error"] is not None:
+            raise entry["error"]
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Let concurrent writers join the batch
+            time.sleep(self.group_commit_ms / 1000)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._stats["batches"] += 1
+
+            # Write and fsync every file first, then rename them in; each directory is synced once per batch
+            written = []
+            for path, entry in batch.items():
+                try:
+                    with self._path_lock(path):
+                        written.append((path, self._write_temp(path, entry["data"], self.fsync), entry))
+                except Exception as e:
+                    logger.error(f"Group commit of {path} failed: {e}")
+                    entry["error"] = e
+
+            directories = set()
+            for path, temp_path, entry in written:
+                try:
+                    with self._path_lock(path):
+                        os.replace(temp_path, path)
+                    directories.add(os.path.dirname(path))
+                except Exception as e:
+                    logger.error(f"Group commit of {path} failed: {e}")
+                    entry["error"] = e
+            if self.fsync:
+                for directory in directories:
+                    self._sync_directory(directory)
+            for entry in batch.values():
+                entry["done"].set()
+
+    def get_stats(self):
+        """Write counts; fsyncs per write shows how much group commit saves"""
+        with self._cond:
+            stats = dict(self._stats)
+        stats.update({"fsync": self.fsync, "group_commit_ms": self.group_commit_ms})
+        return stats
+
+
+# Process-wide writer used by ChatStore and LoopStore
+_file_writer = FileWriter()
+
+
+def get_file_writer():
+    """Get the process-wide file writer"""
+    return _file_writer
+
+
+def configure_file_writer(fsync, group_commit_ms):
+    """Configure durability and group commit of the process-wide writer"""
+    _file_writer.configure(fsync, group_commit_ms)
+    return _file_writer
@@ -1,7 +1,13 @@
-import json
 import os
+import time
 import uuid
 from datetime import datetime
+from models.store_metrics import record_store_operation
+from models.cold_storage import ColdStorage
+from models.file_writer import get_file_writer
+from models.serialization import STORAGE_FORMAT, dumps, loads, parse_timestamp, format_timestamp
+from models.search_index import get_search_index, loop_documents
+from models.usage import empty_usage_totals, add_usage, summarize_usage
 
 class Participant:
     def __init__(self, model, order_index, system_prompt="", display_name=None, user_prompt="", temperature=0.7, max_tokens=4000):
@@ -74,40 +80,154 @@ class StopSequence:
         return stop_seq
 
 class Message:
-    def __init__(self, content, sender, timestamp=None):
+    __slots__ = ('id', '_content', 'sender', 'usage', 'token_counts', '_timestamp', '_stored_timestamp')
+    
+    def __init__(self, content, sender, timestamp=None, usage=None):
         self.id = str(uuid.uuid4())
         self.content = content
         self.sender = sender  # participant_id or "user"
-        self.timestamp = timestamp or datetime.now()
+        self._timestamp = timestamp or datetime.now()
+        self._stored_timestamp = None  # Raw stored value until the timestamp is first read
+        self.usage = usage  # Provider usage record for participant messages
+        self.token_counts = {}  # Estimated token counts by tokenizer family, filled on first use
     
-    def to_dict(self):
-        return {
+    @property
+    def content(self):
+        return self._content
+    
+    @content.setter
+    def content(self, value):
+        # Token counts were estimated for the old content
+        self._content = value
+        self.token_counts = {}
+    
+    @property
+    def timestamp(self):
+        """Creation time, parsed from its stored form on first access"""
+        if self._timestamp is None:
+            self._timestamp = parse_timestamp(self._stored_timestamp)
+        return self._timestamp
+    
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+        self._stored_timestamp = None
+    
+    @property
+    def stored_timestamp(self):
+        """Timestamp in its stored form, without parsing it"""
+        if self._timestamp is None:
+            return self._stored_timestamp
+        return format_timestamp(self._timestamp, storage=True)
+    
+    def _timestamp_value(self, storage):
+        # Unparsed timestamps are passed through when they are already in the requested form
+        stored = self._stored_timestamp
+        if self._timestamp is None and isinstance(stored, int if storage else str):
+            return stored
+        return format_timestamp(self.timestamp, storage)
+    
+    def to_dict(self, storage=False):
+        data = {
             "id": self.id,
             "content": self.content,
             "sender": self.sender,
-            "timestamp": self.timestamp.isoformat()
+            "timestamp": self._timestamp_value(storage)
         }
+        if self.usage:
+            data["usage"] = self.usage
+        if self.token_counts:
+            data["tokens"] = self.token_counts
+        return data
     
     @classmethod
     def from_dict(cls, data):
-        msg = cls(data["content"], data["sender"])
-        msg.id = data.get("id", str(uuid.uuid4()))
-        msg.timestamp = datetime.fromisoformat(data["timestamp"]) if "timestamp" in data else datetime.now()
+        # Skips __init__: no ID or clock reads that the stored values would overwrite
+        msg = cls.__new__(cls)
+        msg.id = data.get("id") or str(uuid.uuid4())
+        msg._content = data["content"]
+        msg.sender = data["sender"]
+        msg.usage = data.get("usage")
+        msg.token_counts = data.get("tokens") or {}
+        msg._stored_timestamp = data.get("timestamp")
+        msg._timestamp = None if msg._stored_timestamp is not None else datetime.now()
         return msg
 
+# Budget limits a loop can set; None or missing means unlimited
+BUDGET_FIELDS = (
+    "max_cycles",
+    "max_prompt_tokens",
+    "max_completion_tokens",
+    "max_total_tokens",
+    "max_cost_usd",
+    "max_duration_seconds"
+)
+
 class Loop:
     def __init__(self, title=None):
         self.id = str(uuid.uuid4())
         self.title = title or "New Loop"
         self.participants = []
         self.stop_sequences = []
-        self.messages = []
+        self._messages = []
+        self._load_messages = None  # Reads the messages of a loop loaded header-only
+        self._message_count = 0
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
         self.status = "stopped"  # "running", "paused", "stopped"
         self.max_turns = None  # Optional limit, null means unlimited
         self.current_turn = 0
         self.loop_user_prompt = ""  # New field for loop user prompt that receives the last participant's output
+        self.budget = {}  # Optional limits from BUDGET_FIELDS
+        self.started_at = None  # When the current conversation was started
+        self._totals = _empty_totals()  # Running consumption, for budget checks
+    
+    @property
+    def messages(self):
+        """Messages; read from storage on first access when the loop was loaded header-only"""
+        if self._messages is None:
+            self._messages = self._load_messages()
+            self._load_messages = None
+        return self._messages
+    
+    @messages.setter
+    def messages(self, value):
+        self._messages = value
+        self._load_messages = None
+        self._totals = None
+    
+    @property
+    def messages_loaded(self):
+        """Whether the messages are in memory, and so may have changed since loading"""
+        return self._messages is not None
+    
+    @property
+    def message_count(self):
+        return len(self._messages) if self._messages is not None else self._message_count
+    
+    @property
+    def totals(self):
+        """Participant turns and summed usage so far, kept up to date as messages are added"""
+        if self._totals is None:
+            # Loops saved before running totals existed are counted once from their messages
+            participant_ids = {p.id for p in self.participants}
+            self._totals = _empty_totals()
+            for message in self.messages:
+                self._count_message(message, participant_ids)
+        return self._totals
+    
+    def load_messages(self):
+        """Read the messages now if the loop was loaded header-only"""
+        return self.messages
+    
+    def add_judge_usage(self, usage):
+        """Count a stop-condition judge call, which adds no message, toward the budget"""
+        add_usage(self.totals["judge_usage"], usage)
+    
+    def _count_message(self, message, participant_ids):
+        if message.sender in participant_ids:
+            self._totals["turns"] += 1
+        add_usage(self._totals["usage"], message.usage)
     
     def add_participant(self, model, order_index, system_prompt="", display_name=None, user_prompt="", temperature=0.7, max_tokens=4000):
         participant = Participant(model, order_index, system_prompt, display_name, user_prompt, temperature, max_tokens)
@@ -189,13 +309,70 @@ class Loop:
         self.stop_sequences.sort(key=lambda s: s.order_index)
         self.updated_at = datetime.now()
     
-    def add_message(self, content, sender):
-        message = Message(content, sender)
+    def add_message(self, content, sender, usage=None):
+        message = Message(content, sender, usage=usage)
         self.messages.append(message)
+        if self._totals is not None:
+            self._count_message(message, {p.id for p in self.participants})
         self.updated_at = datetime.now()
         self.current_turn += 1
         return message
     
+    def get_usage(self):
+        """Sum the usage of all participant messages, overall and per participant"""
+        totals = empty_usage_totals()
+        by_participant = {}
+        for message in self.messages:
+            if message.usage:
+                add_usage(totals, message.usage)
+                add_usage(by_participant.setdefault(message.sender, empty_usage_totals()), message.usage)
+        
+        participants = {}
+        for participant_id, participant_totals in by_participant.items():
+            participant = self.get_participant(participant_id)
+            participants[participant_id] = dict(
+                summarize_usage(participant_totals),
+                display_name=participant.display_name if participant else None,
+                model=participant.model if participant else None
+            )
+        return {
+            "total": summarize_usage(totals),
+            "participants": participants,
+            "judges": summarize_usage(self.totals["judge_usage"])
+        }
+    
+    def get_budget_status(self):
+        """Current consumption measured against each budget limit"""
+        turns = self.totals["turns"]
+        usage = summarize_usage({key: value + self.totals["judge_usage"][key]
+                                 for key, value in self.totals["usage"].items()})
+        return {
+            "turns": turns,
+            "cycles": turns // len(self.participants) if self.participants else 0,
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["output_tokens"],
+            "total_tokens": usage["total_tokens"],
+            "cost_usd": usage["cost_usd"],
+            "duration_seconds": (datetime.now() - self.started_at).total_seconds() if self.started_at else 0.0
+        }
+    
+    def check_budget(self):
+        """Return the reason the loop has exhausted its budget, or None"""
+        status = self.get_budget_status()
+        limits = (
+            ("turns", self.max_turns, "turn limit"),
+            ("cycles", self.budget.get("max_cycles"), "cycle limit"),
+            ("prompt_tokens", self.budget.get("max_prompt_tokens"), "prompt token budget"),
+            ("completion_tokens", self.budget.get("max_completion_tokens"), "completion token budget"),
+            ("total_tokens", self.budget.get("max_total_tokens"), "total token budget"),
+            ("cost_usd", self.budget.get("max_cost_usd"), "cost budget"),
+            ("duration_seconds", self.budget.get("max_duration_seconds"), "time limit")
+        )
+        for key, limit, name in limits:
+            if limit is not None and status[key] >= limit:
+                return f"{name} reached ({key.replace('_', ' ')}: {_format_amount(status[key])} of {_format_amount(limit)})"
+        return None
+    
     def get_sorted_participants(self):
         """Get participants sorted by order_index"""
         return sorted(self.participants, key=lambda p: p.order_index)
@@ -230,70 +407,153 @@ class Loop:
         next_index = (current_index + 1) % len(sorted_participants)
         return sorted_participants[next_index]
     
-    def to_dict(self):
+    def header_dict(self, storage=False):
+        """Every field except the messages; storage=True gives the stored form with epoch timestamps"""
         return {
             "id": self.id,
             "title": self.title,
             "participants": [p.to_dict() for p in self.participants],
             "stop_sequences": [s.to_dict() for s in self.stop_sequences],
-            "messages": [msg.to_dict() for msg in self.messages],
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
+            "message_count": self.message_count,
+            "totals": self.totals,
+            "created_at": format_timestamp(self.created_at, storage),
+            "updated_at": format_timestamp(self.updated_at, storage),
             "status": self.status,
             "max_turns": self.max_turns,
             "current_turn": self.current_turn,
-            "loop_user_prompt": self.loop_user_prompt
+            "loop_user_prompt": self.loop_user_prompt,
+            "budget": self.budget,
+            "started_at": format_timestamp(self.started_at, storage)
         }
     
+    def to_dict(self, storage=False):
+        """Loop as a dict; storage=True gives the compact stored form with epoch timestamps"""
+        data = self.header_dict(storage)
+        data["messages"] = [msg.to_dict(storage) for msg in self.messages]
+        return data
+    
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, load_messages=None):
+        """Build a loop from a dict; without "messages", load_messages() reads them on first access"""
         loop = cls(data.get("title"))
         loop.id = data.get("id", str(uuid.uuid4()))
         loop.participants = [Participant.from_dict(p_data) for p_data in data.get("participants", [])]
         loop.stop_sequences = [StopSequence.from_dict(s_data) for s_data in data.get("stop_sequences", [])] if "stop_sequences" in data else []
-        loop.messages = [Message.from_dict(msg_data) for msg_data in data.get("messages", [])]
-        loop.created_at = datetime.fromisoformat(data["created_at"]) if "created_at" in data else datetime.now()
-        loop.updated_at = datetime.fromisoformat(data["updated_at"]) if "updated_at" in data else datetime.now()
+        if "messages" in data or load_messages is None:
+            loop.messages = [Message.from_dict(msg_data) for msg_data in data.get("messages", [])]
+        else:
+            loop._messages = None
+            loop._load_messages = load_messages
+            loop._message_count = data.get("message_count", 0)
+        loop.created_at = parse_timestamp(data["created_at"]) if "created_at" in data else datetime.now()
+        loop.updated_at = parse_timestamp(data["updated_at"]) if "updated_at" in data else datetime.now()
         loop.status = data.get("status", "stopped")
         loop.max_turns = data.get("max_turns")
         loop.current_turn = data.get("current_turn", 0)
         loop.loop_user_prompt = data.get("loop_user_prompt", "")
+        loop.budget = data.get("budget") or {}
+        loop.started_at = parse_timestamp(data.get("started_at"))
+        loop._totals = data.get("totals")
+        if loop._totals is not None:
+            loop._totals.setdefault("judge_usage", empty_usage_totals())
         return loop
 
+def _empty_totals():
+    return {"turns": 0, "usage": empty_usage_totals(), "judge_usage": empty_usage_totals()}
+
+def _format_amount(value):
+    """Format a budget amount without float noise"""
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.4f}".rstrip("0")
+    return str(int(value))
+
 class LoopStore:
     """File-based storage for loops"""
     
     def __init__(self, storage_dir="./data/loops"):
         self.storage_dir = storage_dir
-        os.makedirs(storage_dir, exist_ok=True)
+        self.cold = ColdStorage(storage_dir)
+        self.messages_dir = os.path.join(storage_dir, "messages")
+        os.makedirs(self.messages_dir, exist_ok=True)
     
     def save_loop(self, loop):
-        """Save a loop to file"""
+        """Save a loop; its messages are rewritten only if they were loaded"""
+        started = time.perf_counter()
+        messages_path = self._messages_path(loop.id)
+        if not loop.messages_loaded and loop.message_count and not os.path.exists(messages_path):
+            # Archived since it was loaded: bring the messages back from the archive before it is removed
+            loop.load_messages()
+        if loop.messages_loaded:
+            data = {"format": STORAGE_FORMAT, "messages": [msg.to_dict(storage=True) for msg in loop.messages]}
+            get_file_writer().write(messages_path, dumps(data))
+            record_store_operation('loop', 'write_messages', started, messages_path)
+            started = time.perf_counter()
+        
+        # The header goes last, so its message count never runs ahead of the messages file
         file_path = os.path.join(self.storage_dir, f"{loop.id}.json")
-        with open(file_path, 'w') as f:
-            json.dump(loop.to_dict(), f, indent=2)
+        header = loop.header_dict(storage=True)
+        header["format"] = STORAGE_FORMAT
+        get_file_writer().write(file_path, dumps(header))
+        record_store_operation('loop', 'write', started, file_path)
+        if loop.messages_loaded or not loop.message_count or os.path.exists(messages_path):
+            # Otherwise the loop was archived mid-save and the archive still holds its only messages
+            self.cold.remove(loop.id)
+        
+        if loop.messages_loaded:
+            get_search_index().update('loop', loop.id, *loop_documents(loop))
+        else:
+            get_search_index().rename('loop', loop.id, loop.title)
         return loop
     
     def get_loop(self, loop_id):
-        """Get a loop by ID"""
-        file_path = os.path.join(self.storage_dir, f"{loop_id}.json")
-        if not os.path.exists(file_path):
+        """Get a loop by ID, from its file or its cold-storage archive"""
+        started = time.perf_counter()
+        data, file_path = self._read_data(loop_id)
+        if data is None:
             return None
         
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        return Loop.from_dict(data)
+        loop = Loop.from_dict(data, lambda: self._read_messages(loop))
+        record_store_operation('loop', 'read' if file_path else 'cold_read', started, file_path)
+        return loop
+    
+    def _messages_path(self, loop_id):
+        return os.path.join(self.messages_dir, f"{loop_id}.json")
+    
+    def _read_messages(self, loop):
+        """Messages of a loop loaded header-only"""
+        started = time.perf_counter()
+        file_path = self._messages_path(loop.id)
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                rows = loads(f.read())["messages"]
+        elif loop.message_count:
+            # The loop was archived after its header was read
+            archived = self.cold.read(loop.id)
+            if archived is None or "messages" not in archived:
+                raise FileNotFoundError(f"Messages of loop {loop.id} are missing: {file_path}")
+            rows = archived["messages"]
+        else:
+            return []
+        messages = [Message.from_dict(row) for row in rows]
+        record_store_operation('loop', 'read_messages', started, file_path)
+        return messages
+    
+    def _read_data(self, loop_id):
+        """Stored dict of a loop and its file path; the path is None for archived loops"""
+        file_path = os.path.join(self.storage_dir, f"{loop_id}.json")
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                return loads(f.read()), file_path
+        return self.cold.read(loop_id), None
     
     def list_loops(self):
         """List all loops"""
         loops = []
-        for filename in os.listdir(self.storage_dir):
-            if filename.endswith(".json"):
-                loop_id = filename[:-5]  # Remove '.json'
-                loop = self.get_loop(loop_id)
-                if loop:
-                    loops.append(loop)
+        loop_ids = [filename[:-5] for filename in os.listdir(self.storage_dir) if filename.endswith(".json")]
+        for loop_id in dict.fromkeys(loop_ids + self.cold.list_ids()):
+            loop = self.get_loop(loop_id)
+            if loop:
+                loops.append(loop)
         
         # Sort by updated_at (newest first)
         loops.sort(key=lambda c: c.updated_at, reverse=True)
@@ -302,7 +562,12 @@ class LoopStore:
     def delete_loop(self, loop_id):
         """Delete a loop by ID"""
         file_path = os.path.join(self.storage_dir, f"{loop_id}.json")
+        removed = self.cold.remove(loop_id)
         if os.path.exists(file_path):
             os.remove(file_path)
-            return True
-        return False
\ No newline at end of file
+            removed = True
+        if os.path.exists(self._messages_path(loop_id)):
+            os.remove(self._messages_path(loop_id))
+        if removed:
+            get_search_index().remove('loop', loop_id)
+        return removed
\ No newline at end of file
@@ -0,0 +1,533 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+import atexit
+import shutil
+import logging
+import threading
+from datetime import datetime
+from models.cold_storage import ColdStorage
+from models.serialization import loads, parse_timestamp
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Journal operations replayed on load before the snapshot is rewritten in the background
+MAX_JOURNAL_ENTRIES = 1000
+
+SNAPSHOT_VERSION = 1
+
+_WORD = re.compile(r'\w+')
+_CJK_RUN = re.compile(r'([\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)')
+
+
+def tokenize(text):
+    """Lowercased word tokens; CJK and Hangul runs become character bigrams"""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if word.isascii():
+            tokens.append(word)
+            continue
+        for i, part in enumerate(_CJK_RUN.split(word)):
+            if not part:
+                continue
+            if i % 2 and len(part) > 1:
+                tokens.extend(part[j:j + 2] for j in range(len(part) - 1))
+            else:
+                tokens.append(part)
+    return tokens
+
+
+class SearchIndex:
+    """Incrementally updated BM25 index over chat and loop messages"""
+
+    def __init__(self, index_dir="./data/search", chat_dir="./data/chats", loop_dir="./data/loops"):
+        self.index_dir = index_dir
+        self.source_dirs = {"chat": chat_dir, "loop": loop_dir}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._docs = {}  # Doc ID -> [kind, parent ID, message ID, role, text, timestamp, length]
+        self._parents = {}  # (kind, parent ID) -> {"title": ..., "messages": {message ID: (doc ID, text hash)}}
+        self._postings = {}  # Term -> {doc ID: term frequency}
+        self._total_length = 0
+        self._next_doc = 0
+        self._journal_entries = 0
+        self._dirty = False
+        self._compactor = None  # Thread writing a snapshot off the request path
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.index_dir, "index.json")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.index_dir, "journal.jsonl")
+
+    @property
+    def compacting_journal_path(self):
+        """Journal covered by a snapshot still being written; replayed before the live journal"""
+        return os.path.join(self.index_dir, "journal.compacting.jsonl")
+
+    def warm(self):
+        """Load the index in a background thread so the first search or save does not wait for it"""
+        threading.Thread(target=self.ensure_loaded, name='search-index-load', daemon=True).start()
+
+    def ensure_loaded(self):
+        """Load the index from disk, rebuilding it from the stores if the files are missing"""
+        with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            os.makedirs(self.index_dir, exist_ok=True)
+            if any(os.path.exists(path) for path in (self.snapshot_path, self.journal_path, self.compacting_journal_path)):
+                self._load_files()
+                source = "index files"
+            else:
+                self._rebuild_from_stores()
+                self._write_snapshot()
+                source = "stores"
+            self._loaded = True
+            logger.info(f"Search index loaded from {source}: {len(self._docs)} messages "
+                        f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def update(self, kind, parent_id, title, messages):
+        """Index the current messages of a chat or loop; messages are (id, role, text, timestamp) tuples"""
+        self.ensure_loaded()
+        with self._lock:
+            added, removed = self._apply_update(kind, parent_id, title, messages)
+            if added or removed or self._dirty:
+                self._append_journal({"op": "update", "kind": kind, "parent": parent_id, "title": title,
+                                      "add": added, "remove": removed})
+                self._dirty = False
+
+    def rename(self, kind, parent_id, title):
+        """Update the title of a chat or loop saved without its messages"""
+        self.ensure_loaded()
+        with self._lock:
+            if self._apply_rename(kind, parent_id, title):
+                self._append_journal({"op": "rename", "kind": kind, "parent": parent_id, "title": title})
+
+    def remove(self, kind, parent_id):
+        """Drop a deleted chat or loop from the index"""
+        self.ensure_loaded()
+        with self._lock:
+            if self._apply_remove(kind, parent_id):
+                self._append_journal({"op": "remove", "kind": kind, "parent": parent_id})
+
+    def search(self, query, kind=None, limit=20):
+        """Rank messages by BM25 for a query; returns (total matches, hits)"""
+        self.ensure_loaded()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count:
+                return 0, []
+            avg_length = self._total_length / doc_count
+
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id][6]
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+
+            if kind:
+                scores = {doc_id: score for doc_id, score in scores.items() if self._docs[doc_id][0] == kind}
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+            hits = []
+            for doc_id, score in top:
+                doc_kind, parent_id, message_id, role, text, timestamp, _ = self._docs[doc_id]
+                snippet, highlights = make_snippet(text, terms)
+                hits.append({
+                    "kind": doc_kind,
+                    "id": parent_id,
+                    "title": self._parents[(doc_kind, parent_id)]["title"],
+                    "message_id": message_id,
+                    "role": role,
+                    "timestamp": _iso(timestamp),
+                    "score": round(score, 4),
+                    "snippet": snippet,
+                    "highlights": highlights
+                })
+            return len(scores), hits
+
+    def get_stats(self):
+        """Document, term and conversation counts"""
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "messages": len(self._docs),
+                "terms": len(self._postings),
+                "conversations": len(self._parents),
+                "journal_entries": self._journal_entries
+            }
+
+    def flush(self):
+        """Write a snapshot and truncate the journal"""
+        with self._lock:
+            self._wait_for_compaction()
+            if self._loaded and (self._journal_entries or os.path.exists(self.compacting_journal_path)):
+                self._write_snapshot()
+
+    def _apply_update(self, kind, parent_id, title, messages):
+        """Diff a parent's messages against the index; returns (added rows, removed message IDs)"""
+        parent = self._parents.get((kind, parent_id))
+        if parent is None:
+            parent = self._parents[(kind, parent_id)] = {"title": title, "messages": {}}
+        if parent["title"] != title:
+            parent["title"] = title
+            self._dirty = True
+
+        known = parent["messages"]
+        current = set()
+        added = []
+        for message_id, role, text, timestamp in messages:
+            current.add(message_id)
+            entry = known.get(message_id)
+            digest = hash(text)
+            if entry is not None:
+                if entry[1] == digest:
+                    continue
+                self._remove_doc(entry[0])
+            known[message_id] = (self._add_doc(kind, parent_id, message_id, role, text, timestamp), digest)
+            added.append([message_id, role, text, timestamp])
+
+        removed = [message_id for message_id in known if message_id not in current]
+        for message_id in removed:
+            self._remove_doc(known.pop(message_id)[0])
+        return added, removed
+
+    def _apply_rename(self, kind, parent_id, title):
+        parent = self._parents.get((kind, parent_id))
+        if parent is None or parent["title"] == title:
+            return False
+        parent["title"] = title
+        return True
+
+    def _apply_remove(self, kind, parent_id):
+        parent = self._parents.pop((kind, parent_id), None)
+        if parent is None:
+            return False
+        for doc_id, _ in parent["messages"].values():
+            self._remove_doc(doc_id)
+        return True
+
+    def _add_doc(self, kind, parent_id, message_id, role, text, timestamp):
+        doc_id = self._next_doc
+        self._next_doc += 1
+        tokens = tokenize(text)
+        self._docs[doc_id] = [kind, parent_id, message_id, role, text, timestamp, len(tokens)]
+        self._total_length += len(tokens)
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, tf in frequencies.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+            postings[doc_id] = tf
+        return doc_id
+
+    def _remove_doc(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc[6]
+        for token in set(tokenize(doc[4])):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def _append_journal(self, entry):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal_entries += 1
+        if self._journal_entries >= MAX_JOURNAL_ENTRIES:
+            self._start_compaction()
+
+    def _start_compaction(self):
+        """Capture the index and set the journal aside, then write the snapshot in a background thread"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        parents = self._snapshot_parents()
+        if os.path.exists(self.compacting_journal_path):
+            # A failed compaction left its journal behind; keep its entries ahead of the new ones
+            with open(self.journal_path, 'rb') as src, open(self.compacting_journal_path, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.compacting_journal_path)
+        self._journal_entries = 0
+        self._compactor = threading.Thread(target=self._finish_compaction, args=(parents,),
+                                           name='search-index-compaction', daemon=True)
+        self._compactor.start()
+
+    def _finish_compaction(self, parents):
+        try:
+            self._write_snapshot_file(parents)
+            os.remove(self.compacting_journal_path)
+        except OSError as e:
+            # The set-aside journal stays and is replayed on load until a later snapshot covers it
+            logger.error(f"Writing the search index snapshot failed: {e}")
+
+    def _wait_for_compaction(self):
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+    def _write_snapshot(self):
+        """Persist every indexed message and start a new journal"""
+        self._wait_for_compaction()
+        self._write_snapshot_file(self._snapshot_parents())
+        open(self.journal_path, 'w').close()
+        if os.path.exists(self.compacting_journal_path):
+            os.remove(self.compacting_journal_path)
+        self._journal_entries = 0
+
+    def _snapshot_parents(self):
+        """Every indexed message by parent; the rows share their strings with the index"""
+        parents = {}
+        for (kind, parent_id), parent in self._parents.items():
+            rows = []
+            for message_id, (doc_id, _) in parent["messages"].items():
+                _, _, _, role, text, timestamp, _ = self._docs[doc_id]
+                rows.append([message_id, role, text, timestamp])
+            parents[f"{kind}:{parent_id}"] = {"title": parent["title"], "messages": rows}
+        return parents
+
+    def _write_snapshot_file(self, parents):
+        os.makedirs(self.index_dir, exist_ok=True)
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": SNAPSHOT_VERSION, "parents": parents}, f, ensure_ascii=False)
+        os.replace(temp_path, self.snapshot_path)
+
+    def _load_files(self):
+        """Load the snapshot, then replay the journal written since"""
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for key, parent in data.get("parents", {}).items():
+                    kind, parent_id = key.split(":", 1)
+                    self._apply_update(kind, parent_id, parent["title"], parent["messages"])
+            except (OSError, ValueError) as e:
+                logger.warning(f"Search index snapshot unreadable, rebuilding from stores: {e}")
+                self._reset()
+                self._rebuild_from_stores()
+                self._write_snapshot()
+                return
+
+        for path in (self.compacting_journal_path, self.journal_path):
+            if os.path.exists(path):
+                self._replay_journal(path)
+        self._dirty = False
+
+    def _replay_journal(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from an interrupted write
+                    continue
+                self._journal_entries += 1
+                if entry["op"] == "remove":
+                    self._apply_remove(entry["kind"], entry["parent"])
+                elif entry["op"] == "rename":
+                    self._apply_rename(entry["kind"], entry["parent"], entry["title"])
+                else:
+                    self._replay_update(entry)
+
+    def _replay_update(self, entry):
+        key = (entry["kind"], entry["parent"])
+        parent = self._parents.get(key)
+        rows = {}
+        if parent is not None:
+            for message_id, (doc_id, _) in parent["messages"].items():
+                _, _, _, role, text, timestamp, _ = self._docs[doc_id]
+                rows[message_id] = [message_id, role, text, timestamp]
+        for message_id in entry.get("remove", []):
+            rows.pop(message_id, None)
+        for row in entry.get("add", []):
+            rows[row[0]] = row
+        self._apply_update(entry["kind"], entry["parent"], entry["title"], list(rows.values()))
+
+    def _rebuild_from_stores(self):
+        """Index every stored chat and loop, including archived ones"""
+        for kind, directory in self.source_dirs.items():
+            if not os.path.isdir(directory):
+                continue
+            cold = ColdStorage(directory)
+            for filename in os.listdir(directory):
+                if filename.endswith('.json'):
+                    self._index_stored(kind, filename[:-5], lambda path=os.path.join(directory, filename): _read_stored(path))
+            for object_id in cold.list_ids():
+                self._index_stored(kind, object_id, lambda object_id=object_id: cold.read(object_id))
+        self._dirty = False
+
+    def _index_stored(self, kind, object_id, read):
+        try:
+            data = read()
+            if kind == "chat" and data.get("base"):
+                # Forks are indexed with their shared history, as live updates index them
+                segment_dir = os.path.join(self.source_dirs["chat"], "segments")
+                data["messages"] = _read_prefix(segment_dir, data["base"]) + data.get("messages", [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {kind} {object_id} while rebuilding the search index: {e}")
+            return
+        title, messages = (chat_documents if kind == "chat" else loop_documents)(data)
+        self._apply_update(kind, data.get("id", object_id), title, messages)
+
+    def _reset(self):
+        self._docs = {}
+        self._parents = {}
+        self._postings = {}
+        self._total_length = 0
+        self._next_doc = 0
+        self._journal_entries = 0
+
+
+def chat_documents(chat):
+    """(title, rows) for a chat object or its stored dict; system messages are not indexed"""
+    if isinstance(chat, dict):
+        messages = [(m.get("id"), m.get("role"), m.get("content"), m.get("timestamp")) for m in chat.get("messages", [])]
+        title = chat.get("title")
+    else:
+        messages = [(m.id, m.role, m.content, m.stored_timestamp) for m in chat.messages]
+        title = chat.title
+    rows = []
+    for message_id, role, content, timestamp in messages:
+        if role == "system":
+            continue
+        rows.append((message_id, role, _text(content), timestamp))
+    return title, rows
+
+
+def loop_documents(loop):
+    """(title, rows) for a loop object or its stored dict; senders are shown by participant name"""
+    if isinstance(loop, dict):
+        names = {p.get("id"): p.get("display_name") for p in loop.get("participants", [])}
+        messages = [(m.get("id"), m.get("sender"), m.get("content"), m.get("timestamp")) for m in loop.get("messages", [])]
+        title = loop.get("title")
+    else:
+        names = {p.id: p.display_name for p in loop.participants}
+        messages = [(m.id, m.sender, m.content, m.stored_timestamp) for m in loop.messages]
+        title = loop.title
+    rows = []
+    for message_id, sender, content, timestamp in messages:
+        if sender == "system":
+            continue
+        rows.append((message_id, names.get(sender, sender), _text(content), timestamp))
+    return title, rows
+
+
+def _read_json(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def _read_stored(path):
+    """Stored dict of a chat or loop, with messages kept in a separate file merged back in"""
+    data = _read_json(path)
+    if "messages" not in data:
+        directory, filename = os.path.split(path)
+        messages_path = os.path.join(directory, "messages", filename)
+        stored = _read_json(messages_path) if os.path.exists(messages_path) else {"messages": []}
+        data["messages"] = stored["messages"]
+        if "base" in stored:
+            # The messages file is written first and names the prefix its messages continue
+            data["base"] = stored["base"]
+    return data
+
+
+def _read_prefix(segment_dir, ref):
+    """Message dicts of a fork's shared prefix, read from the chat store's segments"""
+    parts = []
+    while ref:
+        segment = _read_json(os.path.join(segment_dir, f"{ref['segment']}.json"))
+        parts.append(segment["messages"][:ref["upto"]])
+        ref = segment["base"]
+    return [msg for part in reversed(parts) for msg in part]
+
+
+def _text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+    return "" if content is None else str(content)
+
+
+def _iso(timestamp):
+    """ISO form of a message timestamp, from a datetime or either stored form"""
+    if timestamp is None or isinstance(timestamp, str):
+        return timestamp
+    if not isinstance(timestamp, datetime):
+        timestamp = parse_timestamp(timestamp)
+    return timestamp.isoformat()
+
+
+def make_snippet(text, terms, width=160):
+    """Window of text around the first matching term, with highlight offsets within the snippet"""
+    lowered = text.lower()
+    spans = []
+    for term in terms:
+        start = lowered.find(term)
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lowered.find(term, start + len(term))
+    if not spans:
+        return text[:width], []
+
+    # Overlapping bigram matches become one highlight
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    spans = merged
+    first = spans[0][0]
+    begin = max(0, first - width // 3)
+    end = min(len(text), begin + width)
+    prefix = "…" if begin > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    offset = len(prefix) - begin
+    highlights = [[s + offset, e + offset] for s, e in spans if s >= begin and e <= end]
+    return prefix + text[begin:end] + suffix, highlights
+
+
+# Process-wide index shared by ChatStore and LoopStore
+_search_index = SearchIndex()
+atexit.register(_search_index.flush)
+
+
+def get_search_index():
+    """Get the process-wide search index"""
+    return _search_index
+
+
+def configure_search_index(index_dir, chat_dir="./data/chats", loop_dir="./data/loops"):
+    """Point the process-wide index at other directories; must run before it is loaded"""
+    _search_index.index_dir = index_dir
+    _search_index.source_dirs = {"chat": chat_dir, "loop": loop_dir}
+    return _search_index
@@ -0,0 +1,49 @@
+import json
+from datetime import datetime
+
+# orjson is optional; the standard library is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Version of the compact on-disk format; files without a "format" key are the original
+# pretty-printed JSON with ISO timestamps, and are still read. From format 3 a chat or loop
+# file holds only the header and its messages live in messages/<id>.json; older files and
+# cold-storage archives keep the messages inline
+STORAGE_FORMAT = 3
+
+
+def dumps(data):
+    """Serialize stored data as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(raw):
+    """Parse stored JSON from bytes or text"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def to_epoch_ms(value):
+    """Stored form of a timestamp: integer milliseconds since the epoch"""
+    return int(value.timestamp() * 1000)
+
+
+def parse_timestamp(value):
+    """Timestamp from epoch milliseconds (current format) or an ISO string (original format)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000)
+    return datetime.fromisoformat(value)
+
+
+def format_timestamp(value, storage=False):
+    """Timestamp as epoch milliseconds for storage, or as an ISO string for the API"""
+    if value is None:
+        return None
+    return to_epoch_ms(value) if storage else value.isoformat()
@@ -0,0 +1,22 @@
+import os
+import time
+from ai_toolkit.metrics import get_metrics
+
+# Store metrics shared by ChatStore and LoopStore, recorded only while metrics are enabled
+_metrics = get_metrics()
+STORE_SECONDS = _metrics.histogram(
+    'store_operation_duration_seconds', 'Chat and loop store operation latency', ('store', 'operation'))
+STORE_BYTES = _metrics.counter(
+    'store_bytes_total', 'Bytes read and written by the chat and loop stores', ('store', 'operation'))
+
+
+def record_store_operation(store, operation, started, file_path=None):
+    """Record the duration of a store operation and the size of the file it touched"""
+    if not _metrics.enabled:
+        return
+    STORE_SECONDS.observe(time.perf_counter() - started, store, operation)
+    if file_path:
+        try:
+            STORE_BYTES.inc(os.path.getsize(file_path), store, operation)
+        except OSError:
+            pass
@@ -0,0 +1,39 @@
+# Token counts summed across usage records
+USAGE_TOKEN_FIELDS = (
+    'input_tokens',
+    'output_tokens',
+    'cache_creation_input_tokens',
+    'cache_read_input_tokens',
+    'reasoning_tokens'
+)
+
+
+def empty_usage_totals():
+    """Zeroed usage totals"""
+    totals = {field: 0 for field in USAGE_TOKEN_FIELDS}
+    totals.update({"requests": 0, "latency_ms": 0.0, "cost_usd": 0.0})
+    return totals
+
+
+def add_usage(totals, usage):
+    """Add one message's usage record to running totals"""
+    if not usage:
+        return totals
+
+    totals["requests"] += 1
+    for field in USAGE_TOKEN_FIELDS:
+        totals[field] += usage.get(field, 0) or 0
+    totals["latency_ms"] += usage.get("latency_ms", 0.0) or 0.0
+    totals["cost_usd"] += usage.get("cost_usd", 0.0) or 0.0
+    return totals
+
+
+def summarize_usage(totals):
+    """Add derived totals and averages to usage totals"""
+    summary = dict(totals)
+    summary["prompt_tokens"] = (
+        totals["input_tokens"] + totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+    )
+    summary["total_tokens"] = summary["prompt_tokens"] + totals["output_tokens"]
+    summary["avg_latency_ms"] = totals["latency_ms"] / totals["requests"] if totals["requests"] else 0.0
+    return summary
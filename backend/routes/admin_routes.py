@@ -0,0 +1,94 @@
+import hmac
+from flask import Blueprint, Response, current_app, jsonify, request
+from services.profiling_service import SamplingProfiler, MemoryProfiler, to_collapsed_text, to_flamegraph_tree
+
+admin_bp = Blueprint('admin', __name__)
+cpu_profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
+
+@admin_bp.before_request
+def check_profiling_enabled():
+    """Hide the admin endpoints unless profiling is enabled, and check the admin token if one is set"""
+    if not current_app.config.get('PROFILING_ENABLED'):
+        return jsonify({"error": "Profiling is disabled"}), 404
+
+    token = current_app.config.get('PROFILING_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({"error": "Invalid admin token"}), 403
+
+@admin_bp.route('/profile/cpu/start', methods=['POST'])
+def start_cpu_profile():
+    """Start the sampling profiler"""
+    data = request.json or {}
+    try:
+        interval_ms = float(data.get('interval_ms', 10))
+        duration = float(data['duration']) if data.get('duration') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "interval_ms and duration must be numbers"}), 400
+
+    error = cpu_profiler.start(interval_ms, duration)
+    if error:
+        return jsonify({"error": error}), 409
+
+    return jsonify({"status": "started", "interval_ms": interval_ms})
+
+@admin_bp.route('/profile/cpu/stop', methods=['POST'])
+def stop_cpu_profile():
+    """Stop the sampling profiler and return the profile"""
+    return _profile_response(cpu_profiler.stop())
+
+@admin_bp.route('/profile/cpu', methods=['GET'])
+def get_cpu_profile():
+    """Get the profile collected so far"""
+    return _profile_response(cpu_profiler.get_profile())
+
+def _profile_response(profile):
+    """Render a profile as collapsed stacks (default), a flamegraph tree or raw counts"""
+    output = request.args.get('format', 'collapsed')
+    if output == 'collapsed':
+        return Response(to_collapsed_text(profile['stacks']), mimetype='text/plain')
+    if output == 'flamegraph':
+        profile = dict(profile, stacks=to_flamegraph_tree(profile['stacks']))
+    elif output != 'json':
+        return jsonify({"error": f"Unknown format: {output}"}), 400
+
+    return jsonify(profile)
+
+@admin_bp.route('/profile/memory/start', methods=['POST'])
+def start_memory_tracing():
+    """Start tracing allocations"""
+    data = request.json or {}
+    return jsonify(memory_profiler.start(data.get('frames', 1)))
+
+@admin_bp.route('/profile/memory/stop', methods=['POST'])
+def stop_memory_tracing():
+    """Stop tracing allocations and drop snapshots"""
+    return jsonify(memory_profiler.stop())
+
+@admin_bp.route('/profile/memory', methods=['GET'])
+def get_memory_status():
+    """Get tracing state and stored snapshots"""
+    return jsonify(memory_profiler.get_status())
+
+@admin_bp.route('/profile/memory/snapshot', methods=['POST'])
+def take_memory_snapshot():
+    """Take a snapshot and return allocations by module"""
+    data = request.json or {}
+    result = memory_profiler.take_snapshot(int(data.get('limit', 50)), data.get('group', 'module'))
+    if "error" in result:
+        return jsonify(result), 409
+
+    return jsonify(result)
+
+@admin_bp.route('/profile/memory/diff', methods=['POST'])
+def diff_memory_snapshots():
+    """Compare a stored snapshot with another one or with the current heap"""
+    data = request.json or {}
+    if not data.get('base'):
+        return jsonify({"error": "No base snapshot provided"}), 400
+
+    result = memory_profiler.diff(data['base'], data.get('target'), int(data.get('limit', 50)), data.get('group', 'module'))
+    if "error" in result:
+        return jsonify(result), 404 if "not found" in result["error"] else 409
+
+    return jsonify(result)
@@ -1,8 +1,14 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response
 from services.chat_service import ChatService
+from services.chat_job_service import ChatJobService
 
 chat_bp = Blueprint('chat', __name__)
 chat_service = ChatService()
+chat_job_service = ChatJobService(chat_service)
+
+# Seconds between SSE keep-alive comments while a job is pending
+JOB_EVENTS_HEARTBEAT = 15
 
 @chat_bp.route('/new', methods=['POST'])
 def create_chat():
@@ -34,6 +40,58 @@ def get_chat(chat_id):
     
     return jsonify(chat.to_dict())
 
+@chat_bp.route('/<chat_id>/usage', methods=['GET'])
+def get_chat_usage(chat_id):
+    """Get token usage and cost totals for a chat, overall and per model"""
+    chat = chat_service.get_chat(chat_id)
+    
+    if not chat:
+        return jsonify({"error": "Chat not found"}), 404
+    
+    return jsonify(chat.get_usage())
+
+@chat_bp.route('/<chat_id>/compaction', methods=['GET'])
+def get_compaction(chat_id):
+    """Get a chat's history compaction policy, context size and summary"""
+    status = chat_service.get_compaction_status(chat_id)
+    
+    if status is None:
+        return jsonify({"error": "Chat not found"}), 404
+    
+    return jsonify(status)
+
+@chat_bp.route('/<chat_id>/compaction', methods=['PUT'])
+def update_compaction(chat_id):
+    """Override compaction settings (enabled, model, threshold_tokens, keep_recent) for a chat"""
+    data = request.json
+    
+    if not isinstance(data, dict):
+        return jsonify({"error": "No compaction settings provided"}), 400
+    
+    result = chat_service.update_compaction_policy(chat_id, data)
+    
+    if result is None:
+        return jsonify({"error": "Chat not found"}), 404
+    if "error" in result:
+        return jsonify(result), 400
+    
+    return jsonify(result)
+
+@chat_bp.route('/<chat_id>/compact', methods=['POST'])
+def compact_chat(chat_id):
+    """Condense the chat's older history into its summary now"""
+    try:
+        result = chat_service.compact_chat(chat_id)
+    except Exception as e:
+        return jsonify({"error": f"Compaction failed: {e}", "status": "error"}), 502
+    
+    if result.get("error") == "Chat not found":
+        return jsonify(result), 404
+    if "error" in result:
+        return jsonify(result), 409
+    
+    return jsonify(result)
+
 @chat_bp.route('/<chat_id>/message', methods=['POST'])
 def add_message(chat_id):
     """Add a message to a chat and get AI response"""
@@ -47,6 +105,18 @@ def add_message(chat_id):
     if not chat:
         return jsonify({"error": "Chat not found", "status": "error"}), 404
     
+    # Job mode: persist the message, generate in the background and return immediately
+    if data.get('async') or request.args.get('async') in ('1', 'true'):
+        job, error = chat_job_service.submit(chat_id, data['content'])
+        if not job:
+            status_code = 404 if error == "Chat not found" else 429
+            return jsonify({"error": error, "status": "error"}), status_code
+        
+        response = jsonify({"status": "accepted", "job": job.to_dict()})
+        response.status_code = 202
+        response.headers['Location'] = f"/api/chat/jobs/{job.id}"
+        return response
+    
     try:
         result = chat_service.add_message_and_get_response(chat_id, data['content'])
         
@@ -66,6 +136,18 @@ def add_message(chat_id):
         print(f"Error processing message: {str(e)}")
         return jsonify({"error": str(e), "status": "error"}), 500
 
+@chat_bp.route('/<chat_id>/fork', methods=['POST'])
+def fork_chat(chat_id):
+    """Fork a chat at a message (?at=<message_id>), sharing the history up to it"""
+    data = request.get_json(silent=True) or {}
+    message_id = request.args.get('at') or data.get('at')
+    
+    result = chat_service.fork_chat(chat_id, message_id, data.get('title'))
+    if "error" in result:
+        return jsonify(result), 404
+    
+    return jsonify(result)
+
 @chat_bp.route('/<chat_id>/system', methods=['POST'])
 def update_system_message(chat_id):
     """Update system message for a chat"""
@@ -126,3 +208,60 @@ def delete_chat(chat_id):
         return jsonify({"error": "Chat not found"}), 404
     
     return jsonify({"status": "success"})
+
+
+@chat_bp.route('/jobs/stats', methods=['GET'])
+def get_job_stats():
+    """Get chat job queue metrics"""
+    return jsonify(chat_job_service.get_stats())
+
+def _job_payload(job):
+    """Job status, with the updated chat once the job has finished"""
+    payload = {"job": job.to_dict()}
+    if job.finished:
+        chat = chat_service.get_chat(job.chat_id)
+        payload["chat"] = chat.to_dict() if chat else None
+    return payload
+
+@chat_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a chat job"""
+    job = chat_job_service.get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify(_job_payload(job))
+
+@chat_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a chat job"""
+    job = chat_job_service.cancel_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+@chat_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream chat job status changes as server-sent events"""
+    job = chat_job_service.get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    def stream():
+        version = None
+        while True:
+            current = chat_job_service.wait_for_update(job, version, JOB_EVENTS_HEARTBEAT)
+            if current == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            yield f"event: {job.status}\ndata: {json.dumps(_job_payload(job), ensure_ascii=False)}\n\n"
+            if job.finished:
+                return
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
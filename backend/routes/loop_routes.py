@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from services.loop_service import LoopService
+from models.loop import BUDGET_FIELDS
 
 loop_bp = Blueprint('loop', __name__)
 loop_service = LoopService()
@@ -31,6 +32,26 @@ def get_loop(loop_id):
     
     return jsonify(loop.to_dict())
 
+@loop_bp.route('/<loop_id>/prompt_cache', methods=['GET'])
+def get_prompt_cache_stats(loop_id):
+    """Get provider prompt cache usage for a loop"""
+    loop = loop_service.get_loop(loop_id)
+    
+    if not loop:
+        return jsonify({"error": "Loop not found"}), 404
+    
+    return jsonify(loop_service.get_prompt_cache_stats(loop_id))
+
+@loop_bp.route('/<loop_id>/usage', methods=['GET'])
+def get_loop_usage(loop_id):
+    """Get token usage and cost totals for a loop, overall and per participant"""
+    loop = loop_service.get_loop(loop_id)
+    
+    if not loop:
+        return jsonify({"error": "Loop not found"}), 404
+    
+    return jsonify(loop.get_usage())
+
 @loop_bp.route('/<loop_id>/title', methods=['POST'])
 def update_loop_title(loop_id):
     """Update the title of a loop"""
@@ -257,6 +278,53 @@ def update_loop_prompt(loop_id):
         "loop": loop.to_dict()
     })
 
+@loop_bp.route('/<loop_id>/budget', methods=['GET'])
+def get_loop_budget(loop_id):
+    """Get a loop's budget limits and current consumption"""
+    budget = loop_service.get_loop_budget(loop_id)
+    
+    if budget is None:
+        return jsonify({"error": "Loop not found"}), 404
+    
+    return jsonify(budget)
+
+@loop_bp.route('/<loop_id>/budget', methods=['PUT'])
+def update_loop_budget(loop_id):
+    """Set a loop's turn limit and budget; omitted or null limits are unlimited"""
+    data = request.json
+    
+    if not isinstance(data, dict):
+        return jsonify({"error": "No budget provided"}), 400
+    
+    limits = {}
+    for key in ("max_turns",) + BUDGET_FIELDS:
+        value = data.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            return jsonify({"error": f"{key} must be a non-negative number"}), 400
+        limits[key] = value
+    
+    if "max_cost_usd" in limits:
+        unpriced = loop_service.get_unpriced_models(loop_id)
+        if unpriced is None:
+            return jsonify({"error": "Loop not found"}), 404
+        if unpriced:
+            return jsonify({
+                "error": f"max_cost_usd needs pricing in the model config of {', '.join(unpriced)}"
+            }), 400
+    
+    max_turns = limits.pop("max_turns", None)
+    loop = loop_service.update_loop_budget(loop_id, int(max_turns) if max_turns is not None else None, limits)
+    
+    if not loop:
+        return jsonify({"error": "Loop not found"}), 404
+    
+    return jsonify({
+        "status": "success",
+        "loop": loop.to_dict()
+    })
+
 @loop_bp.route('/<loop_id>/stop_sequence', methods=['POST'])
 def add_stop_sequence(loop_id):
     """Add a stop sequence to a loop"""
@@ -330,4 +398,43 @@ def reorder_stop_sequences(loop_id):
     return jsonify({
         "status": "success",
         "loop": result["loop"].to_dict()
-    })
\ No newline at end of file
+    })
+@loop_bp.route('/batch_runs', methods=['POST'])
+def start_batch_run():
+    """Run the next turns of many loops as offline batch jobs"""
+    data = request.json or {}
+    
+    loop_ids = data.get('loop_ids')
+    if loop_ids is not None and not isinstance(loop_ids, list):
+        return jsonify({"error": "loop_ids must be a list"}), 400
+    
+    try:
+        rounds = int(data.get('rounds', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "rounds must be an integer"}), 400
+    if rounds < 1:
+        return jsonify({"error": "rounds must be at least 1"}), 400
+    
+    run = loop_service.start_batch_run(loop_ids, rounds, data.get('initial_prompt'))
+    
+    return jsonify(run), 202
+
+@loop_bp.route('/batch_runs/<run_id>', methods=['GET'])
+def get_batch_run(run_id):
+    """Get the progress of a batch run"""
+    run = loop_service.get_batch_run(run_id)
+    
+    if not run:
+        return jsonify({"error": "Batch run not found"}), 404
+    
+    return jsonify(run)
+
+@loop_bp.route('/batch_runs/<run_id>', methods=['DELETE'])
+def cancel_batch_run(run_id):
+    """Cancel a batch run"""
+    run = loop_service.cancel_batch_run(run_id)
+    
+    if not run:
+        return jsonify({"error": "Batch run not found"}), 404
+    
+    return jsonify(run)
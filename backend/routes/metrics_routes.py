@@ -0,0 +1,74 @@
+import time
+from flask import Blueprint, Response, jsonify, request, g
+from ai_toolkit import get_metrics, configure_metrics, get_response_cache, get_single_flight, get_provider_limiter
+from routes.chat_routes import chat_job_service
+from routes.loop_routes import loop_service
+
+metrics_bp = Blueprint('metrics', __name__)
+
+HTTP_REQUEST_SECONDS = get_metrics().histogram(
+    'http_request_duration_seconds', 'API request latency', ('route', 'method', 'status'))
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose metrics in the Prometheus text format"""
+    registry = get_metrics()
+    if not registry.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app):
+    """Enable metrics for the app and register request timing and runtime collectors"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    registry = configure_metrics(True)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+        return response
+
+    registry.register_collector(_collect_runtime)
+
+def _collect_runtime():
+    """Report loop, job queue, cache and provider concurrency state at scrape time"""
+    families = [
+        ('loop_active_threads', 'gauge', 'Loops with a running background thread',
+         [({}, sum(1 for thread in list(loop_service.active_loops.values()) if thread.is_alive()))])
+    ]
+
+    jobs = chat_job_service.get_stats()
+    families.append(('chat_jobs_queued', 'gauge', 'Chat jobs waiting for a worker', [({}, jobs['queued'])]))
+    families.append(('chat_jobs_running', 'gauge', 'Chat jobs being generated', [({}, jobs['running'])]))
+    families.append(('chat_jobs_finished_total', 'counter', 'Finished chat jobs by status',
+                     [({'status': status}, jobs.get(status, 0)) for status in ('succeeded', 'failed', 'cancelled')]))
+
+    cache = get_response_cache().get_stats()
+    families.append(('response_cache_lookups_total', 'counter', 'Response cache lookups by result',
+                     [({'result': 'hit'}, cache['hits']),
+                      ({'result': 'disk_hit'}, cache['disk_hits']),
+                      ({'result': 'miss'}, cache['misses'])]))
+    families.append(('response_cache_hit_ratio', 'gauge', 'Share of response cache lookups served from cache',
+                     [({}, cache['hit_ratio'])]))
+    families.append(('response_cache_entries', 'gauge', 'Responses held in memory', [({}, cache['entries'])]))
+
+    flights = get_single_flight().get_stats()
+    families.append(('provider_calls_total', 'counter', 'Provider calls by whether they ran or joined an identical call',
+                     [({'result': 'executed'}, flights['executions']),
+                      ({'result': 'coalesced'}, flights['coalesced'])]))
+
+    limits = get_provider_limiter().get_stats()
+    families.append(('provider_requests_active', 'gauge', 'Provider requests in flight',
+                     [({'provider': provider}, stats['active']) for provider, stats in limits.items()]))
+    families.append(('provider_requests_waiting', 'gauge', 'Callers waiting for a provider concurrency slot',
+                     [({'provider': provider}, stats['waiting']) for provider, stats in limits.items()]))
+    return families
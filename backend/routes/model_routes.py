@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response
 from services.model_service import ModelService
+from services.batch_service import BatchService
 
 model_bp = Blueprint('models', __name__)
 model_service = ModelService()
+batch_service = BatchService()
 
 @model_bp.route('/list', methods=['GET'])
 def list_models():
@@ -50,4 +53,53 @@ def update_model_parameters():
         model_service.update_model_parameters(model_name, parameters)
         return jsonify({"status": "success"})
     except ValueError as e:
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
+
+@model_bp.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """Get response cache metrics"""
+    return jsonify(model_service.get_cache_stats())
+
+@model_bp.route('/cache', methods=['DELETE'])
+def clear_cache():
+    """Clear the response cache"""
+    model_service.clear_cache()
+    return jsonify({"status": "success"})
+
+@model_bp.route('/tokens', methods=['POST'])
+def estimate_tokens():
+    """Estimate the input tokens of a prompt or message list for a model"""
+    data = request.json
+    
+    if not data or not (data.get('messages') or data.get('prompt')):
+        return jsonify({"error": "No messages or prompt provided"}), 400
+    
+    prompt = data.get('messages') or data['prompt']
+    if data.get('system'):
+        prompt = {"system": data['system'], "messages": prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]}
+    
+    try:
+        return jsonify(model_service.estimate_tokens(prompt, data.get('model')))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@model_bp.route('/tokens/calibration', methods=['GET'])
+def get_token_calibration():
+    """Get token estimator calibration per provider family"""
+    return jsonify(model_service.get_token_estimator_stats())
+
+@model_bp.route('/batch', methods=['POST'])
+def run_batch():
+    """Run many generation requests concurrently, streaming results as NDJSON"""
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+    
+    error = batch_service.validate_items(items)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    def stream():
+        for result in batch_service.run(items):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return Response(stream(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
@@ -0,0 +1,24 @@
+from flask import Blueprint, request, jsonify
+from services.search_service import SearchService
+
+search_bp = Blueprint('search', __name__)
+search_service = SearchService()
+
+@search_bp.route('', methods=['GET'])
+def search():
+    """Full-text search over chat and loop messages"""
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    
+    result = search_service.search(request.args.get('q', ''), request.args.get('type'), limit)
+    if "error" in result:
+        return jsonify(result), 400
+    
+    return jsonify(result)
+
+@search_bp.route('/stats', methods=['GET'])
+def search_stats():
+    """Get search index size"""
+    return jsonify(search_service.get_stats())
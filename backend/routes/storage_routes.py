@@ -0,0 +1,30 @@
+from flask import Blueprint, request, jsonify
+from services.tiering_service import TieringService
+from models.file_writer import get_file_writer
+from routes.chat_routes import chat_service
+from routes.loop_routes import loop_service
+
+storage_bp = Blueprint('storage', __name__)
+tiering_service = TieringService(chat_service.chat_store, loop_service.loop_store)
+
+@storage_bp.route('', methods=['GET'])
+def get_storage_stats():
+    """Get hot and cold storage sizes, cold read latency and write durability counters"""
+    stats = tiering_service.get_stats()
+    stats["writes"] = get_file_writer().get_stats()
+    
+    return jsonify(stats)
+
+@storage_bp.route('/tier', methods=['POST'])
+def run_tiering():
+    """Archive chats and loops idle for idle_days now"""
+    data = request.get_json(silent=True) or {}
+    try:
+        idle_days = float(data['idle_days']) if data.get('idle_days') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "idle_days must be a number"}), 400
+    
+    if idle_days is None and tiering_service.idle_days <= 0:
+        return jsonify({"error": "No idle_days provided and cold storage is disabled"}), 400
+    
+    return jsonify(tiering_service.run(idle_days))
@@ -0,0 +1,119 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ai_toolkit import ModelManager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class BatchService:
+    """Runs many independent generation requests concurrently on a bounded pool"""
+
+    def __init__(self, max_workers=8, max_items=100):
+        self.max_workers = max_workers
+        self.max_items = max_items
+        self.model_manager = ModelManager()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def configure(self, max_workers=8, max_items=100):
+        """Set pool size and per-request item limit; takes effect before the first batch runs"""
+        self.max_workers = max(1, int(max_workers))
+        self.max_items = max(1, int(max_items))
+        logger.info(f"Batch generation configured: workers={self.max_workers}, max_items={self.max_items}")
+
+    def validate_items(self, items):
+        """Check the request shape; returns an error message or None"""
+        if not isinstance(items, list) or not items:
+            return "No batch items provided"
+        if len(items) > self.max_items:
+            return f"Too many batch items: {len(items)} (limit {self.max_items})"
+        return None
+
+    def run(self, items):
+        """Yield one result per item as it finishes, followed by a summary"""
+        started = time.perf_counter()
+        executor = self._get_executor()
+        futures = {executor.submit(self._run_item, index, item): index for index, item in enumerate(items)}
+        succeeded = failed = 0
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                if result["status"] == "success":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield result
+        finally:
+            # Stop queued items if the client goes away
+            for future in futures:
+                future.cancel()
+
+        yield {
+            "summary": {
+                "total": len(items),
+                "succeeded": succeeded,
+                "failed": failed,
+                "elapsed_ms": (time.perf_counter() - started) * 1000
+            }
+        }
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='batch')
+            return self._executor
+
+    def _run_item(self, index, item):
+        """Generate the response for one item; failures are reported, not raised"""
+        result = {"index": index}
+        if isinstance(item, dict) and item.get("id") is not None:
+            result["id"] = item["id"]
+
+        started = time.perf_counter()
+        try:
+            model, prompt, params = self._parse_item(item)
+            result["model"] = model
+
+            # A dedicated manager per item keeps its parameters separate from other items
+            manager = ModelManager()
+            manager.change_model(model, persist=False)
+            if params:
+                manager.set_parameters(**params)
+
+            result["content"] = manager.generate_content(prompt, raise_errors=True)
+            result["usage"] = manager.last_usage
+            result["status"] = "success"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        result["latency_ms"] = (time.perf_counter() - started) * 1000
+        return result
+
+    def _parse_item(self, item):
+        """Extract (model, prompt, params) from a batch item"""
+        if not isinstance(item, dict):
+            raise ValueError("Batch item must be an object")
+
+        model = item.get("model") or self.model_manager.get_current_model()
+        if self.model_manager.get_model_record(model) is None:
+            raise ValueError(f"Unknown model: {model}")
+
+        messages = item.get("messages")
+        if messages is None and "prompt" in item:
+            messages = item["prompt"]
+        if not isinstance(messages, (str, list)) or not messages:
+            raise ValueError("Batch item needs 'messages' (list) or 'prompt' (string)")
+
+        prompt = messages
+        if item.get("system"):
+            if isinstance(messages, str):
+                messages = [{"role": "user", "content": messages}]
+            prompt = {"system": item["system"], "messages": messages}
+
+        params = {key: value for key, value in (item.get("params") or {}).items()
+                  if key in ("temperature", "max_tokens") and value is not None}
+        return model, prompt, params
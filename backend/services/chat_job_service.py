@@ -0,0 +1,239 @@
+import uuid
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from ai_toolkit.metrics import get_metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Job metrics, recorded only while metrics are enabled
+_metrics = get_metrics()
+CHAT_JOB_WAIT_SECONDS = _metrics.histogram(
+    'chat_job_queue_wait_seconds', 'Time a chat job spends queued before it starts')
+CHAT_JOB_RUN_SECONDS = _metrics.histogram(
+    'chat_job_run_duration_seconds', 'Time to run a chat job', ('status',))
+
+
+class ChatJob:
+    """A queued AI response to one user message"""
+
+    def __init__(self, chat_id, message_id):
+        self.id = str(uuid.uuid4())
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.status = QUEUED
+        self.error = None
+        self.reply = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        # Incremented on every state change; SSE streams wait on it
+        self.version = 0
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "chat_id": self.chat_id,
+            "message_id": self.message_id,
+            "status": self.status,
+            "error": self.error,
+            "reply": self.reply,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class ChatJobService:
+    """Runs chat responses in the background on a bounded pool, one job at a time per chat"""
+
+    def __init__(self, chat_service, max_workers=4, max_queue=100, max_finished=500):
+        self.chat_service = chat_service
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_finished = max_finished
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> ChatJob, oldest first
+        self._chat_queues = {}  # chat_id -> deque of queued jobs; present while the chat has work
+        self._queued = 0
+        self._running = 0
+        self._counters = {'submitted': 0, 'rejected': 0, SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+        self._wait_ms_total = 0.0
+        self._run_ms_total = 0.0
+        self._started_total = 0
+
+    def configure(self, max_workers=4, max_queue=100):
+        """Set pool size and queue limit; takes effect before the first job runs"""
+        with self._lock:
+            self.max_workers = max(1, int(max_workers))
+            self.max_queue = max(1, int(max_queue))
+        logger.info(f"Chat job queue configured: workers={self.max_workers}, max_queue={self.max_queue}")
+
+    def submit(self, chat_id, content):
+        """Persist a user message and queue its response; returns (job, error)"""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._counters['rejected'] += 1
+                return None, "Too many queued messages, please retry later"
+            # Reserve the queue slot before persisting the message
+            self._queued += 1
+
+        try:
+            chat, message = self.chat_service.add_user_message(chat_id, content)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+        if not chat:
+            with self._lock:
+                self._queued -= 1
+            return None, "Chat not found"
+
+        job = ChatJob(chat_id, message.id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._counters['submitted'] += 1
+            queue = self._chat_queues.get(chat_id)
+            if queue is None:
+                # No job is queued or running for this chat: start draining it
+                self._chat_queues[chat_id] = deque([job])
+                self._get_executor().submit(self._run_next, chat_id)
+            else:
+                # The chat's current job schedules this one when it finishes
+                queue.append(job)
+            self._evict_finished()
+
+        logger.info(f"Queued chat job {job.id} for chat {chat_id}")
+        return job, None
+
+    def get_job(self, job_id):
+        """Get a job by ID"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel_job(self, job_id):
+        """Cancel a job; queued jobs never run, running jobs discard their response"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.finished:
+                return job
+            job.cancel_event.set()
+            queue = self._chat_queues.get(job.chat_id)
+            if job.status == QUEUED and queue is not None and job in queue:
+                queue.remove(job)
+                self._queued -= 1
+                self._finish(job, CANCELLED)
+        logger.info(f"Cancelled chat job {job_id}")
+        return job
+
+    def wait_for_update(self, job, version, timeout):
+        """Wait until the job changes past version; returns the current version"""
+        with job.changed:
+            if job.version == version:
+                job.changed.wait(timeout)
+            return job.version
+
+    def get_stats(self):
+        """Get queue depth and throughput metrics"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "active_chats": len(self._chat_queues),
+                "jobs_tracked": len(self._jobs),
+                **self._counters,
+                "avg_wait_ms": self._wait_ms_total / self._started_total if self._started_total else 0.0,
+                "avg_run_ms": self._run_ms_total / self._started_total if self._started_total else 0.0
+            }
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='chat-job')
+        return self._executor
+
+    def _run_next(self, chat_id):
+        """Run the oldest queued job of a chat, then hand the chat back to the pool"""
+        with self._lock:
+            queue = self._chat_queues.get(chat_id)
+            if not queue:
+                self._chat_queues.pop(chat_id, None)
+                return
+            job = queue.popleft()
+            self._queued -= 1
+            self._running += 1
+            self._started_total += 1
+            wait_seconds = (datetime.now() - job.created_at).total_seconds()
+            self._wait_ms_total += wait_seconds * 1000
+            CHAT_JOB_WAIT_SECONDS.observe(wait_seconds)
+            self._set_status(job, RUNNING)
+            job.started_at = datetime.now()
+
+        started = time.perf_counter()
+        status, error = FAILED, None
+        try:
+            result = self.chat_service.generate_reply(chat_id, job.message_id, job.cancel_event)
+            if job.cancel_event.is_set() or result.get("status") == "cancelled":
+                status = CANCELLED
+            elif result.get("status") == "success":
+                status = SUCCEEDED
+                job.reply = result.get("message")
+            else:
+                error = result.get("error", "Unknown error in generating response")
+        except Exception as e:
+            logger.error(f"Chat job {job.id} failed: {e}")
+            error = str(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                run_seconds = time.perf_counter() - started
+                self._run_ms_total += run_seconds * 1000
+                CHAT_JOB_RUN_SECONDS.observe(run_seconds, status)
+                job.error = error
+                self._finish(job, status)
+                # Requeue the chat behind other chats' work rather than draining it in this thread
+                if self._chat_queues.get(chat_id):
+                    self._get_executor().submit(self._run_next, chat_id)
+                else:
+                    self._chat_queues.pop(chat_id, None)
+
+    def _finish(self, job, status):
+        job.finished_at = datetime.now()
+        self._counters[status] += 1
+        self._set_status(job, status)
+
+    def _set_status(self, job, status):
+        with job.changed:
+            job.status = status
+            job.version += 1
+            job.changed.notify_all()
+
+    def _evict_finished(self):
+        """Forget the oldest finished jobs beyond max_finished"""
+        excess = len(self._jobs) - self.max_finished
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[job_id]
@@ -1,12 +1,17 @@
 from models.chat import Chat, ChatStore
 import uuid
+import threading
 from datetime import datetime
 from ai_toolkit import ModelManager
+from services.compaction_service import CompactionService, POLICY_KEYS
 
 class ChatService:
     def __init__(self):
         self.chat_store = ChatStore()
         self.model_manager = ModelManager()
+        self._chat_locks = {}
+        self._locks_guard = threading.Lock()
+        self.compaction_service = CompactionService(self)
     
     def create_chat(self, title=None, provider=None, model=None, parameters=None):
         """Create a new chat"""
@@ -18,28 +23,20 @@ class ChatService:
             if model and model != self.model_manager.get_current_model():
                 self.model_manager.change_model(model)
             
-            chat.provider = provider or self.model_manager.config.get('provider_mapping', {}).get(model, {}).get('provider')
+            chat.provider = provider or self.model_manager.get_provider(model)
             chat.model = model or self.model_manager.get_current_model()
             chat.parameters = parameters or self.model_manager.get_parameters(chat.provider, chat.model)
         else:
             # Use current model settings
             current_model = self.model_manager.get_current_model()
-            provider_info = self.model_manager.config.get('provider_mapping', {}).get(current_model, {})
-            
-            chat.provider = provider_info.get('provider')
+            chat.provider = self.model_manager.get_provider(current_model)
             chat.model = current_model
             chat.parameters = self.model_manager.get_parameters(chat.provider, chat.model)
         
         # Add system message based on model's system prompt if model supports it
-        model_config = self.model_manager.get_model_config(chat.model)
-        supports_system = model_config.get('supports_system_prompt', True)
-        
-        if supports_system:
-            system_prompt_key = model_config.get('system_prompt_key')
-            if system_prompt_key:
-                system_prompt = self.model_manager.prompts.get('system_prompts', {}).get(system_prompt_key, '')
-                if system_prompt:
-                    chat.add_message('system', system_prompt)
+        record = self.model_manager.get_model_record(chat.model)
+        if record and record.supports_system_prompt and record.system_prompt_key and record.system_message:
+            chat.add_message('system', record.system_message)
         
         # Save the chat
         self.chat_store.save_chat(chat)
@@ -60,158 +57,245 @@ class ChatService:
     
     def update_chat_title(self, chat_id, title):
         """Update the title of a chat"""
-        chat = self.chat_store.get_chat(chat_id)
-        
-        if not chat:
-            return {"error": "Chat not found"}
-        
-        chat.title = title
-        chat.updated_at = datetime.now()
-        
-        # Save the updated chat
-        self.chat_store.save_chat(chat)
-        
-        return {
-            "status": "success",
-            "chat": chat.to_dict()
-        }
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            
+            if not chat:
+                return {"error": "Chat not found"}
+            
+            chat.title = title
+            chat.updated_at = datetime.now()
+            
+            # Save the updated chat
+            self.chat_store.save_chat(chat)
+            
+            return {
+                "status": "success",
+                "chat": chat.to_dict()
+            }
     
     def update_system_message(self, chat_id, content):
         """Update system message for a chat"""
-        chat = self.chat_store.get_chat(chat_id)
-        
-        if not chat:
-            return {"error": "Chat not found"}
-        
-        # Check if model supports system messages
-        model_config = self.model_manager.get_model_config(chat.model)
-        supports_system = model_config.get('supports_system_prompt', True)
-        
-        if not supports_system:
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            
+            if not chat:
+                return {"error": "Chat not found"}
+            
+            # Check if model supports system messages
+            model_config = self.model_manager.get_model_config(chat.model)
+            supports_system = model_config.get('supports_system_prompt', True)
+            
+            if not supports_system:
+                return {
+                    "error": f"Model {chat.model} does not support system messages",
+                    "chat": chat.to_dict()
+                }
+            
+            # Find existing system message
+            system_message = next((msg for msg in chat.messages if msg.role == 'system'), None)
+            
+            if system_message:
+                # Update existing system message
+                system_message.content = content
+                system_message.timestamp = datetime.now()
+            else:
+                # Add new system message at the beginning
+                system_message = chat.add_message('system', content)
+                # Move system message to beginning of messages list
+                chat.messages.remove(system_message)
+                chat.messages.insert(0, system_message)
+            
+            # Update chat timestamp
+            chat.updated_at = datetime.now()
+            
+            # Save the updated chat
+            self.chat_store.save_chat(chat)
+            
             return {
-                "error": f"Model {chat.model} does not support system messages",
+                "status": "success",
                 "chat": chat.to_dict()
             }
+    
+    def update_chat_model(self, chat_id, model):
+        """Update the model for a chat"""
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
             
-        # Find existing system message
-        system_message = next((msg for msg in chat.messages if msg.role == 'system'), None)
-        
-        if system_message:
-            # Update existing system message
-            system_message.content = content
-            system_message.timestamp = datetime.now()
-        else:
-            # Add new system message at the beginning
-            system_message = chat.add_message('system', content)
-            # Move system message to beginning of messages list
-            chat.messages.remove(system_message)
-            chat.messages.insert(0, system_message)
-        
-        # Update chat timestamp
-        chat.updated_at = datetime.now()
-        
-        # Save the updated chat
-        self.chat_store.save_chat(chat)
+            if not chat:
+                return {"error": "Chat not found"}
+            
+            # Check if model exists in configuration
+            if self.model_manager.get_model_record(model) is None:
+                return {"error": f"Model {model} not found in configuration"}
+            
+            # Update model and related settings
+            chat.model = model
+            
+            # Get provider from model mapping
+            chat.provider = self.model_manager.get_provider(model)
+            
+            # Update parameters
+            chat.parameters = self.model_manager.get_parameters(chat.provider, chat.model)
+            
+            # Update chat timestamp
+            chat.updated_at = datetime.now()
+            
+            # Save the updated chat
+            self.chat_store.save_chat(chat)
+            
+            return {
+                "status": "success",
+                "chat": chat.to_dict()
+            }
+    
+    def fork_chat(self, chat_id, message_id=None, title=None):
+        """Branch a chat at a message; the fork shares the history up to it with the parent"""
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            if not chat:
+                return {"error": "Chat not found"}
+            
+            # Without a message the fork shares the whole history
+            count = len(chat.messages)
+            if message_id:
+                index = next((i for i, msg in enumerate(chat.messages) if msg.id == message_id), None)
+                if index is None:
+                    return {"error": "Message not found"}
+                count = index + 1
+            
+            fork = self.chat_store.fork_chat(chat, count, title)
         
         return {
             "status": "success",
-            "chat": chat.to_dict()
+            "chat": fork.to_dict()
         }
     
-    def update_chat_model(self, chat_id, model):
-        """Update the model for a chat"""
+    def get_compaction_status(self, chat_id):
+        """Get a chat's compaction policy, context size and summary"""
         chat = self.chat_store.get_chat(chat_id)
-        
         if not chat:
-            return {"error": "Chat not found"}
+            return None
+        return self.compaction_service.get_status(chat)
+    
+    def compact_chat(self, chat_id):
+        """Condense a chat's older history into its summary now"""
+        return self.compaction_service.compact(chat_id)
+    
+    def update_compaction_policy(self, chat_id, policy):
+        """Replace a chat's compaction overrides; returns an error message or the new status"""
+        for key, value in policy.items():
+            expected = POLICY_KEYS.get(key)
+            if expected is None:
+                return {"error": f"Unknown compaction setting: {key}"}
+            if value is not None and (not isinstance(value, expected) or (expected is int and isinstance(value, bool))):
+                return {"error": f"{key} must be of type {expected.__name__}"}
+        if policy.get('model') and self.model_manager.get_model_record(policy['model']) is None:
+            return {"error": f"Unknown model: {policy['model']}"}
         
-        # Check if model exists in configuration
-        if model not in self.model_manager.config.get('models', {}):
-            return {"error": f"Model {model} not found in configuration"}
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            if not chat:
+                return None
+            chat.compaction = {key: value for key, value in policy.items() if value is not None}
+            self.chat_store.save_chat(chat)
         
-        # Update model and related settings
-        chat.model = model
+        if self.compaction_service.needs_compaction(chat):
+            self.compaction_service.schedule(chat_id)
+        return self.compaction_service.get_status(chat)
+    
+    def _chat_lock(self, chat_id):
+        """Lock serializing read-modify-write cycles on one chat file"""
+        with self._locks_guard:
+            lock = self._chat_locks.get(chat_id)
+            if lock is None:
+                lock = self._chat_locks[chat_id] = threading.Lock()
+            return lock
+    
+    def add_user_message(self, chat_id, content):
+        """Add a user message to a chat and persist it; returns (chat, message)"""
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            if not chat:
+                return None, None
+            
+            message = chat.add_message('user', content)
+            self.chat_store.save_chat(chat)
+            return chat, message
+    
+    def generate_reply(self, chat_id, message_id, cancel_event=None):
+        """Generate and store the AI response to a persisted user message"""
+        # Snapshot the history up to the message being answered
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            if not chat:
+                return {"error": "Chat not found", "status": "error"}
+            index = next((i for i, msg in enumerate(chat.messages) if msg.id == message_id), None)
+            if index is None:
+                return {"error": "Message not found", "status": "error"}
+            # Older messages are replaced by the chat's summary once it has been compacted
+            history = self.compaction_service.build_context(chat, chat.messages[:index + 1])
+            model = chat.model
         
-        # Get provider from model mapping
-        provider_info = self.model_manager.config.get('provider_mapping', {}).get(model, {})
-        chat.provider = provider_info.get('provider')
+        # Get AI response with the chat's model; stored messages are read directly into the canonical conversation
+        # The chat is not locked during the provider call, so new messages can be queued meanwhile
+        error_message = None
+        usage = None
+        try:
+            response_content, usage = self.model_manager.generate_with_usage(history, model_type=model)
+        except Exception as e:
+            error_message = f"Error: {str(e)}"
         
-        # Update parameters
-        chat.parameters = self.model_manager.get_parameters(chat.provider, chat.model)
+        if cancel_event is not None and cancel_event.is_set():
+            return {"status": "cancelled"}
         
-        # Update chat timestamp
-        chat.updated_at = datetime.now()
+        with self._chat_lock(chat_id):
+            chat = self.chat_store.get_chat(chat_id)
+            if not chat:
+                return {"error": "Chat not found", "status": "error"}
+            
+            # Add the response, or the error message, right after the message it answers
+            if error_message:
+                reply = chat.add_message('system', error_message)
+            else:
+                reply = chat.add_message('assistant', response_content, usage=usage)
+            chat.messages.pop()
+            position = next((i for i, msg in enumerate(chat.messages) if msg.id == message_id), len(chat.messages) - 1) + 1
+            while position < len(chat.messages) and chat.messages[position].role != 'user':
+                position += 1
+            chat.messages.insert(position, reply)
+            
+            # Check the history size before saving, so token counts are stored with the messages
+            compact = not error_message and self.compaction_service.needs_compaction(chat)
+            
+            # Save the updated chat
+            self.chat_store.save_chat(chat)
         
-        # Save the updated chat
-        self.chat_store.save_chat(chat)
+        if error_message:
+            return {
+                "error": error_message,
+                "status": "error",
+                "chat": chat.to_dict()
+            }
         
+        # Condense older history in the background once the chat outgrows its threshold
+        if compact:
+            self.compaction_service.schedule(chat_id)
         return {
             "status": "success",
+            "message": reply.to_dict(),
             "chat": chat.to_dict()
         }
     
     def add_message_and_get_response(self, chat_id, content):
         """Add a user message to a chat and get AI response"""
-        chat = self.chat_store.get_chat(chat_id)
-        
-        if not chat:
-            return {"error": "Chat not found", "status": "error"}
-        
         try:
-            # Add user message
-            user_message = chat.add_message('user', content)
-            
             # Save chat with user message immediately so it persists even if AI response fails
-            self.chat_store.save_chat(chat)
+            chat, user_message = self.add_user_message(chat_id, content)
+            if not chat:
+                return {"error": "Chat not found", "status": "error"}
             
-            # Make sure we're using the right model
-            current_model = self.model_manager.get_current_model()
-            if chat.model != current_model:
-                self.model_manager.change_model(chat.model)
-            
-            # Get model provider
-            model_config = self.model_manager.get_model_config(chat.model)
-            provider = model_config.get('provider', None)
-            
-            # Get messages in format expected by model manager
-            messages = []
-            for msg in chat.messages:
-                if provider == 'openai' and msg.role == 'user':
-                    # For OpenAI, user messages need content as an array with type field
-                    messages.append({
-                        "role": msg.role,
-                        "content": [{"type": "text", "text": msg.content}]
-                    })
-                else:
-                    # For other providers or non-user messages, use string content
-                    messages.append({
-                        "role": msg.role,
-                        "content": msg.content
-                    })
-            
-            # Get AI response
-            try:
-                response_content = self.model_manager.generate_content(messages)
-                ai_message = chat.add_message('assistant', response_content)
-                
-                # Save the updated chat
-                self.chat_store.save_chat(chat)
-                
-                return {
-                    "status": "success",
-                    "chat": chat.to_dict()
-                }
-            except Exception as e:
-                # Add error message to chat
-                error_message = f"Error: {str(e)}"
-                chat.add_message('system', error_message)
-                self.chat_store.save_chat(chat)
-                
-                return {
-                    "error": error_message,
-                    "status": "error", 
-                    "chat": chat.to_dict()
-                }
+            return self.generate_reply(chat_id, user_message.id)
                 
         except Exception as e:
             print(f"Unexpected error in add_message_and_get_response: {str(e)}")
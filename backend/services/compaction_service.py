@@ -0,0 +1,189 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from ai_toolkit import ModelManager, get_token_estimator
+from ai_toolkit.messages import message_text
+from models.chat import Message
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Used when config.yaml has no 'compaction' section; chats can override any key
+DEFAULT_COMPACTION_SETTINGS = {
+    'enabled': True,
+    'model': 'gemini-2.0-flash-lite',
+    'threshold_tokens': 24000,
+    'context_ratio': 0.5,
+    'keep_recent': 8,
+    'summary_max_tokens': 1024
+}
+
+# Chat-level policy keys and their types
+POLICY_KEYS = {
+    'enabled': bool,
+    'model': str,
+    'threshold_tokens': int,
+    'keep_recent': int
+}
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Update the summary with the new messages. Keep facts, decisions, names, numbers, code "
+    "identifiers, open questions and the user's preferences; drop pleasantries and repetition. "
+    "Write it as notes for the assistant to continue the conversation. Reply with the summary only."
+)
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+class CompactionService:
+    """Condenses older chat history into a stored summary in the background"""
+
+    def __init__(self, chat_service):
+        self.chat_service = chat_service
+        self.model_manager = chat_service.model_manager
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def get_policy(self, chat):
+        """Effective compaction settings for a chat: defaults, then config, then the chat's own policy"""
+        policy = dict(DEFAULT_COMPACTION_SETTINGS)
+        policy.update(self.model_manager.config.get('compaction', {}) or {})
+        policy.update(chat.compaction or {})
+        return policy
+
+    def get_threshold(self, chat, policy):
+        """History size in tokens above which the chat is compacted"""
+        threshold = policy['threshold_tokens']
+        model_config = self.model_manager.get_model_config(chat.model) or {}
+        if model_config.get('context_window'):
+            threshold = min(threshold, int(model_config['context_window'] * policy['context_ratio']))
+        return threshold
+
+    def build_context(self, chat, history):
+        """Messages to send for a history: leading system messages, the summary and the messages after it"""
+        summary = chat.summary
+        if not summary:
+            return history
+
+        through = next((i for i, msg in enumerate(history) if msg.id == summary['through_message_id']), None)
+        if through is None:
+            return history
+
+        leading = 0
+        while leading < len(history) and history[leading].role == 'system':
+            leading += 1
+        summary_message = Message('system', f"{SUMMARY_HEADER}\n{summary['content']}")
+        return history[:leading] + [summary_message] + history[max(through + 1, leading):]
+
+    def get_status(self, chat):
+        """Policy, threshold, current context size and summary of a chat"""
+        policy = self.get_policy(chat)
+        return {
+            "policy": policy,
+            "threshold_tokens": self.get_threshold(chat, policy),
+            "context_tokens": self._context_tokens(chat),
+            "raw_tokens": self._count_tokens(chat, chat.messages),
+            "summary": chat.summary,
+            "pending": chat.id in self._pending
+        }
+
+    def needs_compaction(self, chat):
+        """Whether compaction is enabled for the chat and its context is over the threshold"""
+        policy = self.get_policy(chat)
+        return bool(policy['enabled']) and self._context_tokens(chat) > self.get_threshold(chat, policy)
+
+    def schedule(self, chat_id):
+        """Compact the chat in the background unless it is already queued"""
+        with self._lock:
+            if chat_id in self._pending:
+                return False
+            self._pending.add(chat_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compaction')
+        self._executor.submit(self._run, chat_id)
+        return True
+
+    def _run(self, chat_id):
+        try:
+            self.compact(chat_id)
+        except Exception as e:
+            logger.error(f"Compaction of chat {chat_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(chat_id)
+
+    def compact(self, chat_id):
+        """Fold the messages older than the recent tail into the chat's summary; returns the result"""
+        chat = self.chat_service.get_chat(chat_id)
+        if not chat:
+            return {"error": "Chat not found", "status": "error"}
+
+        policy = self.get_policy(chat)
+        older = self._messages_to_condense(chat, policy)
+        if not older:
+            return {"status": "unchanged", "summary": chat.summary}
+
+        # A dedicated manager keeps the summarizer's model and parameters separate from the chat's
+        manager = ModelManager()
+        manager.change_model(policy['model'], persist=False)
+        manager.set_parameters(temperature=0.2, max_tokens=policy['summary_max_tokens'])
+
+        prompt = {
+            "system": SUMMARY_INSTRUCTIONS,
+            "messages": [{"role": "user", "content": self._summary_request(chat.summary, older)}]
+        }
+        content, usage = manager.generate_with_usage(prompt, model_type=policy['model'], cache=False, raise_errors=True)
+
+        with self.chat_service._chat_lock(chat_id):
+            chat = self.chat_service.get_chat(chat_id)
+            if not chat:
+                return {"error": "Chat not found", "status": "error"}
+            if not any(msg.id == older[-1].id for msg in chat.messages):
+                return {"error": "Chat history changed during compaction", "status": "error"}
+
+            previous_count = chat.summary.get('message_count', 0) if chat.summary else 0
+            chat.summary = {
+                "content": content.strip(),
+                "through_message_id": older[-1].id,
+                "message_count": previous_count + len(older),
+                "model": policy['model'],
+                "usage": usage,
+                "created_at": datetime.now().isoformat()
+            }
+            self.chat_service.chat_store.save_chat(chat)
+
+        logger.info(f"Compacted {len(older)} messages of chat {chat_id}")
+        return {"status": "success", "summary": chat.summary}
+
+    def _context_tokens(self, chat):
+        """Estimated size of the history a new reply would send"""
+        return self._count_tokens(chat, self.build_context(chat, chat.messages))
+
+    def _count_tokens(self, chat, messages):
+        """Estimated tokens of messages for the chat's model; stored messages cache their counts"""
+        estimator = get_token_estimator(self.model_manager.get_provider(chat.model))
+        return estimator.estimate(sum(estimator.count_message(msg) for msg in messages), chat.model)
+
+    def _messages_to_condense(self, chat, policy):
+        """Conversation messages after the current summary and before the recent tail"""
+        messages = chat.messages
+        start = 0
+        if chat.summary:
+            through = next((i for i, msg in enumerate(messages) if msg.id == chat.summary['through_message_id']), None)
+            if through is not None:
+                start = through + 1
+        end = max(start, len(messages) - max(0, policy['keep_recent']))
+        return [msg for msg in messages[start:end] if msg.role != 'system']
+
+    def _summary_request(self, summary, messages):
+        """Summarizer input: the previous summary followed by the new messages"""
+        parts = []
+        if summary:
+            parts.append(f"Current summary:\n{summary['content']}")
+        lines = [f"{'User' if msg.role == 'user' else 'Assistant'}: {message_text(msg.content)}" for msg in messages]
+        parts.append("New messages:\n" + "\n\n".join(lines))
+        return "\n\n".join(parts)
@@ -4,20 +4,40 @@ import threading
 import time
 import traceback
 from datetime import datetime
-from models.loop import Loop, LoopStore
+from models.loop import Loop, LoopStore, BUDGET_FIELDS
 from ai_toolkit.model_manager import ModelManager
+from ai_toolkit.messages import ChatMessage
+from ai_toolkit.batch import BatchRequest, BatchRunner
+from ai_toolkit.metrics import get_metrics
 import math
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Loop turn metrics, recorded only while metrics are enabled
+_metrics = get_metrics()
+LOOP_TURN_SECONDS = _metrics.histogram(
+    'loop_turn_duration_seconds', 'Time to generate one loop turn', ('model',))
+LOOP_TURN_WAIT_SECONDS = _metrics.histogram(
+    'loop_turn_wait_seconds', 'Time between a loop turn becoming due and its model call starting')
+
 class LoopService:
     def __init__(self):
         self.loop_store = LoopStore()
         self.model_manager = ModelManager()
         self.active_loops = {}  # Track running loops and their threads
         self.stop_events = {}  # Track stop events for threads
+        self.prompt_cache_stats = {}  # Per-loop provider prompt cache usage
+        self._stats_lock = threading.Lock()
+        self.batch_runs = {}  # Batch runs by ID: (state, stop event)
+        self._batch_lock = threading.Lock()
+        self.max_tokens_cap = None  # Upper bound on any participant's max_tokens
+    
+    def configure(self, max_tokens=None):
+        """Set the per-turn max_tokens ceiling applied to every participant"""
+        self.max_tokens_cap = max(1, int(max_tokens)) if max_tokens else None
+        logger.info(f"Loop max_tokens ceiling: {self.max_tokens_cap}")
     
     def create_loop(self, title=None):
         """Create a new loop"""
@@ -138,6 +158,40 @@ class LoopService:
         loop.updated_at = datetime.now()
         return self.loop_store.save_loop(loop)
     
+    def update_loop_budget(self, loop_id, max_turns=None, budget=None):
+        """Replace a loop's turn limit and budget; returns None if the loop is not found"""
+        loop = self.loop_store.get_loop(loop_id)
+        if not loop:
+            return None
+        
+        loop.max_turns = max_turns
+        loop.budget = {key: value for key, value in (budget or {}).items() if key in BUDGET_FIELDS and value is not None}
+        loop.updated_at = datetime.now()
+        return self.loop_store.save_loop(loop)
+    
+    def get_unpriced_models(self, loop_id):
+        """Models billed by a loop that have no pricing, so a cost budget cannot see them; None if the loop is not found"""
+        loop = self.loop_store.get_loop(loop_id)
+        if not loop:
+            return None
+        
+        manager = ModelManager()
+        models = {p.model for p in loop.participants} | {s.model for s in loop.stop_sequences if s.system_prompt}
+        return sorted(model for model in models if not (manager.get_model_config(model) or {}).get('pricing'))
+    
+    def get_loop_budget(self, loop_id):
+        """Get a loop's limits and how much of them has been used"""
+        loop = self.loop_store.get_loop(loop_id)
+        if not loop:
+            return None
+        
+        return {
+            "max_turns": loop.max_turns,
+            "budget": loop.budget,
+            "used": loop.get_budget_status(),
+            "exhausted": loop.check_budget()
+        }
+    
     def start_loop(self, loop_id, initial_prompt):
         """Start a loop with an initial prompt - improved initialization"""
         loop = self.loop_store.get_loop(loop_id)
@@ -153,6 +207,7 @@ class LoopService:
         # Always reset messages when starting a new loop conversation
         loop.messages = []
         loop.current_turn = 0
+        loop.started_at = datetime.now()
         
         # Add initial user message - this will be the seed for the conversation
         # The frontend will hide this message in the UI
@@ -266,6 +321,7 @@ class LoopService:
         loop.messages = []
         loop.current_turn = 0
         loop.status = "stopped"
+        loop.started_at = None
         loop.updated_at = datetime.now()
         
         return self.loop_store.save_loop(loop)
@@ -279,6 +335,9 @@ class LoopService:
             # Keep track of cycle count for monitoring
             cycle_count = 0
             
+            # When the current turn became due; used for the turn wait metric
+            turn_due = time.perf_counter()
+            
             while not stop_event.is_set():
                 # Get the latest loop state
                 loop = self.loop_store.get_loop(loop_id)
@@ -304,28 +363,14 @@ class LoopService:
                 
                 # Check if we should stop based on stop sequences after each new AI message (not user input)
                 if stop_sequences and last_sender != "user" and len(messages) >= 2:
-                    for stop_seq in stop_sequences:
-                        # No longer check only for preceding participant - evaluate against entire conversation
-                        # Process the stop condition with the AI model
-                        stop_reason = self._check_stop_condition(
-                            loop_id, 
-                            stop_seq, 
-                            messages
-                        )
-                        
-                        # If the stop condition is met, stop the loop
-                        if stop_reason:
-                            logger.info(f"Stop condition met for loop {loop_id}, stopping: {stop_reason}")
-                            loop.status = "stopped"
-                            self.loop_store.save_loop(loop)
-                            
-                            # Add a system message indicating the loop was stopped
-                            loop.add_message(
-                                f"Loop stopped by stop sequence '{stop_seq.display_name}': {stop_reason}",
-                                "system"
-                            )
-                            self.loop_store.save_loop(loop)
-                            return
+                    if self._apply_stop_sequences(loop):
+                        return
+                
+                # Stop before the next turn once any budget is exhausted
+                budget_reason = loop.check_budget()
+                if budget_reason:
+                    self._stop_for_budget(loop, budget_reason)
+                    return
                 
                 # Get next participant
                 next_participant = loop.get_next_participant(last_sender)
@@ -387,12 +432,16 @@ class LoopService:
                     
                     try:
                         # Call the model with the processed input
-                        response_content = self._process_with_model(loop_id, next_participant, processed_input)
+                        turn_started = time.perf_counter()
+                        LOOP_TURN_WAIT_SECONDS.observe(turn_started - turn_due)
+                        response_content, usage = self._process_with_model(loop_id, next_participant, processed_input)
+                        LOOP_TURN_SECONDS.observe(time.perf_counter() - turn_started, next_participant.model)
                         
                         if response_content and not stop_event.is_set():
                             # Add AI message to conversation
-                            loop.add_message(response_content, next_participant.id)
+                            loop.add_message(response_content, next_participant.id, usage=usage)
                             self.loop_store.save_loop(loop)
+                            turn_due = time.perf_counter()
                             
                             logger.info(f"Added response from {next_participant.display_name} to loop {loop_id}")
                             
@@ -420,15 +469,14 @@ class LoopService:
             logger.info(f"Loop thread for loop {loop_id} terminated")
     
     def _process_with_model(self, loop_id, participant, content):
-        """Process a message with an AI model - final version with identity preservation"""
+        """Process a message with an AI model; returns (response, usage record)"""
         # Get the model configuration
         model_type = participant.model
         current_participant_name = participant.display_name
-        current_participant_id = participant.id
         
         # Retrieve model parameters from participant
         temperature = getattr(participant, 'temperature', 0.7)
-        max_tokens = getattr(participant, 'max_tokens', 4000)
+        max_tokens = self._turn_max_tokens(participant)
         
         # Log model parameters
         logger.info(f"Processing with model {model_type} for {current_participant_name}")
@@ -436,18 +484,43 @@ class LoopService:
         
         # Create a dedicated ModelManager instance for this request
         participant_model_manager = ModelManager()
-        participant_model_manager._initialize_models()
-        participant_model_manager.change_model(model_type)
+        participant_model_manager.change_model(model_type, persist=False)
         
         # Apply model parameters
         participant_model_manager.set_parameters(temperature=temperature, max_tokens=max_tokens)
         
-        # Get model config for system prompt support check
-        model_config = participant_model_manager.get_model_config(model_type)
-        supports_system = model_config.get('supports_system_prompt', True)
-        
         # Get the full loop data to access all messages
         loop = self.loop_store.get_loop(loop_id)
+        prompt, supports_system = self._build_turn_prompt(loop, participant)
+        
+        # Generate response
+        response, usage = participant_model_manager.generate_with_usage(prompt)
+        self._record_prompt_cache_usage(loop_id, usage)
+        
+        return self._clean_turn_response(participant, response, supports_system), usage
+    
+    def _turn_max_tokens(self, participant):
+        """Participant's max_tokens, capped by the configured ceiling"""
+        max_tokens = getattr(participant, 'max_tokens', 4000)
+        if self.max_tokens_cap:
+            max_tokens = min(max_tokens, self.max_tokens_cap)
+        return max_tokens
+    
+    def _stop_for_budget(self, loop, reason):
+        """Stop a loop that has exhausted its budget and record why"""
+        logger.info(f"Budget exhausted for loop {loop.id}, stopping: {reason}")
+        loop.status = "stopped"
+        loop.add_message(f"Loop stopped: {reason}", "system")
+        self.loop_store.save_loop(loop)
+    
+    def _build_turn_prompt(self, loop, participant):
+        """Build the prompt for a participant's next turn; returns (prompt, supports_system)"""
+        current_participant_name = participant.display_name
+        current_participant_id = participant.id
+        
+        # Get model config for system prompt support check
+        model_config = self.model_manager.get_model_config(participant.model) or {}
+        supports_system = model_config.get('supports_system_prompt', True)
         
         # Create mapping of participant IDs to their names
         participant_names = {}
@@ -458,7 +531,6 @@ class LoopService:
         original_system_prompt = participant.system_prompt or ""
         
         # Create identity context without modifying the original system prompt
-        identity_marker = f"You are responding as {current_participant_name}."
         identity_context = f"""
     CONVERSATION PARTICIPANTS:
     - You are {current_participant_name}
@@ -475,14 +547,13 @@ class LoopService:
             enhanced_system_prompt += "\n\n"
         enhanced_system_prompt += identity_context
         
+        # Extract relevant conversation messages (last 20 to avoid token limits)
+        relevant_messages = loop.messages[-20:] if len(loop.messages) > 20 else loop.messages
+        
         # Process based on system prompt support
         if supports_system:
             # Create a conversation history with proper roles
-            messages = [{"role": "system", "content": enhanced_system_prompt}]
-            
-            # Extract relevant conversation messages (last 20 to avoid token limits)
-            conversation_messages = []
-            relevant_messages = loop.messages[-20:] if len(loop.messages) > 20 else loop.messages
+            messages = [ChatMessage("system", enhanced_system_prompt)]
             
             for message in relevant_messages:
                 # Skip thinking messages and system messages
@@ -491,74 +562,264 @@ class LoopService:
                 
                 if message.sender == "user":
                     # User messages remain as user
-                    conversation_messages.append({
-                        "role": "user", 
-                        "content": message.content
-                    })
+                    messages.append(ChatMessage("user", message.content))
                 else:
                     # Handle AI messages with perspective shifts
                     speaker_name = participant_names.get(message.sender, "Unknown AI")
                     
                     if message.sender == current_participant_id:
                         # This is from the current participant - use assistant role
-                        conversation_messages.append({
-                            "role": "assistant",
-                            "content": message.content
-                        })
+                        messages.append(ChatMessage("assistant", message.content))
                     else:
                         # This is from another AI - use user role with clear attribution
-                        conversation_messages.append({
-                            "role": "user",
-                            "content": f"{speaker_name}: {message.content}"
-                        })
-            
-            # Add all conversation messages
-            messages.extend(conversation_messages)
+                        messages.append(ChatMessage("user", f"{speaker_name}: {message.content}"))
             
             # Log details for debugging
-            logger.info(f"Processing with {model_type} for {current_participant_name} (ID: {current_participant_id})")
+            logger.info(f"Processing with {participant.model} for {current_participant_name} (ID: {current_participant_id})")
             logger.info(f"Total messages in context: {len(messages)}")
             
-            # Generate response
-            response = participant_model_manager.generate_content(messages)
-            
-            # Check if response is prefixed with the participant's name and remove if needed
-            if response.startswith(f"{current_participant_name}:"):
-                response = response[len(f"{current_participant_name}:"):].strip()
+            return messages, supports_system
+        
+        # For models without system message support, use plaintext format
+        conversation_transcript = ""
+        if original_system_prompt:
+            conversation_transcript += original_system_prompt + "\n\n"
+        
+        conversation_transcript += identity_context + "\n\n"
+        conversation_transcript += "CONVERSATION HISTORY:\n"
+        
+        # Add each message with identity perspective
+        for message in relevant_messages:
+            if message.content == "Thinking..." or message.sender == "system":
+                continue
+                
+            if message.sender == "user":
+                conversation_transcript += f"User: {message.content}\n"
+            else:
+                speaker_name = participant_names.get(message.sender, "Unknown AI")
+                
+                if message.sender == current_participant_id:
+                    conversation_transcript += f"You ({current_participant_name}): {message.content}\n"
+                else:
+                    conversation_transcript += f"{speaker_name}: {message.content}\n"
+        
+        # Add prompt for continuation
+        conversation_transcript += f"\nYour response as {current_participant_name}: "
+        
+        return conversation_transcript, supports_system
+    
+    def _clean_turn_response(self, participant, response, supports_system):
+        """Remove the participant's name prefix that chat models sometimes echo"""
+        if supports_system and response.startswith(f"{participant.display_name}:"):
+            response = response[len(f"{participant.display_name}:"):].strip()
+        return response
+
+    def _record_prompt_cache_usage(self, loop_id, usage):
+        """Accumulate provider prompt cache token counts for a loop"""
+        if not usage:
+            return
+        
+        with self._stats_lock:
+            stats = self.prompt_cache_stats.setdefault(loop_id, {
+                "turns": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0,
+                "latency_ms": 0.0,
+                "cached_turn_latency_ms": 0.0,
+                "cached_turns": 0
+            })
+            stats["turns"] += 1
+            for key in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+                stats[key] += usage.get(key, 0) or 0
+            stats["latency_ms"] += usage.get("latency_ms", 0.0) or 0.0
+            if usage.get("cache_read_input_tokens"):
+                stats["cached_turns"] += 1
+                stats["cached_turn_latency_ms"] += usage.get("latency_ms", 0.0) or 0.0
+    
+    def get_prompt_cache_stats(self, loop_id):
+        """Get prompt cache token counts and the estimated input cost ratio for a loop"""
+        with self._stats_lock:
+            stats = dict(self.prompt_cache_stats.get(loop_id, {}))
+        
+        if not stats:
+            return {"turns": 0}
+        
+        # Anthropic bills cache writes at 1.25x and cache reads at 0.1x the base input price
+        uncached = stats["input_tokens"]
+        written = stats["cache_creation_input_tokens"]
+        read = stats["cache_read_input_tokens"]
+        total_input = uncached + written + read
+        stats["cache_hit_ratio"] = read / total_input if total_input else 0.0
+        stats["input_cost_ratio"] = (uncached + 1.25 * written + 0.1 * read) / total_input if total_input else 1.0
+        
+        uncached_turns = stats["turns"] - stats["cached_turns"]
+        stats["avg_latency_ms"] = stats["latency_ms"] / stats["turns"]
+        stats["avg_cached_turn_latency_ms"] = (
+            stats["cached_turn_latency_ms"] / stats["cached_turns"] if stats["cached_turns"] else None
+        )
+        stats["avg_uncached_turn_latency_ms"] = (
+            (stats["latency_ms"] - stats["cached_turn_latency_ms"]) / uncached_turns if uncached_turns else None
+        )
+        return stats
+
+    def start_batch_run(self, loop_ids=None, rounds=1, initial_prompt=None):
+        """Run turns of many loops as offline batch jobs in the background; returns the run state"""
+        run = {
+            "id": str(uuid.uuid4()),
+            "status": "running",
+            "loop_ids": list(loop_ids) if loop_ids else None,
+            "rounds": rounds,
+            "completed_rounds": 0,
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "stopped": 0,
+            "errors": {},
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None
+        }
+        stop_event = threading.Event()
+        with self._batch_lock:
+            self.batch_runs[run["id"]] = (run, stop_event)
+        
+        threading.Thread(
+            target=self._run_batch_rounds,
+            args=(run, stop_event, initial_prompt),
+            name=f"loop-batch-{run['id']}",
+            daemon=True
+        ).start()
+        
+        logger.info(f"Started batch run {run['id']} for {rounds} rounds")
+        return dict(run)
+    
+    def get_batch_run(self, run_id):
+        """Get the state of a batch run"""
+        with self._batch_lock:
+            entry = self.batch_runs.get(run_id)
+            return dict(entry[0]) if entry else None
+    
+    def cancel_batch_run(self, run_id):
+        """Cancel a batch run; its outstanding provider batches are cancelled"""
+        with self._batch_lock:
+            entry = self.batch_runs.get(run_id)
+        if not entry:
+            return None
+        entry[1].set()
+        return self.get_batch_run(run_id)
+    
+    def _run_batch_rounds(self, run, stop_event, initial_prompt):
+        """Background thread running the rounds of a batch run"""
+        try:
+            runner = BatchRunner()
             
-            return response
-        else:
-            # For models without system message support, use plaintext format
-            conversation_transcript = ""
-            if original_system_prompt:
-                conversation_transcript += original_system_prompt + "\n\n"
+            # Seed loops that have no conversation yet
+            if initial_prompt:
+                for loop in self._batch_loops(run["loop_ids"]):
+                    if not loop.messages and loop.participants and loop.status != "running":
+                        loop.started_at = datetime.now()
+                        loop.add_message(initial_prompt, "user")
+                        self.loop_store.save_loop(loop)
             
-            conversation_transcript += identity_context + "\n\n"
-            conversation_transcript += "CONVERSATION HISTORY:\n"
+            for _ in range(run["rounds"]):
+                if stop_event.is_set():
+                    break
+                summary = self.run_batch_round(run["loop_ids"], runner, stop_event)
+                with self._batch_lock:
+                    for key in ("submitted", "succeeded", "failed", "stopped"):
+                        run[key] += summary[key]
+                    run["errors"].update(summary["errors"])
+                    run["completed_rounds"] += 1
+                if not summary["submitted"]:
+                    break
             
-            # Add each message with identity perspective
-            relevant_messages = loop.messages[-20:] if len(loop.messages) > 20 else loop.messages
+            status = "cancelled" if stop_event.is_set() else "completed"
+        except Exception as e:
+            logger.error(f"Error in batch run {run['id']}: {e}")
+            logger.error(traceback.format_exc())
+            status = "failed"
+            with self._batch_lock:
+                run["errors"]["run"] = str(e)
+        
+        with self._batch_lock:
+            run["status"] = status
+            run["finished_at"] = datetime.now().isoformat()
+        logger.info(f"Batch run {run['id']} {status} after {run['completed_rounds']} rounds")
+    
+    def run_batch_round(self, loop_ids=None, runner=None, stop_event=None):
+        """Submit the next turn of every eligible loop as batch jobs and add the replies"""
+        runner = runner or BatchRunner()
+        
+        # One request per loop; the prompt is built exactly as for an interactive turn
+        requests = []
+        turns = {}
+        for loop in self._batch_loops(loop_ids):
+            participant = self._next_batch_participant(loop)
+            if not participant:
+                continue
+            prompt, supports_system = self._build_turn_prompt(loop, participant)
+            custom_id = f"turn-{len(requests)}"
+            turns[custom_id] = (loop.id, participant.id, loop.messages[-1].id, supports_system)
+            requests.append(BatchRequest(custom_id, participant.model, prompt, {
+                "temperature": getattr(participant, 'temperature', 0.7),
+                "max_tokens": self._turn_max_tokens(participant)
+            }))
+        
+        summary = {"submitted": len(requests), "succeeded": 0, "failed": 0, "stopped": 0, "errors": {}}
+        if not requests:
+            return summary
+        
+        logger.info(f"Submitting a batch round of {len(requests)} loop turns")
+        results = runner.run(requests, stop_event)
+        
+        for custom_id, (loop_id, participant_id, last_message_id, supports_system) in turns.items():
+            result = results.get(custom_id)
+            loop = self.loop_store.get_loop(loop_id)
+            participant = loop.get_participant(participant_id) if loop else None
             
-            for message in relevant_messages:
-                if message.content == "Thinking..." or message.sender == "system":
-                    continue
-                    
-                if message.sender == "user":
-                    conversation_transcript += f"User: {message.content}\n"
-                else:
-                    speaker_name = participant_names.get(message.sender, "Unknown AI")
-                    
-                    if message.sender == current_participant_id:
-                        conversation_transcript += f"You ({current_participant_name}): {message.content}\n"
-                    else:
-                        conversation_transcript += f"{speaker_name}: {message.content}\n"
+            error = None
+            if result is None or result.error:
+                error = result.error if result else "No result returned"
+            elif not participant or not loop.messages or loop.messages[-1].id != last_message_id:
+                # The loop moved on (or was reset) while the batch was running
+                error = "Loop changed while the batch was running; reply discarded"
+            if error:
+                summary["failed"] += 1
+                summary["errors"][loop_id] = error
+                continue
             
-            # Add prompt for continuation
-            conversation_transcript += f"\nYour response as {current_participant_name}: "
+            response = self._clean_turn_response(participant, result.content, supports_system)
+            usage = dict(result.usage, model=participant.model) if result.usage else None
+            loop.add_message(response, participant.id, usage=usage)
+            self.loop_store.save_loop(loop)
+            self._record_prompt_cache_usage(loop_id, usage)
+            summary["succeeded"] += 1
             
-            # Generate response
-            response = participant_model_manager.generate_content(conversation_transcript)
-            return response
+            if loop.stop_sequences and len(loop.messages) >= 2 and self._apply_stop_sequences(loop):
+                summary["stopped"] += 1
+        
+        return summary
+    
+    def _batch_loops(self, loop_ids):
+        """Loops targeted by a batch run: the given IDs, or all loops"""
+        if not loop_ids:
+            return self.loop_store.list_loops()
+        loops = [self.loop_store.get_loop(loop_id) for loop_id in loop_ids]
+        return [loop for loop in loops if loop]
+    
+    def _next_batch_participant(self, loop):
+        """Participant whose turn a batch round should generate, or None if the loop is not eligible"""
+        # Running loops are driven by their own thread; stopped-by-sequence loops end with a system message
+        if loop.status == "running" or not loop.messages or not loop.participants:
+            return None
+        if loop.messages[-1].sender == "system":
+            return None
+        budget_reason = loop.check_budget()
+        if budget_reason:
+            self._stop_for_budget(loop, budget_reason)
+            return None
+        return loop.get_next_participant(loop.messages[-1].sender)
 
     def add_stop_sequence(self, loop_id, model, system_prompt="", display_name=None, stop_condition=""):
         """Add a stop sequence to a loop"""
@@ -621,11 +882,39 @@ class LoopService:
             "success": True
         }
 
-    def _check_stop_condition(self, loop_id, stop_sequence, messages):
+    def _apply_stop_sequences(self, loop):
+        """Evaluate the loop's stop sequences and stop it when one is met; returns True if stopped"""
+        judge_requests = loop.totals["judge_usage"]["requests"]
+        for stop_seq in loop.get_sorted_stop_sequences():
+            # No longer check only for preceding participant - evaluate against entire conversation
+            # Process the stop condition with the AI model
+            stop_reason = self._check_stop_condition(
+                loop, 
+                stop_seq, 
+                loop.messages
+            )
+            
+            # If the stop condition is met, stop the loop
+            if stop_reason:
+                logger.info(f"Stop condition met for loop {loop.id}, stopping: {stop_reason}")
+                loop.status = "stopped"
+                self.loop_store.save_loop(loop)
+                
+                # Add a system message indicating the loop was stopped
+                loop.add_message(
+                    f"Loop stopped by stop sequence '{stop_seq.display_name}': {stop_reason}",
+                    "system"
+                )
+                self.loop_store.save_loop(loop)
+                return True
+        
+        if loop.totals["judge_usage"]["requests"] != judge_requests:
+            # Keep the judges' usage for the budget even though the loop goes on
+            self.loop_store.save_loop(loop)
+        return False
+
+    def _check_stop_condition(self, loop, stop_sequence, messages):
         """Check if a stop condition is met using the entire conversation history"""
-        # Get the full loop to access all messages
-        loop = self.loop_store.get_loop(loop_id)
-        
         # Create a readable conversation history
         conversation_history = ""
         participant_names = {}
@@ -680,15 +969,16 @@ class LoopService:
                 
                 # Create a dedicated ModelManager instance
                 stop_model_manager = ModelManager()
-                stop_model_manager._initialize_models()
-                stop_model_manager.change_model(model_type)
+                stop_model_manager.change_model(model_type, persist=False)
                 
                 messages = [
-                    {"role": "system", "content": stop_sequence.system_prompt},
-                    {"role": "user", "content": prompt}
+                    ChatMessage("system", stop_sequence.system_prompt),
+                    ChatMessage("user", prompt)
                 ]
                 
-                response = stop_model_manager.generate_content(messages)
+                # Judges re-evaluate identical transcripts, so always allow cached verdicts
+                response, usage = stop_model_manager.generate_with_usage(messages, cache=True)
+                loop.add_judge_usage(usage)
                 
                 # Check if the response contains STOP
                 if "STOP" in response.upper():
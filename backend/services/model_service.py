@@ -1,4 +1,4 @@
-from ai_toolkit import ModelManager
+from ai_toolkit import ModelManager, get_response_cache, get_single_flight, get_provider_limiter, get_token_estimator_stats
 
 class ModelService:
     def __init__(self):
@@ -50,23 +50,31 @@ class ModelService:
         
     def update_model_parameters(self, model_name, parameters):
         """Update parameters for a specific model"""
-        if model_name not in self.model_manager.config.get('models', {}):
-            raise ValueError(f"Unknown model: {model_name}")
-            
-        # Get current config
-        model_config = self.model_manager.config['models'][model_name]
-        
-        # Update parameters
-        for key, value in parameters.items():
-            if key in ['temperature', 'max_tokens']:
-                model_config[key] = value
-        
-        # Save config
-        self.model_manager._save_config(self.model_manager.config_path, self.model_manager.config)
-        
-        # Reinitialize if this is the current model
-        current_model = self.model_manager.get_current_model()
-        if model_name == current_model:
-            self.model_manager._initialize_models()
-            
-        return True
\ No newline at end of file
+        self.model_manager.update_model_parameters(model_name, parameters)
+        return True
+
+    def get_cache_stats(self):
+        """Get response cache hit-ratio and request coalescing metrics"""
+        stats = get_response_cache().get_stats()
+        stats['single_flight'] = get_single_flight().get_stats()
+        stats['provider_limits'] = get_provider_limiter().get_stats()
+        return stats
+    
+    def clear_cache(self):
+        """Clear the response cache"""
+        get_response_cache().clear()
+        return True
+    
+    def estimate_tokens(self, prompt, model_type=None):
+        """Estimate the input tokens of a prompt for a model"""
+        model_type = model_type or self.model_manager.get_current_model()
+        if self.model_manager.get_model_record(model_type) is None:
+            raise ValueError(f"Unknown model: {model_type}")
+        return {
+            "model": model_type,
+            "input_tokens": self.model_manager.estimate_tokens(prompt, model_type)
+        }
+    
+    def get_token_estimator_stats(self):
+        """Get token estimator calibration per provider family"""
+        return get_token_estimator_stats()
\ No newline at end of file
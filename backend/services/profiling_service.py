@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import uuid
+import logging
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Allocations made by the profilers themselves and the import machinery are not interesting
+MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread and counts collapsed stacks"""
+
+    def __init__(self, max_duration=300):
+        self.max_duration = max_duration
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+        self._stacks = Counter()
+        self._samples = 0
+        self._interval = 0.01
+        self._started_at = None
+        self._stopped_at = None
+
+    def is_running(self):
+        """Whether a profile is being collected"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=10, duration=None):
+        """Start sampling; returns an error message if a profile is already running"""
+        with self._lock:
+            if self.is_running():
+                return "Profiler is already running"
+
+            self._interval = max(1, float(interval_ms)) / 1000
+            duration = min(float(duration or self.max_duration), self.max_duration)
+            self._stacks = Counter()
+            self._samples = 0
+            self._started_at = time.time()
+            self._stopped_at = None
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._stop_event, duration), name='sampling-profiler', daemon=True
+            )
+            self._thread.start()
+
+        logger.info(f"Sampling profiler started (interval={self._interval * 1000:.0f}ms, max {duration:.0f}s)")
+        return None
+
+    def stop(self):
+        """Stop sampling and return the collected profile"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._stop_event.set()
+                thread.join(timeout=5)
+        return self.get_profile()
+
+    def get_profile(self):
+        """Get the profile collected so far"""
+        with self._lock:
+            stacks = dict(self._stacks)
+            samples = self._samples
+        ended = self._stopped_at or time.time()
+        return {
+            "running": self.is_running(),
+            "interval_ms": self._interval * 1000,
+            "samples": samples,
+            "duration_s": ended - self._started_at if self._started_at else 0.0,
+            "stacks": stacks
+        }
+
+    def _run(self, stop_event, duration):
+        own_ident = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        while not stop_event.wait(self._interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            collapsed = [
+                self._collapse(names.get(ident, str(ident)), frame)
+                for ident, frame in sys._current_frames().items() if ident != own_ident
+            ]
+            with self._lock:
+                self._stacks.update(collapsed)
+                self._samples += 1
+            if time.perf_counter() >= deadline:
+                logger.info("Sampling profiler reached its maximum duration")
+                break
+        self._stopped_at = time.time()
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        """Render a stack root-first as 'thread;module:function;...'"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
+
+
+class MemoryProfiler:
+    """Takes tracemalloc snapshots and reports allocations grouped by module"""
+
+    def __init__(self, max_snapshots=10):
+        self.max_snapshots = max_snapshots
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # Snapshot ID -> (taken at, snapshot)
+
+    def is_tracing(self):
+        """Whether allocations are being traced"""
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=1):
+        """Start tracing allocations; a no-op if tracing is already on"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, int(frames)))
+                logger.info("tracemalloc started")
+        return self.get_status()
+
+    def stop(self):
+        """Stop tracing and drop stored snapshots"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("tracemalloc stopped")
+            self._snapshots.clear()
+        return self.get_status()
+
+    def get_status(self):
+        """Get tracing state and stored snapshot IDs"""
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "snapshots": [
+                {"id": snapshot_id, "taken_at": taken_at.isoformat()}
+                for snapshot_id, (taken_at, _) in self._snapshots.items()
+            ]
+        }
+
+    def take_snapshot(self, limit=50, group='module'):
+        """Store a snapshot and return its top allocations"""
+        if not tracemalloc.is_tracing():
+            return {"error": "Memory tracing is not started"}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        snapshot_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._snapshots[snapshot_id] = (datetime.now(), snapshot)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+
+        modules = _module_index()
+        totals = {}
+        for stat in snapshot.statistics('filename'):
+            name = _group_name(stat.traceback[0].filename, modules, group)
+            size, count = totals.get(name, (0, 0))
+            totals[name] = (size + stat.size, count + stat.count)
+
+        rows = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        return {
+            "id": snapshot_id,
+            "total_bytes": sum(size for size, _ in totals.values()),
+            "allocations": [
+                {"module": name, "size_bytes": size, "count": count}
+                for name, (size, count) in rows[:limit]
+            ]
+        }
+
+    def diff(self, base_id, target_id=None, limit=50, group='module'):
+        """Compare two snapshots, or a snapshot against a new one, grouped by module"""
+        with self._lock:
+            base = self._snapshots.get(base_id)
+            target = self._snapshots.get(target_id) if target_id else None
+        if base is None:
+            return {"error": f"Snapshot not found: {base_id}"}
+        if target_id and target is None:
+            return {"error": f"Snapshot not found: {target_id}"}
+
+        if target is None:
+            taken = self.take_snapshot(limit=0, group=group)
+            if "error" in taken:
+                return taken
+            target_id = taken["id"]
+            with self._lock:
+                target = self._snapshots[target_id]
+
+        modules = _module_index()
+        totals = {}
+        for stat in target[1].compare_to(base[1], 'filename'):
+            name = _group_name(stat.traceback[0].filename, modules, group)
+            size, size_diff, count_diff = totals.get(name, (0, 0, 0))
+            totals[name] = (size + stat.size, size_diff + stat.size_diff, count_diff + stat.count_diff)
+
+        rows = sorted(totals.items(), key=lambda item: abs(item[1][1]), reverse=True)
+        return {
+            "base": base_id,
+            "target": target_id,
+            "size_diff_bytes": sum(size_diff for _, size_diff, _ in totals.values()),
+            "allocations": [
+                {"module": name, "size_bytes": size, "size_diff_bytes": size_diff, "count_diff": count_diff}
+                for name, (size, size_diff, count_diff) in rows[:limit] if size_diff or count_diff
+            ]
+        }
+
+
+def _module_index():
+    """Map source file paths to loaded module names"""
+    index = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path:
+            index[os.path.normcase(os.path.abspath(path))] = name
+    return index
+
+
+def _group_name(filename, modules, group):
+    name = modules.get(os.path.normcase(os.path.abspath(filename)), filename)
+    if group == 'package' and name != filename:
+        return name.split('.', 1)[0]
+    return name
+
+
+def to_collapsed_text(stacks):
+    """Render stack counts in the collapsed format read by flamegraph tools"""
+    return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def to_flamegraph_tree(stacks):
+    """Nest stack counts into a {name, value, children} tree for flamegraph viewers"""
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in stacks.items():
+        root["value"] += count
+        node = root
+        for frame in stack.split(';'):
+            child = node["children"].get(frame)
+            if child is None:
+                child = node["children"][frame] = {"name": frame, "value": 0, "children": {}}
+            child["value"] += count
+            node = child
+
+    def finish(node):
+        node["children"] = [finish(child) for child in node["children"].values()]
+        return node
+
+    return finish(root)
@@ -0,0 +1,30 @@
+import time
+from models.search_index import get_search_index
+
+SEARCH_KINDS = ('chat', 'loop')
+MAX_SEARCH_LIMIT = 100
+
+class SearchService:
+    def __init__(self):
+        self.index = get_search_index()
+    
+    def search(self, query, kind=None, limit=20):
+        """Search chat and loop messages, best matches first"""
+        if not query or not query.strip():
+            return {"error": "No query provided"}
+        if kind and kind not in SEARCH_KINDS:
+            return {"error": f"Unknown type: {kind}"}
+        
+        started = time.perf_counter()
+        total, hits = self.index.search(query, kind, max(1, min(limit, MAX_SEARCH_LIMIT)))
+        
+        return {
+            "query": query,
+            "total": total,
+            "hits": hits,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    
+    def get_stats(self):
+        """Get index size"""
+        return self.index.get_stats()
@@ -40,8 +40,4 @@ class SettingsService:
         if key == 'default_system':
             return False
             
-        if 'system_prompts' in self.model_manager.prompts and key in self.model_manager.prompts['system_prompts']:
-            del self.model_manager.prompts['system_prompts'][key]
-            self.model_manager._save_config(self.model_manager.prompt_path, self.model_manager.prompts)
-            return True
-        return False
\ No newline at end of file
+        return self.model_manager.delete_system_prompt(key)
\ No newline at end of file
@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+
+class TieringService:
+    """Periodically moves chats and loops idle for a number of days into compressed cold storage"""
+
+    def __init__(self, chat_store, loop_store):
+        self.stores = {"chats": chat_store, "loops": loop_store}
+        self.idle_days = 0
+        self.interval_seconds = 0
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def configure(self, idle_days, interval_seconds):
+        """Set the idle threshold and start the periodic job; an idle_days of 0 disables it"""
+        self.idle_days = idle_days
+        self.interval_seconds = interval_seconds
+        if idle_days > 0 and interval_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run_periodically, name='cold-storage-tiering', daemon=True)
+            self._thread.start()
+
+    def _run_periodically(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f"Cold storage tiering failed: {e}")
+
+    def run(self, idle_days=None):
+        """Archive everything idle for idle_days (the configured value by default); returns the space saved"""
+        idle_days = self.idle_days if idle_days is None else idle_days
+        with self._lock:
+            started = time.perf_counter()
+            result = {"idle_days": idle_days, "started_at": datetime.now().isoformat()}
+            for name, store in self.stores.items():
+                # Running loops are written on every turn and stay hot
+                skip = (lambda data: data.get("status") == "running") if name == "loops" else None
+                counts = store.cold.archive_idle(idle_days * SECONDS_PER_DAY, skip)
+                counts["saved_bytes"] = counts["bytes_before"] - counts["bytes_after"]
+                result[name] = counts
+            result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.last_run = result
+
+        archived = result["chats"]["archived"] + result["loops"]["archived"]
+        saved = result["chats"]["saved_bytes"] + result["loops"]["saved_bytes"]
+        logger.info(f"Archived {archived} conversations idle for {idle_days} days, saving {saved} bytes")
+        return result
+
+    def get_stats(self):
+        """Hot and cold tier sizes, cold read latency and the last run"""
+        stats = {
+            "idle_days": self.idle_days,
+            "interval_seconds": self.interval_seconds,
+            "last_run": self.last_run
+        }
+        for name, store in self.stores.items():
+            stats[name] = store.cold.get_stats()
+        return stats
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import search_index
+from models.search_index import SearchIndex
+
+
+@pytest.fixture(autouse=True)
+def isolated_search_index(tmp_path, monkeypatch):
+    """Give every test its own search index so stores under tmp_path never touch ./data"""
+    index = SearchIndex(str(tmp_path / "search"), str(tmp_path / "chats"), str(tmp_path / "loops"))
+    monkeypatch.setattr(search_index, "_search_index", index)
+    return index
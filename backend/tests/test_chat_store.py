@@ -0,0 +1,155 @@
+import os
+
+import pytest
+
+from models import chat as chat_module
+from models.chat import Chat, ChatStore
+from models.file_writer import get_file_writer
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChatStore(str(tmp_path / "chats"))
+
+
+def make_chat(store, count):
+    chat = Chat("Test")
+    for i in range(count):
+        chat.add_message('user' if i % 2 == 0 else 'assistant', f"m{i}")
+    return store.save_chat(chat)
+
+
+def contents(store, chat_id):
+    return [msg.content for msg in store.get_chat(chat_id).messages]
+
+
+def segments(store):
+    if not os.path.isdir(store.segment_dir):
+        return {}
+    return {name[:-len(".refs.json")]: store._read_refs(name[:-len(".refs.json")])
+            for name in os.listdir(store.segment_dir) if name.endswith(".refs.json")}
+
+
+@pytest.fixture
+def crash_on(monkeypatch):
+    """Make the process-wide writer fail on the nth write to a header or messages file"""
+    writer = get_file_writer()
+    write = writer.write
+
+    def install(kind, nth=1):
+        seen = []
+
+        def failing_write(path, data):
+            is_messages = os.path.basename(os.path.dirname(path)) == "messages"
+            if is_messages == (kind == "messages") and path.endswith(".json"):
+                seen.append(path)
+                if len(seen) == nth:
+                    raise OSError("injected crash")
+            return write(path, data)
+        monkeypatch.setattr(writer, "write", failing_write)
+
+    return install
+
+
+def test_fork_shares_prefix(store):
+    parent = make_chat(store, 6)
+    fork = store.fork_chat(parent, 3)
+    assert contents(store, parent.id) == [f"m{i}" for i in range(6)]
+    assert contents(store, fork.id) == ["m0", "m1", "m2"]
+    assert list(segments(store).values()) == [[parent.id, fork.id]]
+
+
+def test_fork_of_fork_inside_prefix(store):
+    parent = make_chat(store, 6)
+    fork = store.fork_chat(parent, 4)
+    nested = store.fork_chat(store.get_chat(fork.id), 2)
+    assert contents(store, nested.id) == ["m0", "m1"]
+    assert sorted(holder for refs in segments(store).values() for holder in refs) == sorted([parent.id, fork.id, nested.id])
+
+
+def test_delete_releases_segments(store):
+    parent = make_chat(store, 6)
+    first = store.fork_chat(parent, 3)
+    second = store.fork_chat(store.get_chat(parent.id), 5)
+    store.delete_chat(parent.id)
+    assert contents(store, first.id) == ["m0", "m1", "m2"]
+    assert contents(store, second.id) == [f"m{i}" for i in range(5)]
+    store.delete_chat(first.id)
+    assert contents(store, second.id) == [f"m{i}" for i in range(5)]
+    store.delete_chat(second.id)
+    assert segments(store) == {}
+    assert os.listdir(store.segment_dir) == []
+
+
+def test_editing_shared_prefix_detaches(store):
+    parent = make_chat(store, 6)
+    fork = store.get_chat(store.fork_chat(parent, 3).id)
+    fork.messages[1].content = "edited"
+    store.save_chat(fork)
+    assert contents(store, fork.id) == ["m0", "edited", "m2"]
+    assert contents(store, parent.id) == [f"m{i}" for i in range(6)]
+    store.delete_chat(parent.id)
+    store.delete_chat(fork.id)
+    assert os.listdir(store.segment_dir) == []
+
+
+@pytest.mark.parametrize("kind", ["messages", "header"])
+def test_crash_while_forking_keeps_parent(store, crash_on, kind):
+    parent = make_chat(store, 6)
+    crash_on(kind)
+    with pytest.raises(OSError):
+        store.fork_chat(parent, 3)
+    assert contents(store, parent.id) == [f"m{i}" for i in range(6)]
+    # The parent is still usable and deleting it leaves nothing behind
+    store.fork_chat(store.get_chat(parent.id), 3)
+    for listed in store.list_chats():
+        store.delete_chat(listed.id)
+    assert os.listdir(store.segment_dir) == []
+
+
+@pytest.mark.parametrize("kind", ["messages", "header"])
+def test_crash_while_detaching_keeps_messages(store, crash_on, kind):
+    parent = make_chat(store, 6)
+    fork = store.get_chat(store.fork_chat(parent, 3).id)
+    fork.messages[1].content = "edited"
+    crash_on(kind)
+    with pytest.raises(OSError):
+        store.save_chat(fork)
+    expected = ["m0", "edited", "m2"] if kind == "header" else ["m0", "m1", "m2"]
+    assert contents(store, fork.id) == expected
+    assert contents(store, parent.id) == [f"m{i}" for i in range(6)]
+    store.delete_chat(fork.id)
+    store.delete_chat(parent.id)
+    assert os.listdir(store.segment_dir) == []
+
+
+def test_archived_fork_reads_and_revives(store):
+    parent = make_chat(store, 6)
+    fork = store.fork_chat(parent, 3)
+    fork = store.get_chat(fork.id)
+    fork.add_message('user', "own")
+    store.save_chat(fork)
+    assert store.cold.archive_idle(0)["archived"] == 2
+    assert not os.path.exists(os.path.join(store.storage_dir, f"{fork.id}.json"))
+    assert contents(store, fork.id) == ["m0", "m1", "m2", "own"]
+
+    # Deleting the parent while the fork is archived keeps the shared prefix
+    store.delete_chat(parent.id)
+    revived = store.get_chat(fork.id)
+    revived.title = "Revived"
+    store.save_chat(revived)
+    assert os.path.exists(os.path.join(store.storage_dir, f"{fork.id}.json"))
+    assert store.cold.read(fork.id) is None
+    assert contents(store, fork.id) == ["m0", "m1", "m2", "own"]
+    store.delete_chat(fork.id)
+    assert os.listdir(store.segment_dir) == []
+
+
+def test_header_only_save_keeps_messages(store):
+    chat = make_chat(store, 4)
+    loaded = store.get_chat(chat.id)
+    loaded.title = "Renamed"
+    store.save_chat(loaded)
+    assert not loaded.messages_loaded
+    assert store.get_chat(chat.id).title == "Renamed"
+    assert contents(store, chat.id) == ["m0", "m1", "m2", "m3"]
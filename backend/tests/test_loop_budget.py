@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+from models.loop import Loop, LoopStore
+
+
+def make_loop(participants=2):
+    loop = Loop("Budget")
+    for i in range(participants):
+        loop.add_participant("gpt-4o", i + 1, display_name=f"p{i}")
+    return loop
+
+
+def usage(input_tokens=100, output_tokens=50, cost_usd=0.01):
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "cost_usd": cost_usd}
+
+
+def test_no_limits():
+    loop = make_loop()
+    for participant in loop.participants * 5:
+        loop.add_message("hi", participant.id, usage=usage())
+    assert loop.check_budget() is None
+
+
+def test_turn_and_cycle_limits():
+    loop = make_loop()
+    loop.max_turns = 3
+    loop.add_message("start", "user")
+    for participant in loop.participants:
+        loop.add_message("hi", participant.id)
+    # User messages are not turns
+    assert loop.check_budget() is None
+    loop.add_message("hi", loop.participants[0].id)
+    assert loop.check_budget().startswith("turn limit reached")
+
+    loop = make_loop()
+    loop.budget = {"max_cycles": 2}
+    for participant in loop.participants * 2:
+        assert loop.check_budget() is None
+        loop.add_message("hi", participant.id)
+    assert loop.check_budget().startswith("cycle limit reached")
+
+
+def test_token_budgets():
+    loop = make_loop()
+    loop.budget = {"max_total_tokens": 300}
+    loop.add_message("hi", loop.participants[0].id, usage=usage())
+    assert loop.check_budget() is None
+    loop.add_message("hi", loop.participants[1].id, usage=usage())
+    assert loop.check_budget() == "total token budget reached (total tokens: 300 of 300)"
+
+    loop = make_loop()
+    loop.budget = {"max_completion_tokens": 60}
+    loop.add_message("hi", loop.participants[0].id, usage=usage())
+    loop.add_message("hi", loop.participants[1].id, usage=usage())
+    assert loop.check_budget().startswith("completion token budget reached")
+
+
+def test_judge_usage_counts_toward_budget():
+    loop = make_loop()
+    loop.budget = {"max_cost_usd": 0.03}
+    loop.add_message("hi", loop.participants[0].id, usage=usage(cost_usd=0.02))
+    assert loop.check_budget() is None
+    loop.add_judge_usage(usage(cost_usd=0.01))
+    assert loop.check_budget().startswith("cost budget reached")
+    assert loop.get_usage()["judges"]["requests"] == 1
+
+
+def test_time_limit():
+    loop = make_loop()
+    loop.budget = {"max_duration_seconds": 60}
+    loop.started_at = datetime.now() - timedelta(seconds=30)
+    assert loop.check_budget() is None
+    loop.started_at = datetime.now() - timedelta(seconds=61)
+    assert loop.check_budget().startswith("time limit reached")
+
+
+def test_totals_survive_header_only_load(tmp_path):
+    store = LoopStore(str(tmp_path / "loops"))
+    loop = make_loop()
+    loop.budget = {"max_total_tokens": 300}
+    loop.add_message("hi", loop.participants[0].id, usage=usage())
+    loop.add_judge_usage(usage())
+    store.save_loop(loop)
+
+    loaded = store.get_loop(loop.id)
+    assert loaded.check_budget() == "total token budget reached (total tokens: 300 of 300)"
+    assert not loaded.messages_loaded
@@ -0,0 +1,73 @@
+import os
+
+from ai_toolkit.messages import build_conversation
+from ai_toolkit.response_cache import ResponseCache
+
+
+def test_key_normalizes_prompt_shapes():
+    text = [{"role": "user", "content": "hello"}]
+    parts = [{"role": "user", "content": [{"type": "text", "text": "hello"}]}]
+    assert ResponseCache.make_key(text, "gpt-4o", {"temperature": 0}) == ResponseCache.make_key(parts, "gpt-4o", {"temperature": 0})
+    assert ResponseCache.make_key(text, "gpt-4o") != ResponseCache.make_key(text, "gpt-4o-mini")
+    assert ResponseCache.make_key(text, "gpt-4o", {"temperature": 0}) != ResponseCache.make_key(text, "gpt-4o", {"temperature": 0.5})
+
+
+def test_key_covers_json_template():
+    messages = [{"role": "user", "content": "list items"}]
+    first = {"messages": messages, "json_template": {"items": []}}
+    second = {"messages": messages, "json_template": {"names": []}}
+    assert ResponseCache.make_key(first, "gpt-4o") != ResponseCache.make_key(second, "gpt-4o")
+    # Conversations built from the payload carry the template into the key as well
+    assert (ResponseCache.make_key(build_conversation(first), "gpt-4o")
+            != ResponseCache.make_key(build_conversation(second), "gpt-4o"))
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_size=2, ttl=0)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    stats = cache.get_stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = ResponseCache(max_size=10, ttl=60)
+    now = 1000.0
+    monkeypatch.setattr("ai_toolkit.response_cache.time.time", lambda: now)
+    cache.set("a", "1")
+    now += 59
+    assert cache.get("a") == "1"
+    now += 2
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    disk_dir = str(tmp_path / "cache")
+    ResponseCache(max_size=10, disk_dir=disk_dir).set("a", "1")
+    restarted = ResponseCache(max_size=10, disk_dir=disk_dir)
+    assert restarted.get("a") == "1"
+    assert restarted.get_stats()["disk_hits"] == 1
+    # Promoted to memory on the first read
+    assert restarted.get("a") == "1"
+    assert restarted.get_stats()["hits"] == 1
+
+
+def test_unreadable_disk_entry_is_dropped(tmp_path):
+    cache = ResponseCache(max_size=0, disk_dir=str(tmp_path))
+    path = tmp_path / "a.json"
+    path.write_text("not json")
+    assert cache.get("a") is None
+    assert not os.path.exists(path)
+
+
+def test_clear(tmp_path):
+    cache = ResponseCache(max_size=10, disk_dir=str(tmp_path))
+    cache.set("a", "1")
+    cache.clear()
+    assert cache.get("a") is None
+    assert os.listdir(tmp_path) == []
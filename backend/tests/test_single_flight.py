@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from ai_toolkit.single_flight import SingleFlight
+
+
+def run_concurrently(group, key, fn, callers):
+    """Start callers that all reach group.do while the first call is still running"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(group.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "response"
+
+    threads, results, errors = run_concurrently(group, "key", fn, 5)
+    while group.get_stats()["coalesced"] < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert errors == []
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert {result for result, _ in results} == {"response"}
+    assert group.get_stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+
+def test_error_reaches_every_waiter():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ValueError("provider failed")
+
+    threads, results, errors = run_concurrently(group, "key", fn, 3)
+    while group.get_stats()["coalesced"] < 2:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == []
+    assert [str(e) for e in errors] == ["provider failed"] * 3
+
+
+def test_completed_calls_run_again():
+    group = SingleFlight()
+    assert group.do("key", lambda: 1) == (1, False)
+    assert group.do("key", lambda: 2) == (2, False)
+    with pytest.raises(KeyError):
+        group.do("key", lambda: {}["missing"])
+    assert group.get_stats() == {"in_flight": 0, "executions": 3, "coalesced": 0}
+
+
+def test_different_keys_do_not_wait():
+    group = SingleFlight()
+    inner = group.do("outer", lambda: group.do("inner", lambda: "done"))
+    assert inner == (("done", False), False)
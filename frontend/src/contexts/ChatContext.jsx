@@ -25,6 +25,7 @@ export const ChatProvider = ({ children }) => {
   const [lastLoadedChatId, setLastLoadedChatId] = useState(null);
   const [pendingMessageId, setPendingMessageId] = useState(null);
   const pollingRef = useRef(null);
+  const sendAbortRef = useRef(null);
 
   // Clear any active polling
   const clearPolling = () => {
@@ -275,8 +276,11 @@ export const ChatProvider = ({ children }) => {
     setSending(true);
     setIsTyping(true);
     
+    const controller = new AbortController();
+    sendAbortRef.current = controller;
+    
     try {
-      const result = await sendMessage(chatId, content);
+      const result = await sendMessage(chatId, content, { signal: controller.signal });
       
       console.log("Server response for message:", result);
       
@@ -322,6 +326,17 @@ export const ChatProvider = ({ children }) => {
       startPollingForResponse(chatId);
       
       return { error: 'Failed to send message' };
+    } finally {
+      if (sendAbortRef.current === controller) {
+        sendAbortRef.current = null;
+      }
+    }
+  };
+  
+  // Cancel the response currently being generated, if any
+  const cancelChatMessage = () => {
+    if (sendAbortRef.current) {
+      sendAbortRef.current.abort();
     }
   };
   
@@ -415,6 +430,7 @@ export const ChatProvider = ({ children }) => {
     createNewChat,
     removeChat,
     sendChatMessage,
+    cancelChatMessage,
     updateSystemMessage,
     updateChatTitle,
     updateChatModel,
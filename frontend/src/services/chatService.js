@@ -16,8 +16,43 @@ export const deleteChat = (chatId) => {
   return api.delete(`/chat/${chatId}`);
 };
 
-export const sendMessage = (chatId, content) => {
-  return api.post(`/chat/${chatId}/message`, { content });
+// Interval between status checks while a response is being generated
+const JOB_POLL_INTERVAL = 1000;
+
+// Give up on a response after this long and cancel its job
+const JOB_TIMEOUT = 10 * 60 * 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export const sendMessage = async (chatId, content, { signal, timeout = JOB_TIMEOUT } = {}) => {
+  // The server queues the response and returns a job right away, so slow models
+  // don't run into the request timeout; poll the job until it finishes, is
+  // cancelled through signal, or runs past the timeout
+  const { job } = await api.post(`/chat/${chatId}/message`, { content, async: true });
+  const deadline = Date.now() + timeout;
+
+  for (;;) {
+    await sleep(JOB_POLL_INTERVAL);
+    if ((signal && signal.aborted) || Date.now() >= deadline) {
+      const reason = signal && signal.aborted ? 'Response cancelled' : 'Response timed out';
+      await cancelMessage(job.id).catch((error) => console.error('Failed to cancel response:', error));
+      return { status: 'error', error: reason };
+    }
+
+    const result = await api.get(`/chat/jobs/${job.id}`);
+    const { status, error } = result.job;
+
+    if (status === 'succeeded') {
+      return { status: 'success', chat: result.chat };
+    }
+    if (status === 'failed' || status === 'cancelled') {
+      return { status: 'error', error: error || `Response ${status}`, chat: result.chat };
+    }
+  }
+};
+
+export const cancelMessage = (jobId) => {
+  return api.delete(`/chat/jobs/${jobId}`);
 };
 
 export const updateSystemMessage = (chatId, content) => {